@@ -0,0 +1,172 @@
+'''
+Batch position analysis for Onitama.
+
+Reads positions as a stream of JSON lines, from files or stdin, and searches them on a pool of worker
+processes with request_simple_search_bot_move. Each line describes a position in the layout Board uses:
+
+    {"turn": 0, "positions": [[2,0],[0,0],...,null,...], "cards": [4,2,11,15,9], "id": anything}
+
+turn is even when RED is to move, positions lists the ten pieces in Board.positions order with null for a
+captured piece, and cards the five DECK indices of RED's hand, BLUE's hand and the waiting card. id is optional
+and copied to the result. Results are written as JSON lines in input order, each as soon as it and every
+position before it are done:
+
+    {"line": 1, "id": ..., "move": "a1b2", "card": "tiger", "evaluation": 30, "depth": 6, "nodes": 51234}
+    {"line": 2, "error": "..."}         for a line that does not describe a position, or whose search failed
+
+With --multi-pv K, each result instead ranks the best K moves with exact scores and their principal variations,
+from request_multi_pv_analysis, and "move", "card" and "evaluation" are those of the first line:
+
+    {"line": 1, ..., "lines": [{"move": "a1b2", "card": "tiger", "evaluation": 30, "pv": ["a1b2:tiger", "e4d3:crab", ...]}, ...]}
+
+At most --max-pending positions are read ahead of the oldest unfinished one, so memory stays bounded however
+long the input is. A throughput report is written to stderr at the end, and every --report positions.
+
+Usage: python analyse.py [FILE ...] [--depth N | --move-time MS] [--multi-pv K] [--workers N] [--max-pending N] [--out FILE] [--report N]
+'''
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import main
+
+def _init_worker():
+    global _worker_tt
+    _worker_tt = main.TranspositionTable()
+
+def parse_position(line):
+    '''Returns (Board, id) for a line of JSON describing a position, or raises ValueError with the cause.'''
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ValueError("Could not parse line as JSON.")
+    if not isinstance(record, dict): raise ValueError("Line is not a JSON object.")
+
+    turn, positions, cards = record.get("turn"), record.get("positions"), record.get("cards")
+    if not isinstance(turn, int) or turn < 0: raise ValueError("turn must be a non-negative integer.")
+    if not isinstance(positions, list) or len(positions) != 10: raise ValueError("positions must list ten pieces.")
+    pieces = []
+    for piece in positions:
+        if piece is None: pieces.append(None)
+        elif isinstance(piece, list) and len(piece) == 2 and all(isinstance(x, int) and 0 <= x <= 4 for x in piece): pieces.append(tuple(piece))
+        else: raise ValueError("Each piece must be [x, y] on the board, or null when captured.")
+    if pieces[0] is None or pieces[5] is None: raise ValueError("Both masters must be on the board.")
+    occupied = [piece for piece in pieces if piece is not None]
+    if len(set(occupied)) != len(occupied): raise ValueError("Two pieces share a square.")
+    if not isinstance(cards, list) or len(cards) != 5 or len(set(cards)) != 5 or not all(isinstance(card, int) and 0 <= card < len(main.DECK) for card in cards):
+        raise ValueError("cards must be five different DECK indices.")
+
+    board = main.Board(turn, pieces, list(cards))
+    if board.is_won(): raise ValueError("Game is already won.")
+    return board, record.get("id")
+
+def move_str(move):
+    return "pass" if move[0] is None else main.move_notation(move)
+
+def analyse_position(board, depth, time_limit, multi_pv=None):
+    '''
+    Runs in a worker process. Returns the best (move, evaluation, depth) for board, the nodes searched, and given multi_pv,
+    the best multi_pv (move, evaluation, principal variation) lines.
+    '''
+    stats = main.SearchStats()
+    if multi_pv is None:
+        move, evaluation, depth = main.request_simple_search_bot_move(board, _worker_tt, depth, time_limit, stats=stats)
+        return (move, evaluation, depth), stats.total_nodes(), None
+    lines, depth = main.request_multi_pv_analysis(board, multi_pv, _worker_tt, depth, time_limit, stats=stats)
+    return (lines[0][0], lines[0][1], depth), stats.total_nodes(), lines
+
+def analyse_stream(lines, depth=None, time_limit=None, workers=None, max_pending=None, multi_pv=None):
+    '''
+    Yields a result dictionary per line of lines, in input order, searching positions on a pool of worker processes.
+    No more than max_pending lines are read ahead of the oldest result not yet yielded. Given multi_pv, each result
+    also ranks the best multi_pv moves.
+    '''
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 4*workers
+    pending = collections.deque() # (line number, id, future or error), in input order
+
+    def result(num, position_id, work):
+        if isinstance(work, str): return {"line": num, "error": work}
+        try:
+            (move, evaluation, depth), nodes, pv_lines = work.result()
+        except Exception as error: # A failed search, or a broken pool, loses this position but not the rest of the stream
+            return {"line": num, "error": str(error) or type(error).__name__}
+        result = {"line": num, "id": position_id, "move": move_str(move), "card": main.DECK[move[2]].name,
+                  "evaluation": evaluation, "depth": depth, "nodes": nodes}
+        if pv_lines is not None:
+            result["lines"] = [{"move": move_str(move), "card": main.DECK[move[2]].name, "evaluation": evaluation,
+                                "pv": [f"{move_str(pv_move)}:{main.DECK[pv_move[2]].name}" for pv_move in pv]}
+                               for move, evaluation, pv in pv_lines]
+        return result
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        for num, line in enumerate(lines, 1):
+            if not line.strip(): continue
+            try:
+                board, position_id = parse_position(line)
+            except ValueError as error:
+                pending.append((num, None, str(error)))
+            else:
+                try:
+                    future = pool.submit(analyse_position, board, depth, time_limit, multi_pv)
+                except BrokenProcessPool: # A worker died; the positions it had report errors, later ones go to a new pool
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+                    future = pool.submit(analyse_position, board, depth, time_limit, multi_pv)
+                pending.append((num, position_id, future))
+
+            # Hand back finished results, and wait for the oldest once max_pending are in flight
+            while pending and (len(pending) >= max_pending or isinstance(pending[0][2], str) or pending[0][2].done()):
+                yield result(*pending.popleft())
+
+        while pending: yield result(*pending.popleft())
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def report(positions, errors, nodes, seconds, out=sys.stderr):
+    print(f"{positions} positions, {errors} errors in {seconds:.1f} seconds: {positions/seconds:.1f} positions per second, "
+          f"{nodes/seconds:.0f} nodes per second", file=out, flush=True)
+
+def input_lines(paths):
+    '''Yields the lines of each file in turn, or of stdin when there are none.'''
+    if not paths: yield from sys.stdin
+    for path in paths:
+        with open(path) as in_file: yield from in_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama batch position analysis")
+    parser.add_argument("files", nargs="*", help="JSONL files of positions, stdin when none are given")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, default=None, help=f"search depth, default {main.DEPTH}")
+    limit.add_argument("--move-time", type=int, default=None, help="milliseconds per position instead of a fixed depth")
+    parser.add_argument("--multi-pv", type=int, default=None, help="rank the best K moves of each position, with exact scores and principal variations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-pending", type=int, default=None, help="positions read ahead of the oldest unfinished one, default four per worker")
+    parser.add_argument("--out", default=None, help="file to write results to, stdout by default")
+    parser.add_argument("--report", type=int, default=1000, help="report throughput every this many positions")
+    args = parser.parse_args()
+    if args.multi_pv is not None and args.multi_pv < 1: parser.error("--multi-pv must be at least 1")
+
+    out_file = open(args.out, "w") if args.out else sys.stdout
+    positions = errors = nodes = 0
+    start_time = time.time()
+    try:
+        for result in analyse_stream(input_lines(args.files), args.depth, args.move_time, args.workers, args.max_pending, args.multi_pv):
+            out_file.write(json.dumps(result) + "\n")
+            if "error" in result: errors += 1
+            else:
+                positions += 1
+                nodes += result["nodes"]
+            if (positions + errors) % args.report == 0:
+                out_file.flush()
+                report(positions, errors, nodes, time.time() - start_time)
+    finally:
+        out_file.flush()
+        if args.out: out_file.close()
+    report(positions, errors, nodes, time.time() - start_time)
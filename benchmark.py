@@ -0,0 +1,469 @@
+'''
+Search benchmark for Onitama.
+
+Runs request_simple_search_bot_move on a set of seeded positions and reports nodes, time and
+nodes per second for each board backend (backends), with and without a transposition table (tt),
+for make/unmake against copying the board at every node (makeunmake), for root-parallel
+search against the serial search (parallel), for Lazy SMP at 1/2/4/8/16 workers (smp), with and
+without batched NumPy frontier evaluation (batch), with killer moves and the history heuristic
+off, alone and together (ordering), or for iterative deepening with plain alpha-beta, principal
+variation search and aspiration windows (pvs), or for transposition table keys with and without
+mirror canonicalization (mirror), which also checks that mirror images search to the same scores.
+The check mode instead verifies that random make/unmake sequences restore positions exactly.
+
+The suite mode runs the standard position set below to fixed depths, records nodes, time, nodes per
+second and best move per position, and compares them against a stored baseline. It exits with status 1
+when node counts or evaluations differ from the baseline, or when throughput drops by more than the threshold.
+Throughput depends on the machine, so the suite also times a fixed pure-Python reference workload that does
+not touch the engine, and compares nodes per second relative to it: the baseline's ratio carries over to any
+machine. Refresh the baseline with --update-baseline, from one run, whenever search changes node counts.
+
+Usage: python benchmark.py [backends|tt|makeunmake|parallel|smp|batch|ordering|pvs|mirror|check] [--depth N] [--positions N] [--workers N]
+       python benchmark.py suite [--baseline FILE] [--update-baseline] [--threshold FRACTION]
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import main
+from bitboard import BitBoard
+
+# Standard positions: (name, depth, turn, positions, cards). Seeded random games from distinct card deals,
+# none with a winning move for the side to move
+SUITE = (
+    ("opening-1", 6, 2, [(2,0),(0,0),(1,0),(2,1),(4,0),(2,4),(0,4),(1,3),(3,4),(4,4)], [4,2,11,15,9]),
+    ("opening-2", 6, 2, [(2,0),(0,0),(1,0),(3,0),(4,0),(2,4),(0,4),(2,3),(3,4),(4,4)], [7,10,15,11,13]),
+    ("opening-3", 6, 2, [(2,0),(0,1),(1,0),(3,0),(4,0),(2,4),(0,4),(1,4),(3,4),(3,3)], [9,14,11,8,5]),
+    ("opening-4", 6, 3, [(2,0),(0,0),(1,1),(3,0),(4,0),(2,4),(0,4),(0,3),(3,4),(4,4)], [4,6,3,0,8]),
+    ("midgame-1", 7, 11, [(2,0),(3,3),(1,0),(3,0),(4,0),(2,4),(0,4),(1,3),(3,4),None], [14,5,11,3,2]),
+    ("midgame-2", 7, 15, [(4,2),None,(2,1),(4,1),None,(2,4),(1,1),(1,3),(4,3),None], [11,6,14,0,3]),
+    ("midgame-3", 7, 12, [(3,0),(0,0),None,(1,0),(4,0),(2,4),(3,1),(3,2),(4,3),(4,4)], [15,10,13,9,2]),
+    ("midgame-4", 7, 10, [(2,0),(4,3),(1,0),(3,0),(4,0),(0,3),(2,3),(2,4),None,(4,4)], [2,11,0,5,7]),
+    ("endgame-1", 9, 25, [(1,1),None,None,None,(3,1),(3,0),(0,4),None,(3,3),(2,0)], [3,5,0,14,7]),
+    ("endgame-2", 9, 31, [(3,2),(0,2),None,None,(4,1),(2,4),None,(0,3),None,None], [12,8,10,4,11]),
+    ("endgame-3", 9, 35, [(1,2),(0,0),(3,2),None,(0,4),(1,4),None,None,(3,1),None], [15,4,12,13,1]),
+    ("endgame-4", 9, 61, [(4,0),None,None,None,(4,3),(3,3),(0,3),None,None,None], [4,3,11,5,1]),
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+def move_str(move):
+    return f"{main.move_notation(move)}:{main.DECK[move[2]].name}"
+
+def run_suite():
+    '''Searches every SUITE position with a fresh transposition table and seeded tie-breaking, returns a record per position.'''
+    records = []
+    main.TABLEBASE = main.BOOK = None # Positions would otherwise be read from a local tablebase or opening book
+    for name, depth, turn, positions, cards in SUITE:
+        random.seed(0)
+        board = main.Board(turn, list(positions), list(cards))
+        stats = main.SearchStats()
+        start_time = time.perf_counter()
+        move, evaluation, depth = main.request_simple_search_bot_move(board, main.TranspositionTable(), depth, stats=stats)
+        seconds = time.perf_counter() - start_time
+        nodes = stats.total_nodes()
+        records.append({"name": name, "depth": depth, "nodes": nodes, "seconds": round(seconds, 4),
+                        "nps": round(nodes / seconds), "move": move_str(move), "evaluation": evaluation})
+        print(f"{name:>10} depth {depth}: {nodes:>8} nodes {seconds:>7.2f} s {nodes/seconds:>8.0f} n/s  best {move_str(move)} ({evaluation})")
+    return records
+
+REFERENCE_STEPS = 200000
+
+def reference_rate(runs=5):
+    '''Returns steps per second of a fixed pure-Python workload of integer arithmetic and dictionary stores, the best of runs timings.'''
+    best = None
+    for run in range(runs):
+        start_time = time.perf_counter()
+        total, table = 0, {}
+        for step in range(REFERENCE_STEPS):
+            total = (total*31 + step) & 0xFFFFFFFF
+            table[total & 1023] = step
+        seconds = time.perf_counter() - start_time
+        best = seconds if best is None else min(best, seconds)
+    return REFERENCE_STEPS / best
+
+def check_suite(records, reference, baseline, threshold):
+    '''
+    Returns a list of failures of records against baseline: changed node counts or evaluations, and total throughput
+    relative to the reference workload below threshold.
+    '''
+    failures = []
+    baseline_records = {record["name"]: record for record in baseline["positions"]}
+    for record in records:
+        expected = baseline_records.get(record["name"])
+        if expected is None: failures.append(f"{record['name']} is not in the baseline")
+        elif record["nodes"] != expected["nodes"]: failures.append(f"{record['name']} searched {record['nodes']} nodes, baseline {expected['nodes']}")
+        elif record["evaluation"] != expected["evaluation"]: failures.append(f"{record['name']} evaluated {record['evaluation']}, baseline {expected['evaluation']}")
+
+    nps = sum(record["nodes"] for record in records) / sum(record["seconds"] for record in records)
+    # Nodes per second the baseline's throughput corresponds to on this machine
+    expected = baseline["nps"] * reference / baseline["reference"]
+    print(f"\nTotal {nps:.0f} nodes per second, baseline {baseline['nps']:.0f}, {expected:.0f} scaled to this machine's "
+          f"reference workload ({nps/expected - 1:+.1%})")
+    if nps < expected * (1 - threshold): failures.append(f"throughput {nps:.0f} n/s is more than {threshold:.0%} below the scaled baseline {expected:.0f} n/s")
+    return failures
+
+def suite(baseline_path, update_baseline, threshold):
+    reference = reference_rate()
+    records = run_suite()
+    reference = max(reference, reference_rate()) # Timed before and after the suite, in case the machine was busy once
+    nps = sum(record["nodes"] for record in records) / sum(record["seconds"] for record in records)
+    if update_baseline or not os.path.exists(baseline_path):
+        with open(baseline_path, "w") as baseline_file:
+            json.dump({"nps": round(nps), "reference": round(reference), "positions": records}, baseline_file, indent=1)
+        print(f"\nBaseline written to {baseline_path}, {nps:.0f} nodes per second")
+        return
+    with open(baseline_path) as baseline_file:
+        failures = check_suite(records, reference, json.load(baseline_file), threshold)
+    for failure in failures: print(f"FAIL: {failure}")
+    if failures: sys.exit(1)
+    print("Suite matches baseline")
+
+def has_winning_move(board):
+    for move in board.possible_moves():
+        simulation_board = board.copy()
+        simulation_board.execute_move(move)
+        if simulation_board.is_won(): return True
+    return False
+
+def benchmark_positions(count, plies=6, seed=0):
+    '''Returns count Boards without an immediate win, reached by playing plies seeded random moves from seeded card deals.'''
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = main.Board(0, list(main.INITIAL_POSITIONS), rng.sample(range(len(main.DECK)), 5))
+        for ply in range(plies):
+            board.execute_move(rng.choice(board.possible_moves()))
+            if board.is_won(): break
+        if not board.is_won() and not has_winning_move(board): boards.append(board)
+    return boards
+
+def run_search(board, depth, tt=None, workers=None):
+    '''Searches board to depth, returns (evaluation, nodes, seconds).'''
+    stats = main.SearchStats()
+    start_time = time.perf_counter()
+    move, evaluation, depth = main.request_simple_search_bot_move(board.copy(), tt, depth, workers=workers, stats=stats)
+    return evaluation, stats.total_nodes(), time.perf_counter() - start_time
+
+def compare_backends(boards, depth):
+    '''Prints nodes per second for Board and BitBoard on each position, checking they agree on evaluation.'''
+    totals = {"Board": [0, 0.0], "BitBoard": [0, 0.0]}
+    for num, board in enumerate(boards):
+        line = f"position {num:>2}"
+        evaluations = set()
+        for name, backend in (("Board", board), ("BitBoard", BitBoard.from_board(board))):
+            evaluation, nodes, seconds = run_search(backend, depth)
+            evaluations.add(evaluation)
+            totals[name][0] += nodes
+            totals[name][1] += seconds
+            line += f" | {name} {nodes:>8} nodes {nodes/seconds:>9.0f} n/s"
+        if len(evaluations) != 1: line += f" | MISMATCH {evaluations}"
+        print(line)
+
+    print()
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>8}: {nodes} nodes in {seconds:.2f} seconds, {nodes/seconds:.0f} nodes per second")
+    print(f"BitBoard speedup: {(totals['BitBoard'][0]/totals['BitBoard'][1]) / (totals['Board'][0]/totals['Board'][1]):.2f}x")
+
+def compare_tt(boards, depth):
+    '''Prints nodes and time with and without a fresh transposition table on each position, checking they agree on evaluation.'''
+    totals = {"no tt": [0, 0.0], "tt": [0, 0.0]}
+    probes = hits = 0
+    for num, board in enumerate(boards):
+        tt = main.TranspositionTable()
+        line = f"position {num:>2}"
+        evaluations = set()
+        for name, table in (("no tt", None), ("tt", tt)):
+            evaluation, nodes, seconds = run_search(board, depth, table)
+            evaluations.add(evaluation)
+            totals[name][0] += nodes
+            totals[name][1] += seconds
+            line += f" | {name} {nodes:>8} nodes {seconds:>6.2f} s"
+        probes += tt.probes
+        hits += tt.hits
+        line += f" | hit rate {tt.hit_rate():.1%}"
+        if len(evaluations) != 1: line += f" | MISMATCH {evaluations}"
+        print(line)
+
+    print()
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>5}: {nodes} nodes in {seconds:.2f} seconds, {nodes/seconds:.0f} nodes per second")
+    print(f"Transposition table hit rate {hits/probes:.1%}, node reduction {1 - totals['tt'][0]/totals['no tt'][0]:.1%}, time speedup {totals['no tt'][1]/totals['tt'][1]:.2f}x")
+
+def copy_search(board, depth, alpha, beta, counter):
+    '''recursive_search as it was before make/unmake, copying the board at every node. counter[0] counts nodes.'''
+    possible_moves = board.possible_moves_search_optimised()
+
+    if board.turn_colour_num() == 0:
+        eval_to_beat = -1000
+        for move in possible_moves:
+            simulation_board = board.copy()
+            simulation_board.execute_move(move)
+            counter[0] += 1
+            result = simulation_board.evaluate_position() if (depth <= 1 or simulation_board.is_won()) else copy_search(simulation_board, depth-1, alpha, beta, counter)
+            eval_to_beat = max(eval_to_beat, result)
+            if eval_to_beat >= beta: break
+            alpha = max(alpha, eval_to_beat)
+
+    else:
+        eval_to_beat = 1000
+        for move in possible_moves:
+            simulation_board = board.copy()
+            simulation_board.execute_move(move)
+            counter[0] += 1
+            result = simulation_board.evaluate_position() if (depth <= 1 or simulation_board.is_won()) else copy_search(simulation_board, depth-1, alpha, beta, counter)
+            eval_to_beat = min(eval_to_beat, result)
+            if eval_to_beat <= alpha: break
+            beta = min(beta, eval_to_beat)
+
+    return eval_to_beat
+
+def make_unmake_search(board, depth, alpha, beta, counter):
+    '''Runs recursive_search without a transposition table. counter[0] counts nodes.'''
+    stats = main.SearchStats()
+    evaluation = main.recursive_search(board.copy(), depth, alpha, beta, stats=stats)
+    counter[0] += stats.total_nodes()
+    return evaluation
+
+def measure(search, boards, depth):
+    '''Returns (evaluations, nodes, seconds, Board copies, peak traced bytes) for search over boards.'''
+    counter = [0]
+    start_time = time.perf_counter()
+    evaluations = [search(board.copy(), depth, -1000, 1000, counter) for board in boards]
+    seconds = time.perf_counter() - start_time
+
+    # Copies and peak memory are measured in a second, instrumented run since instrumentation slows the search down
+    copies = [0]
+    board_copy = main.Board.copy
+    def counting_copy(board):
+        copies[0] += 1
+        return board_copy(board)
+    main.Board.copy = counting_copy
+    tracemalloc.start()
+    try:
+        for board in boards: search(board, depth, -1000, 1000, [0])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        main.Board.copy = board_copy
+    return evaluations, counter[0], seconds, copies[0], peak
+
+def compare_make_unmake(boards, depth):
+    '''Prints nodes per second and allocation figures for copy-per-node search against make/unmake search.'''
+    results = {}
+    for name, search in (("copy", copy_search), ("make/unmake", make_unmake_search)):
+        evaluations, nodes, seconds, copies, peak = measure(search, boards, depth)
+        results[name] = evaluations
+        print(f"{name:>11}: {nodes} nodes in {seconds:.2f} seconds, {nodes/seconds:.0f} nodes per second, "
+              f"{copies} Board copies, {peak/1024:.0f} KiB peak traced memory")
+    print("Evaluations agree" if results["copy"] == results["make/unmake"] else "MISMATCH in evaluations")
+
+def compare_parallel(boards, depth, workers):
+    '''Prints time and nodes for the serial and root-parallel searches on each position, checking they agree on evaluation.'''
+    main.get_search_pool(workers).submit(int).result() # Start the pool outside the timings
+    totals = {"serial": [0, 0.0], "parallel": [0, 0.0]}
+    for num, board in enumerate(boards):
+        line = f"position {num:>2}"
+        evaluations = set()
+        for name, pool_workers in (("serial", None), ("parallel", workers)):
+            evaluation, nodes, seconds = run_search(board, depth, workers=pool_workers)
+            evaluations.add(evaluation)
+            totals[name][0] += nodes
+            totals[name][1] += seconds
+            line += f" | {name} {nodes:>8} nodes {seconds:>6.2f} s"
+        if len(evaluations) != 1: line += f" | MISMATCH {evaluations}"
+        print(line)
+    main.shutdown_search_pool()
+
+    print()
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>8}: {nodes} nodes in {seconds:.2f} seconds, {nodes/seconds:.0f} nodes per second")
+    print(f"Speedup with {workers} workers: {totals['serial'][1]/totals['parallel'][1]:.2f}x")
+
+def smp_scaling(boards, depth, worker_counts=(1, 2, 4, 8, 16)):
+    '''Prints the Lazy SMP scaling curve: time to complete depth over all positions, nodes per second and speedup against one worker.'''
+    baseline = None
+    for workers in worker_counts:
+        main.get_smp_pool(workers).submit(int).result() # Start the pool outside the timings
+        nodes = 0
+        seconds = 0.0
+        for board in boards:
+            main._smp_tt.clear()
+            stats = main.SearchStats()
+            start_time = time.perf_counter()
+            main.request_lazy_smp_bot_move(board, depth, workers=workers, stats=stats)
+            seconds += time.perf_counter() - start_time
+            nodes += stats.total_nodes()
+        main.shutdown_smp_pool()
+        baseline = baseline or seconds
+        print(f"{workers:>2} workers: depth {depth} in {seconds:.2f} seconds, {nodes} nodes, {nodes/seconds:.0f} nodes per second, speedup {baseline/seconds:.2f}x")
+
+def compare_batch(boards, depth, samples=20000, seed=0):
+    '''Checks evaluate_positions against evaluate_position on random positions, then times search with and without BATCH_LEAF_EVAL.'''
+    rng = random.Random(seed)
+    rows = []
+    expected = []
+    while len(rows) < samples:
+        board = main.Board(rng.randint(0,1), list(main.INITIAL_POSITIONS), rng.sample(range(len(main.DECK)), 5))
+        while len(rows) < samples:
+            rows.append(board.batch_row())
+            expected.append(board.evaluate_position())
+            if board.is_won(): break
+            board.make_move(rng.choice(board.possible_moves()))
+    scores = main.evaluate_positions(rows).tolist()
+    mismatches = sum(score != evaluation for score, evaluation in zip(scores, expected))
+    print(f"evaluate_positions matched evaluate_position on {samples - mismatches} of {samples} positions")
+
+    totals = {}
+    results = {}
+    for name, batch in (("single", False), ("batched", True)):
+        main.BATCH_LEAF_EVAL = batch
+        try: runs = [run_search(board, depth) for board in boards]
+        finally: main.BATCH_LEAF_EVAL = False
+        results[name] = [evaluation for evaluation, nodes, seconds in runs]
+        totals[name] = (sum(nodes for evaluation, nodes, seconds in runs), sum(seconds for evaluation, nodes, seconds in runs))
+        print(f"{name:>7}: {totals[name][0]} nodes in {totals[name][1]:.2f} seconds, {totals[name][0]/totals[name][1]:.0f} nodes per second")
+    print("Evaluations agree" if results["single"] == results["batched"] else f"MISMATCH in evaluations {results}")
+    print(f"Batched speedup: {totals['single'][1]/totals['batched'][1]:.2f}x")
+
+def compare_ordering(boards, depth):
+    '''Prints nodes and time with killer moves and the history heuristic off, each alone and both on, checking evaluations agree.'''
+    configurations = (("neither", False, False), ("killers", True, False), ("history", False, True), ("both", True, True))
+    totals = {}
+    results = {}
+    try:
+        for name, killers, history in configurations:
+            main.KILLER_MOVES, main.HISTORY_HEURISTIC = killers, history
+            runs = [run_search(board, depth, main.TranspositionTable()) for board in boards]
+            results[name] = [evaluation for evaluation, nodes, seconds in runs]
+            totals[name] = (sum(nodes for evaluation, nodes, seconds in runs), sum(seconds for evaluation, nodes, seconds in runs))
+    finally:
+        main.KILLER_MOVES, main.HISTORY_HEURISTIC = True, True
+
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>8}: {nodes} nodes in {seconds:.2f} seconds, {nodes/totals['neither'][0] - 1:+.1%} nodes, {seconds/totals['neither'][1] - 1:+.1%} time")
+    mismatches = [name for name in results if results[name] != results["neither"]]
+    print("Evaluations agree" if not mismatches else f"MISMATCH in evaluations for {', '.join(mismatches)}")
+
+def compare_pvs(boards, depth):
+    '''
+    Prints nodes and time for iterative deepening to depth with plain alpha-beta, principal variation search, and
+    principal variation search with aspiration windows, checking every configuration finds the same best-move score.
+    '''
+    configurations = (("alpha-beta", False, None), ("pvs", True, None), ("pvs+aspiration", True, main.ASPIRATION_WINDOW))
+    totals = {}
+    results = {}
+    try:
+        for name, pvs, window in configurations:
+            main.PRINCIPAL_VARIATION_SEARCH, main.ASPIRATION_WINDOW = pvs, window
+            nodes = 0
+            start_time = time.perf_counter()
+            results[name] = []
+            for board in boards:
+                random.seed(0)
+                stats = main.SearchStats()
+                move, evaluation, completed_depth = main.request_simple_search_bot_move(board.copy(), main.TranspositionTable(), depth, 10**9, stats=stats)
+                results[name].append(evaluation)
+                nodes += stats.total_nodes()
+            totals[name] = (nodes, time.perf_counter() - start_time)
+    finally:
+        main.PRINCIPAL_VARIATION_SEARCH, main.ASPIRATION_WINDOW = configurations[-1][1:]
+
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>14}: {nodes} nodes in {seconds:.2f} seconds, {nodes/totals['alpha-beta'][0] - 1:+.1%} nodes, {seconds/totals['alpha-beta'][1] - 1:+.1%} time")
+    mismatches = [name for name in results if results[name] != results["alpha-beta"]]
+    print("Best-move scores agree" if not mismatches else f"MISMATCH in best-move scores for {', '.join(mismatches)}")
+
+def compare_mirror(boards, depth):
+    '''
+    Checks that every position and its mirror image share a canonical key and get the same search score, with and without
+    the transposition table, then prints nodes and time for iterative deepening to depth with MIRROR_TT off and on.
+    '''
+    failures = []
+    for num, board in enumerate(boards):
+        mirror = board.mirror()
+        if board.canonical()[0] != mirror.canonical()[0]: failures.append(f"position {num} and its mirror image have different canonical keys")
+        for tt in (None, main.TranspositionTable()):
+            scores = [main.recursive_search(position.copy(), depth, -1000, 1000, tt) for position in (board, mirror)]
+            if scores[0] != scores[1]: failures.append(f"position {num} scores {scores[0]}, its mirror image {scores[1]}{'' if tt is None else ' with a shared table'}")
+        mirror_bitboard = BitBoard.from_board(board).mirror()
+        if main.TABLEBASE is not None and main.TABLEBASE.probe(board) != main.TABLEBASE.probe(mirror_bitboard):
+            failures.append(f"position {num} and its mirror image probe differently in the tablebase")
+
+    mirror_tt = main.MIRROR_TT
+    totals = {}
+    results = {}
+    try:
+        for name, setting in (("zobrist keys", False), ("canonical keys", True)):
+            main.MIRROR_TT = setting
+            nodes = 0
+            start_time = time.perf_counter()
+            results[name] = []
+            for board in boards:
+                random.seed(0)
+                stats = main.SearchStats()
+                move, evaluation, completed_depth = main.request_simple_search_bot_move(board.copy(), main.TranspositionTable(), depth, 10**9, stats=stats)
+                results[name].append(evaluation)
+                nodes += stats.total_nodes()
+            totals[name] = (nodes, time.perf_counter() - start_time)
+    finally:
+        main.MIRROR_TT = mirror_tt
+
+    for name, (nodes, seconds) in totals.items():
+        print(f"{name:>14}: {nodes} nodes in {seconds:.2f} seconds, {nodes/totals['zobrist keys'][0] - 1:+.1%} nodes, {seconds/totals['zobrist keys'][1] - 1:+.1%} time")
+    if results["zobrist keys"] != results["canonical keys"]: failures.append("best-move scores differ between zobrist and canonical keys")
+    for failure in failures: print(f"FAIL: {failure}")
+    print(f"Mirror images of {len(boards)} positions agree" if not failures else f"{len(failures)} failures")
+
+def snapshot(board):
+    if isinstance(board, BitBoard): return (board.turn, tuple(board.pieces), tuple(board.cards), board.zobrist, board.mirror_zobrist)
+    return (board.turn, tuple(board.positions), tuple(board.cards), board.zobrist, board.mirror_zobrist, board.material, board.centre,
+            tuple(board.student_counts))
+
+def check_make_unmake(games=500, seed=0):
+    '''Plays random games with make_move on Board and BitBoard, then unmakes every move, checking each position is restored exactly.'''
+    rng = random.Random(seed)
+    for game in range(games):
+        board = main.Board(rng.randint(0,1), list(main.INITIAL_POSITIONS), rng.sample(range(len(main.DECK)), 5))
+        for backend in (board, BitBoard.from_board(board)):
+            history = []
+            while not backend.is_won() and len(history) < 200:
+                move = rng.choice(backend.possible_moves())
+                history.append((move, snapshot(backend), backend.make_move(move)))
+                assert backend.zobrist == backend.compute_zobrist(), "incremental Zobrist key diverged"
+                assert backend.mirror_zobrist == backend.compute_zobrist(True) == backend.mirror().compute_zobrist(), "incremental mirror Zobrist key diverged"
+                if isinstance(backend, BitBoard): assert backend.zobrist == backend.to_board().zobrist, "BitBoard and Board Zobrist keys differ"
+            for move, before, undo in reversed(history):
+                backend.unmake_move(move, undo)
+                assert snapshot(backend) == before, f"{type(backend).__name__} not restored after unmaking {move}"
+    print(f"make/unmake round-tripped {games} random games on Board and BitBoard")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama search benchmark")
+    parser.add_argument("mode", nargs="?", choices=("backends", "tt", "makeunmake", "parallel", "smp", "batch", "ordering", "pvs", "mirror", "check", "suite"), default="backends")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--positions", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed fractional drop in nodes per second, relative to the reference workload")
+    args = parser.parse_args()
+    if args.mode == "check":
+        check_make_unmake()
+    elif args.mode == "suite":
+        suite(args.baseline, args.update_baseline, args.threshold)
+    else:
+        boards = benchmark_positions(args.positions)
+        if args.mode == "backends": compare_backends(boards, args.depth)
+        elif args.mode == "tt": compare_tt(boards, args.depth)
+        elif args.mode == "makeunmake": compare_make_unmake(boards, args.depth)
+        elif args.mode == "parallel": compare_parallel(boards, args.depth, args.workers)
+        elif args.mode == "smp": smp_scaling(boards, args.depth)
+        elif args.mode == "batch": compare_batch(boards, args.depth)
+        elif args.mode == "ordering": compare_ordering(boards, args.depth)
+        elif args.mode == "pvs": compare_pvs(boards, args.depth)
+        else: compare_mirror(boards, args.depth)
@@ -0,0 +1,310 @@
+from main import (DECK, INITIAL_POSITIONS, CENTER_PRIORITY, STUDENT_VALUE, OPENING_MASTER_POSITIONAL_VALUE,
+                  MIDGAME_MASTER_POSITIONAL_VALUE, ENDGAME_MASTER_POSITIONAL_VALUE, MIRROR_CARD, MIRROR_SQUARE, CARD_GROUP,
+                  ZOBRIST_PIECES, ZOBRIST_CARDS, ZOBRIST_MIRROR_PIECES, ZOBRIST_MIRROR_CARDS, ZOBRIST_BLUE_TO_MOVE, Board,
+                  coords_to_square, square_to_coords)
+
+# Indices into BitBoard.pieces
+RED_STUDENTS, RED_MASTER, BLUE_STUDENTS, BLUE_MASTER = range(4)
+
+# Zobrist piece type of each index into BitBoard.pieces, as main.PIECE_TYPE gives for Board.positions
+PIECE_TYPE = (1, 0, 3, 2)
+
+# Squares the masters must reach to win by way of the stream
+RED_TEMPLE = 1 << coords_to_square((2,4))
+BLUE_TEMPLE = 1 << coords_to_square((2,0))
+
+def build_destination_table():
+    '''
+    Returns DESTINATIONS[card][side][square], the mask of squares a piece on square can move to using card.
+    Side 0 is RED, side 1 is BLUE. Masks ignore the pieces on the board.
+    '''
+    table = []
+    for card in DECK:
+        sides = []
+        for mul in (1, -1):
+            masks = []
+            for square in range(25):
+                x, y = square_to_coords(square)
+                mask = 0
+                for card_move in card.card_moves:
+                    destination = (x - mul*card_move[0], mul*card_move[1] + y)
+                    if destination[0] < 0 or destination[0] > 4: continue
+                    if destination[1] < 0 or destination[1] > 4: continue
+                    mask |= 1 << coords_to_square(destination)
+                masks.append(mask)
+            sides.append(tuple(masks))
+        table.append(tuple(sides))
+    return tuple(table)
+
+DESTINATIONS = build_destination_table()
+
+# Per-square lookups of the evaluation tables, built once at import
+STUDENT_SQUARE_VALUE = tuple(CENTER_PRIORITY[x][y] + STUDENT_VALUE for x, y in map(square_to_coords, range(25)))
+MASTER_SQUARE_VALUE = {
+    stage: (
+        tuple(table[x][y] for x, y in map(square_to_coords, range(25))),
+        tuple(table[4-x][4-y] for x, y in map(square_to_coords, range(25)))
+    )
+    for stage, table in (("OPENING", OPENING_MASTER_POSITIONAL_VALUE),
+                         ("MIDGAME", MIDGAME_MASTER_POSITIONAL_VALUE),
+                         ("ENDGAME", ENDGAME_MASTER_POSITIONAL_VALUE))
+}
+
+def squares(mask):
+    '''Yields the square index of every set bit in mask, lowest first.'''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def mirror_mask(mask):
+    '''Returns mask reflected left to right, as Board.mirror reflects positions.'''
+    mirrored = 0
+    for square in squares(mask): mirrored |= 1 << MIRROR_SQUARE[square]
+    return mirrored
+
+def move_to_coords(move):
+    '''Converts a (square, square, card) bitboard move to the (coords, coords, card) moves used by Board.'''
+    if move[0] is None: return move # Passes are (None, None, card) in both
+    return (square_to_coords(move[0]), square_to_coords(move[1]), move[2])
+
+def move_from_coords(move):
+    '''Converts a (coords, coords, card) Board move to a (square, square, card) bitboard move.'''
+    if move[0] is None: return move
+    return (coords_to_square(move[0]), coords_to_square(move[1]), move[2])
+
+class BitBoard:
+    '''
+    BitBoard class represents a board state in Onitama using one 25-bit mask per piece type.
+    It offers the search interface of Board, so recursive_search and request_simple_search_bot_move run on either.
+    Its zobrist and mirror_zobrist keys are kept by make_move as Board's are, and equal Board's for the same position.
+    Moves are (square, square, card) tuples; use move_to_coords and move_from_coords at the boundary.
+
+    Methods:
+        from_board(board)               - Returns the BitBoard equivalent of a Board
+        to_board()                      - Returns the Board equivalent of the BitBoard, students in square order
+        turn_colour()                   - Returns 'RED' or 'BLUE' depending on player turn
+        turn_colour_num()               - Returns 0 or 1 depending on player turn
+        copy()                          - Returns a duplicate of the board
+        mirror()                        - Returns the mirror image of the board, which has the same value
+        canonical()                     - Returns (key, mirrored): the smaller of the board's and its mirror image's keys,
+                                          and whether it is the mirror image's
+        compute_zobrist(mirror=False)   - Returns the Zobrist key of the board, or of its mirror image, computed from scratch
+        execute_move(move)              - Updates the board object by executing a given move
+        make_move(move)                 - Executes a move in place and returns an undo record
+        unmake_move(move, undo)         - Restores the position before make_move, given its undo record
+        is_capture(move)                - Returns True if a move captures a piece
+        is_won()                        - Returns None if game is not won, else returns win type
+        game_stage()                    - Returns 'OPENING', 'MIDGAME', or 'ENDGAME' depending on game stage
+        possible_moves()                - Returns list of possible moves
+        possible_moves_search_optimised() - Returns list of possible moves ordered for alpha beta pruning
+        evaluate_position()             - Returns minimax-style position evaluation
+    '''
+
+    __slots__ = ('turn', 'pieces', 'cards', 'zobrist', 'mirror_zobrist')
+
+    def __init__(self, turn, pieces, cards, zobrist=None, mirror_zobrist=None):
+        self.turn = turn
+        self.pieces = pieces # [red students, red master, blue students, blue master] masks
+        self.cards = cards
+        self.zobrist = self.compute_zobrist() if zobrist is None else zobrist
+        self.mirror_zobrist = self.compute_zobrist(True) if mirror_zobrist is None else mirror_zobrist
+
+    @classmethod
+    def from_board(cls, board):
+        pieces = [0, 0, 0, 0]
+        for num, piece in enumerate(board.positions):
+            if piece is None: continue
+            if num == 0: pieces[RED_MASTER] = 1 << coords_to_square(piece)
+            elif num <= 4: pieces[RED_STUDENTS] |= 1 << coords_to_square(piece)
+            elif num == 5: pieces[BLUE_MASTER] = 1 << coords_to_square(piece)
+            else: pieces[BLUE_STUDENTS] |= 1 << coords_to_square(piece)
+        return cls(board.turn, pieces, list(board.cards), board.zobrist, board.mirror_zobrist)
+
+    def to_board(self):
+        positions = []
+        for master, students in ((RED_MASTER, RED_STUDENTS), (BLUE_MASTER, BLUE_STUDENTS)):
+            positions.append(square_to_coords(self.pieces[master].bit_length() - 1) if self.pieces[master] else None)
+            student_positions = [square_to_coords(square) for square in squares(self.pieces[students])]
+            positions.extend(student_positions + [None]*(4-len(student_positions)))
+        return Board(self.turn, positions, list(self.cards))
+
+    def turn_colour(self):
+        return "RED" if self.turn % 2 == 0 else "BLUE"
+
+    def turn_colour_num(self):
+        return self.turn % 2
+
+    def copy(self):
+        return BitBoard(self.turn, list(self.pieces), list(self.cards), self.zobrist, self.mirror_zobrist)
+
+    def mirror(self):
+        return BitBoard(self.turn, [mirror_mask(mask) for mask in self.pieces], [MIRROR_CARD[card] for card in self.cards],
+                        self.mirror_zobrist, self.zobrist)
+
+    def canonical(self):
+        if self.mirror_zobrist < self.zobrist: return self.mirror_zobrist, True
+        return self.zobrist, False
+
+    def compute_zobrist(self, mirror=False):
+        pieces, cards = (ZOBRIST_MIRROR_PIECES, ZOBRIST_MIRROR_CARDS) if mirror else (ZOBRIST_PIECES, ZOBRIST_CARDS)
+        zobrist = ZOBRIST_BLUE_TO_MOVE if self.turn % 2 else 0
+        for num, mask in enumerate(self.pieces):
+            for square in squares(mask): zobrist ^= pieces[PIECE_TYPE[num]][square]
+        for slot, card in enumerate(self.cards):
+            zobrist ^= cards[CARD_GROUP[slot]][card]
+        return zobrist
+
+    # Updates the board state by executing a move
+    def execute_move(self, move):
+        self.make_move(move)
+
+    # Executes a move in place, returns the record unmake_move needs to restore the position:
+    # (index into pieces of the captured piece or None, card slot swapped, Zobrist key, mirror Zobrist key)
+    def make_move(self, move):
+        pieces = self.pieces
+        side = 2*(self.turn % 2) # Index of the mover's students, their master follows
+        enemy = 2 - side
+
+        self.turn += 1
+        undo_keys = (self.zobrist, self.mirror_zobrist)
+        zobrist = self.zobrist ^ ZOBRIST_BLUE_TO_MOVE
+        mirror_zobrist = self.mirror_zobrist ^ ZOBRIST_BLUE_TO_MOVE
+
+        # Swaps used card with waiting card
+        slot = self.cards.index(move[2])
+        group = ZOBRIST_CARDS[CARD_GROUP[slot]]
+        zobrist ^= group[move[2]] ^ group[self.cards[4]] ^ ZOBRIST_CARDS[2][move[2]] ^ ZOBRIST_CARDS[2][self.cards[4]]
+        group = ZOBRIST_MIRROR_CARDS[CARD_GROUP[slot]]
+        mirror_zobrist ^= group[move[2]] ^ group[self.cards[4]] ^ ZOBRIST_MIRROR_CARDS[2][move[2]] ^ ZOBRIST_MIRROR_CARDS[2][self.cards[4]]
+        self.cards[slot] = self.cards[4]
+        self.cards[4] = move[2]
+
+        # A pass only exchanges the card
+        if move[0] is None:
+            self.zobrist, self.mirror_zobrist = zobrist, mirror_zobrist
+            return (None, slot) + undo_keys
+
+        from_bit = 1 << move[0]
+        to_bit = 1 << move[1]
+
+        # Captures enemy piece, if it exists
+        if pieces[enemy] & to_bit:
+            pieces[enemy] ^= to_bit
+            captured = enemy
+        elif pieces[enemy+1] == to_bit:
+            pieces[enemy+1] = 0
+            captured = enemy + 1
+        else: captured = None
+        if captured is not None:
+            zobrist ^= ZOBRIST_PIECES[PIECE_TYPE[captured]][move[1]]
+            mirror_zobrist ^= ZOBRIST_MIRROR_PIECES[PIECE_TYPE[captured]][move[1]]
+
+        # Updates piece's position
+        moved = side + 1 if pieces[side+1] == from_bit else side
+        if moved == side: pieces[side] ^= from_bit | to_bit
+        else: pieces[side+1] = to_bit
+        piece_keys = ZOBRIST_PIECES[PIECE_TYPE[moved]]
+        self.zobrist = zobrist ^ piece_keys[move[0]] ^ piece_keys[move[1]]
+        piece_keys = ZOBRIST_MIRROR_PIECES[PIECE_TYPE[moved]]
+        self.mirror_zobrist = mirror_zobrist ^ piece_keys[move[0]] ^ piece_keys[move[1]]
+
+        return (captured, slot) + undo_keys
+
+    # Reverses make_move, given the move and the record it returned
+    def unmake_move(self, move, undo):
+        pieces = self.pieces
+        captured, slot, self.zobrist, self.mirror_zobrist = undo
+        self.turn -= 1
+        self.cards[4] = self.cards[slot]
+        self.cards[slot] = move[2]
+        if move[0] is None: return
+
+        side = 2*(self.turn % 2)
+        from_bit = 1 << move[0]
+        to_bit = 1 << move[1]
+        if pieces[side+1] == to_bit: pieces[side+1] = from_bit
+        else: pieces[side] ^= from_bit | to_bit
+        if captured is not None: pieces[captured] |= to_bit
+
+    # Returns True if a move captures a piece
+    def is_capture(self, move):
+        if move[1] is None: return False
+        enemy = 2 - 2*(self.turn % 2)
+        return bool((self.pieces[enemy] | self.pieces[enemy+1]) >> move[1] & 1)
+
+    # Returns type of victory attained in a given board state, None if the game is not won.
+    def is_won(self):
+        if self.pieces[RED_MASTER] == RED_TEMPLE: return ("RED", "STREAM")
+        elif self.pieces[BLUE_MASTER] == BLUE_TEMPLE: return ("BLUE", "STREAM")
+        elif not self.pieces[RED_MASTER]: return ("BLUE", "STONE")
+        elif not self.pieces[BLUE_MASTER]: return ("RED", "STONE")
+        else: return None
+
+    # Returns subjective game stage evaluation
+    def game_stage(self):
+        min_students = min(self.pieces[RED_STUDENTS].bit_count(), self.pieces[BLUE_STUDENTS].bit_count())
+        if min_students >= 4: return "OPENING"
+        elif min_students >= 2: return "MIDGAME"
+        else: return "ENDGAME"
+
+    # Returns a list of legal moves given a position.
+    def possible_moves(self):
+        side = self.turn % 2
+        own = self.pieces[2*side] | self.pieces[2*side+1]
+        possible_moves = []
+        for square in squares(own):
+            for card in self.cards[2*side:2*side+2]:
+                for destination in squares(DESTINATIONS[card][side][square] & ~own):
+                    possible_moves.append((square, destination, card))
+
+        # No piece can move: the player passes, exchanging one of their cards without moving
+        if possible_moves == []: return [(None, None, card) for card in self.cards[2*side:2*side+2]]
+
+        return possible_moves
+
+    # Returns a list of legal moves given a position, orders moves in a manner beneficial for alpha beta pruning
+    def possible_moves_search_optimised(self):
+        pieces = self.pieces
+        side = self.turn % 2
+        own = pieces[2*side] | pieces[2*side+1]
+        enemy_students = pieces[2-2*side]
+        enemy_master = pieces[3-2*side]
+        cards = self.cards[2*side:2*side+2]
+        captures = []
+        other_moves = []
+
+        for square in squares(own):
+            for card in cards:
+                targets = DESTINATIONS[card][side][square] & ~own
+                if targets & enemy_master: return [(square, enemy_master.bit_length() - 1, card)]
+                for destination in squares(targets & enemy_students): captures.append((square, destination, card))
+                for destination in squares(targets & ~enemy_students): other_moves.append((square, destination, card))
+
+        possible_moves = captures + other_moves
+
+        # No piece can move: the player passes, exchanging one of their cards without moving
+        if possible_moves == []: return [(None, None, card) for card in self.cards[2*side:2*side+2]]
+
+        return possible_moves
+
+    # A simple evaluation function. A positive score favours RED, a negative score favours BLUE
+    def evaluate_position(self):
+        red_students, red_master, blue_students, blue_master = self.pieces
+
+        # Return large evaluation for won positions
+        if red_master == RED_TEMPLE or not blue_master: return 1000
+        if blue_master == BLUE_TEMPLE or not red_master: return -1000
+
+        score = 0
+
+        # Prioritise the center and add piece values for students
+        for square in squares(red_students): score += STUDENT_SQUARE_VALUE[square]
+        for square in squares(blue_students): score -= STUDENT_SQUARE_VALUE[square]
+
+        # Evaluate master positioning
+        red_table, blue_table = MASTER_SQUARE_VALUE[self.game_stage()]
+        score += red_table[red_master.bit_length() - 1]
+        score -= blue_table[blue_master.bit_length() - 1]
+
+        return score
@@ -0,0 +1,105 @@
+'''
+Opening book builder for Onitama.
+
+Searches every position within the first N plies of the game for each card deal, from INITIAL_POSITIONS
+with either side to move first, on a pool of worker processes. Every root move is searched with the full
+window, and all moves tied for the best score are stored so the engine keeps its random tie-breaking.
+A position and its mirror image share entries, and starting deals that are mirror images of others are skipped.
+Entries are sorted by key and written to a file that main.OpeningBook bisects through mmap
+(see its docstring for the layout).
+
+There are 4368 card sets, 30 ways to deal each and 2 first players, so 262080 starting positions, about half
+of them mirror images of the others. At depth 8 each takes about two seconds, so a full book of the starting
+positions alone is three days of CPU time.
+--deals limits the build to a seeded sample of card sets.
+
+Usage: python book.py [--plies N] [--depth N] [--deals all|N] [--workers N] [--seed N] [--out FILE]
+'''
+import argparse
+import itertools
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import main
+
+def starting_positions(card_sets):
+    '''Yields the starting Board of every deal of every card set, for either side to move first, skipping mirror images of ones already yielded.'''
+    seen = set()
+    for card_set in card_sets:
+        for red, blue, waiting in main.TABLEBASE_ARRANGEMENTS:
+            cards = [card_set[red[0]], card_set[red[1]], card_set[blue[0]], card_set[blue[1]], card_set[waiting]]
+            for turn in (0, 1):
+                board = main.Board(turn, list(main.INITIAL_POSITIONS), cards)
+                if board.canonical()[0] in seen: continue
+                seen.add(board.canonical()[0])
+                yield board
+
+def book_positions(card_sets, plies):
+    '''Yields every position reachable in fewer than plies plies from each starting position, once per key from Board.canonical.'''
+    for board in starting_positions(card_sets):
+        seen = set()
+        frontier = [board]
+        for ply in range(plies):
+            next_frontier = []
+            for board in frontier:
+                if board.canonical()[0] in seen or board.is_won(): continue
+                seen.add(board.canonical()[0])
+                yield board
+                if ply + 1 < plies:
+                    for move in board.possible_moves():
+                        child = board.copy()
+                        child.execute_move(move)
+                        next_frontier.append(child)
+            frontier = next_frontier
+
+def search_position(task):
+    '''Searches a position, returns (key from Board.canonical, moves tied for best as stored under that key, score, depth).'''
+    board, depth = task
+    tt = main.TranspositionTable()
+    ordering = main.new_move_ordering()
+    sign = 1 if board.turn_colour_num() == 0 else -1
+
+    results = []
+    for move in board.possible_moves_search_optimised():
+        undo = board.make_move(move)
+        score = 1000*sign if board.is_won() else main.recursive_search(board, depth-1, -1000, 1000, tt, None, None, 1, ordering)
+        board.unmake_move(move, undo)
+        results.append((move, score))
+
+    best = max(sign*score for move, score in results)
+    key, mirrored = board.canonical()
+    return key, [main.mirror_move(move) if mirrored else move for move, score in results if sign*score == best], sign*best, depth
+
+def build(card_sets, plies, depth, workers, out):
+    entries = []
+    start_time = time.time()
+    positions = 0
+    with Pool(workers) as pool:
+        tasks = ((board, depth) for board in book_positions(card_sets, plies))
+        for zobrist, moves, score, depth in pool.imap_unordered(search_position, tasks, chunksize=4):
+            entries.extend((zobrist, main.encode_move(move), score, depth) for move in moves)
+            positions += 1
+            if positions % 100 == 0: print(f"positions searched: {positions}, {positions/(time.time() - start_time):.1f} per second", flush=True)
+
+    entries.sort()
+    with open(out + ".tmp", "wb") as out_file:
+        out_file.write(main.BOOK_HEADER.pack(main.BOOK_MAGIC, len(entries)))
+        for entry in entries: out_file.write(main.BOOK_ENTRY.pack(*entry))
+    os.replace(out + ".tmp", out)
+    print(f"{positions} positions, {len(entries)} entries written to {out} in {time.time() - start_time:.1f} seconds")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama opening book builder")
+    parser.add_argument("--plies", type=int, default=1, help="book positions reached in fewer than this many plies")
+    parser.add_argument("--depth", type=int, default=main.DEPTH)
+    parser.add_argument("--deals", default="all", help="all card sets, or a number of card sets sampled with --seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=main.BOOK_PATH)
+    args = parser.parse_args()
+
+    card_sets = list(itertools.combinations(range(len(main.DECK)), 5))
+    if args.deals != "all": card_sets = random.Random(args.seed).sample(card_sets, int(args.deals))
+    build(card_sets, args.plies, args.depth, args.workers, args.out)
@@ -0,0 +1,208 @@
+'''
+Self-play game dataset for Onitama.
+
+The generate mode plays games of request_simple_search_bot_move against itself on a pool of worker processes
+and records every searched position with the search's evaluation and the game's result. Games start from a
+seeded card deal and a few random moves, so that they differ. Records are appended to sharded files in a
+directory, a new shard being started once the current one holds --shard-records records.
+
+Shard layout, little-endian:
+    header          magic b'ONIDS1', 2 pad bytes
+    records         16 bytes each: uint64 position packed by notation.pack_board, int16 search evaluation
+                    (positive favours RED), uint16 ply of the game, int8 result (1 RED won, -1 BLUE won, 0 draw),
+                    uint8 search depth, 2 pad bytes
+
+GameDataset opens the shards with numpy.memmap, so records are read from disk as they are indexed and
+whole shards are never loaded into memory. The stats mode prints a summary of a dataset.
+
+Usage: python dataset.py generate [--games N] [--depth N | --move-time MS] [--random-plies N] [--workers N] [--seed N] [--dir DIR] [--shard-records N]
+       python dataset.py stats [--dir DIR]
+'''
+import argparse
+import glob
+import os
+import random
+import struct
+import time
+from multiprocessing import Pool
+
+try:
+    import numpy as np
+except ImportError: # NumPy is only needed to read datasets
+    np = None
+
+import main
+from notation import pack_board, unpack_board
+
+DATASET_MAGIC = b'ONIDS1'
+DATASET_HEADER = struct.Struct('<6sxx')
+DATASET_RECORD = struct.Struct('<QhHbBxx')
+RECORD_DTYPE = [("position", "<u8"), ("evaluation", "<i2"), ("ply", "<u2"), ("result", "i1"), ("depth", "u1"), ("pad", "V2")]
+
+DATASET_DIR = "dataset"
+
+# Games longer than this many plies are recorded as draws
+MAX_PLIES = 200
+
+def shard_path(directory, num):
+    return os.path.join(directory, f"shard-{num:05d}.bin")
+
+def shard_indices(directory):
+    '''Returns the numbers of the shards in a directory.'''
+    paths = glob.glob(os.path.join(directory, "shard-*.bin"))
+    return [int(name[6:-4]) for name in map(os.path.basename, paths) if name[6:-4].isdigit()]
+
+def play_game(task):
+    '''Plays one self-play game described by a task dictionary, returns its records packed as bytes.'''
+    random.seed(task["seed"])
+    board = main.Board(task["first"], list(main.INITIAL_POSITIONS), list(task["deal"]))
+    tt = main.TranspositionTable()
+    for ply in range(task["random_plies"]):
+        if board.is_won(): break
+        board.execute_move(random.choice(board.possible_moves()))
+
+    positions = []
+    while board.turn - task["first"] < MAX_PLIES and not board.is_won():
+        move, evaluation, depth = main.request_simple_search_bot_move(board, tt, task["depth"], task["move_time"])
+        positions.append((pack_board(board), evaluation, board.turn - task["first"], depth))
+        board.execute_move(move)
+
+    victory_type = board.is_won()
+    result = 0 if victory_type is None else 1 if victory_type[0] == "RED" else -1
+    return b"".join(DATASET_RECORD.pack(position, evaluation, ply, result, min(depth, 255)) for position, evaluation, ply, depth in positions)
+
+def game_tasks(games, depth, move_time, random_plies, seed):
+    rng = random.Random(seed)
+    for game in range(games):
+        yield {"deal": rng.sample(range(len(main.DECK)), 5), "first": rng.randint(0, 1), "seed": rng.getrandbits(32),
+               "depth": depth, "move_time": move_time, "random_plies": random_plies}
+
+class ShardWriter:
+    '''Appends records to the shards of a directory, starting a new shard numbered after the highest existing one and whenever one is full.'''
+
+    def __init__(self, directory, shard_records):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_records = shard_records
+        self.num = max(shard_indices(directory), default=-1) + 1
+        self.file = None
+        self.records = 0
+
+    def write(self, records):
+        '''Writes a game's packed records, which stay in one shard.'''
+        if self.file is None or self.records >= self.shard_records:
+            self.close()
+            self.file = open(shard_path(self.directory, self.num), "xb") # Never truncates an existing shard
+            self.file.write(DATASET_HEADER.pack(DATASET_MAGIC))
+            self.num += 1
+            self.records = 0
+        self.file.write(records)
+        self.file.flush()
+        self.records += len(records) // DATASET_RECORD.size
+
+    def close(self):
+        if self.file is not None: self.file.close()
+        self.file = None
+
+def generate(games, depth, move_time, random_plies, workers, seed, directory, shard_records):
+    main.SEARCH_STATS_LOG = None
+    writer = ShardWriter(directory, shard_records)
+    start_time = time.time()
+    played = positions = 0
+    try:
+        with Pool(workers) as pool:
+            for records in pool.imap_unordered(play_game, game_tasks(games, depth, move_time, random_plies, seed)):
+                writer.write(records)
+                played += 1
+                positions += len(records) // DATASET_RECORD.size
+                if played % 10 == 0: print(f"games played: {played}, positions: {positions}, {positions/(time.time() - start_time):.1f} per second", flush=True)
+    finally:
+        writer.close()
+    print(f"{played} games, {positions} positions written to {directory} in {time.time() - start_time:.1f} seconds")
+
+class GameDataset:
+    '''
+    GameDataset class reads the shards of a dataset directory as one array of records, through numpy.memmap.
+
+    Methods:
+        __len__()                       - Returns the number of records
+        __getitem__(index)              - Returns the record at a global index, or a structured array for an array of indices
+        gather(indices)                 - Returns a structured array of the records at an array of global indices
+        minibatches(batch_size, seed)   - Yields structured arrays of records in a shuffled order, each record once
+        boards(records)                 - Returns the Boards of a structured array of records
+    '''
+
+    def __init__(self, directory=DATASET_DIR):
+        self.shards = []
+        for path in sorted(glob.glob(os.path.join(directory, "shard-*.bin"))):
+            # A shard read while a game is being appended, or left by a crash, may end in part of a record,
+            # which is left out. Shards without a complete record are skipped
+            records = (os.path.getsize(path) - DATASET_HEADER.size) // DATASET_RECORD.size
+            if records <= 0: continue
+            with open(path, "rb") as shard_file:
+                if DATASET_HEADER.unpack(shard_file.read(DATASET_HEADER.size))[0] != DATASET_MAGIC: raise ValueError(f"{path} is not an Onitama dataset shard")
+            self.shards.append(np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=DATASET_HEADER.size, shape=(records,)))
+        self.starts = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            if not -len(self) <= index < len(self): raise IndexError("record index out of range")
+            index %= len(self)
+            shard = int(np.searchsorted(self.starts, index, side="right")) - 1
+            return self.shards[shard][index - self.starts[shard]]
+        return self.gather(np.asarray(index))
+
+    def gather(self, indices):
+        '''Returns the records at an array of global indices, in that order, reading each shard once with sorted offsets.'''
+        if len(indices) and not (0 <= indices.min() and indices.max() < len(self)): raise IndexError("record index out of range")
+        shard_of = np.searchsorted(self.starts, indices, side="right") - 1
+        records = np.empty(len(indices), dtype=RECORD_DTYPE)
+        for shard in np.unique(shard_of):
+            where = np.nonzero(shard_of == shard)[0]
+            offsets = indices[where] - self.starts[shard]
+            order = np.argsort(offsets)
+            records[where[order]] = self.shards[shard][offsets[order]]
+        return records
+
+    def minibatches(self, batch_size, seed=None):
+        permutation = np.random.default_rng(seed).permutation(len(self))
+        for start in range(0, len(self), batch_size):
+            yield self.gather(permutation[start:start+batch_size])
+
+    def boards(self, records):
+        return [unpack_board(int(position)) for position in records["position"]]
+
+def stats(directory):
+    dataset = GameDataset(directory)
+    print(f"{len(dataset.shards)} shards, {len(dataset)} positions")
+    if not len(dataset): return
+    results = np.zeros(3, dtype=np.int64)
+    depths = 0
+    games = 0
+    for shard in dataset.shards:
+        results += np.bincount(shard["result"].astype(np.int64) + 1, minlength=3)
+        depths += int(shard["depth"].sum(dtype=np.int64))
+        games += int(np.count_nonzero(np.diff(shard["ply"].astype(np.int64)) <= 0)) + 1
+    blue, draw, red = results / len(dataset)
+    print(f"about {games} games, mean search depth {depths/len(dataset):.1f}")
+    print(f"positions from games won by RED {red:.1%}, by BLUE {blue:.1%}, drawn {draw:.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama self-play dataset")
+    parser.add_argument("mode", choices=("generate", "stats"))
+    parser.add_argument("--games", type=int, default=100)
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, default=None, help=f"search depth, default {main.DEPTH}")
+    limit.add_argument("--move-time", type=int, default=None, help="milliseconds per move instead of a fixed depth")
+    parser.add_argument("--random-plies", type=int, default=2, help="random moves played, and not recorded, at the start of each game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=DATASET_DIR)
+    parser.add_argument("--shard-records", type=int, default=1 << 20, help="records per shard")
+    args = parser.parse_args()
+
+    if args.mode == "generate": generate(args.games, args.depth, args.move_time, args.random_plies, args.workers, args.seed, args.dir, args.shard_records)
+    else: stats(args.dir)
@@ -1,7 +1,22 @@
+import itertools
+import json
+import math
+import mmap
 import random
 import re
-import copy
+import os
+import struct
+import threading
 import time
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError: # NumPy is only needed for batched leaf evaluation
+    np = None
 
 # Initial postitions for a typical game
 INITIAL_POSITIONS = [(2,0),(0,0),(1,0),(3,0),(4,0),(2,4),(0,4),(1,4),(3,4),(4,4)]
@@ -44,6 +59,13 @@ class Card:
         
         return full_matrix
 
+# Squares are numbered 0-24 row by row, starting from RED's home row
+def coords_to_square(coords):
+    return coords[0] + 5*coords[1]
+
+def square_to_coords(square):
+    return (square % 5, square // 5)
+
 # The Deck contains all cards in Onitama
 DECK = (
     Card('tiger', 0, ((0,2), (0,-1))),
@@ -64,6 +86,45 @@ DECK = (
     Card('rabbit', 15, ((1,1),(2,0),(-1,-1)))
 )
 
+# Zobrist keys, seeded so that hashes are stable between runs and processes
+ZOBRIST_SEED = 20200601
+
+# Piece type of each index into Board.positions: RED master, RED student, BLUE master, BLUE student
+PIECE_TYPE = (0, 1, 1, 1, 1, 2, 3, 3, 3, 3)
+
+# Card group of each index into Board.cards: RED's hand, BLUE's hand, waiting card. Hands are hashed as sets
+CARD_GROUP = (0, 0, 1, 1, 2)
+
+_zobrist_random = random.Random(ZOBRIST_SEED)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for square in range(25)] for piece_type in range(4)]
+ZOBRIST_CARDS = [[_zobrist_random.getrandbits(64) for card in DECK] for group in range(3)]
+ZOBRIST_BLUE_TO_MOVE = _zobrist_random.getrandbits(64)
+del _zobrist_random
+
+# Mirror images: reflecting the board left to right, x to 4-x, and swapping each card for the card with mirrored moves
+# (frog and rabbit, cobra and eel, goose and rooster, ox and horse, the others being symmetric) gives a position of the same value
+def build_mirror_cards():
+    cards = {frozenset(card.card_moves): card.idx for card in DECK}
+    return tuple(cards[frozenset((-card_move[0], card_move[1]) for card_move in card.card_moves)] for card in DECK)
+
+MIRROR_CARD = build_mirror_cards()
+MIRROR_SQUARE = tuple(coords_to_square((4 - x, y)) for x, y in map(square_to_coords, range(25)))
+
+# Zobrist keys of mirror images: the key of a position under these tables is the key of its mirror image
+ZOBRIST_MIRROR_PIECES = [[keys[MIRROR_SQUARE[square]] for square in range(25)] for keys in ZOBRIST_PIECES]
+ZOBRIST_MIRROR_CARDS = [[keys[MIRROR_CARD[card]] for card in range(len(DECK))] for keys in ZOBRIST_CARDS]
+
+def mirror_coords(coords):
+    return None if coords is None else (4 - coords[0], coords[1])
+
+# Returns the move in the mirror image corresponding to a Board move, or to a BitBoard move given by square number
+def mirror_move(move):
+    if isinstance(move[0], int): return (MIRROR_SQUARE[move[0]], MIRROR_SQUARE[move[1]], MIRROR_CARD[move[2]])
+    return (mirror_coords(move[0]), mirror_coords(move[1]), MIRROR_CARD[move[2]])
+
+# check_move's response when a move is possible with either card in hand and the card is not named
+AMBIGUOUS_CARD = "Move is possible with either card. Name the desired card."
+
 # The Board class represents a gamestate
 class Board:
     '''
@@ -75,20 +136,35 @@ class Board:
         copy()                          - Returns a duplicate of the board that does not duplicate where unnecessary
         create_matrix()                 - Creates list-of-lists representation of the board that prints elegantly
         validate_move(move_coords)      - Returns None and prints cause of invalidity for invalid moves coordinates. Requests user input if card used is ambiguous, and returns move if valid
+        check_move(move_coords, card)   - Returns (move, None) for valid move coordinates, or (None, cause of invalidity) without printing or requesting input
         execute_move(move)              - Updates the board object by executing a given move
+        make_move(move)                 - Executes a move in place and returns an undo record
+        unmake_move(move, undo)         - Restores the position before make_move, given its undo record
+        is_capture(move)                - Returns True if a move captures a piece
         is_won()                        - Returns None if game is not won, else returns win type
         game_stage()                    - Returns 'OPENING', 'MIDGAME', or 'ENDGAME' depending on game stage
         __str__()                       - Returns string representation of the playing area that prints elegantly
         possible_moves()                - Returns list of possible moves
-        evaluate_position()             - Returns minimax-style position evaluation
+        evaluate_position()             - Returns minimax-style position evaluation from the running terms kept by make_move
+        evaluate_position_full()        - Returns the same evaluation recomputed from scratch
+        batch_row()                     - Returns the integer row describing the position to evaluate_positions
+        compute_evaluation_terms()      - Returns the running evaluation terms from scratch
+        compute_zobrist(mirror)         - Returns the Zobrist key of the board, or of its mirror image, from scratch. make_move keeps
+                                          self.zobrist and self.mirror_zobrist up to date incrementally
+        mirror()                        - Returns the mirror image of the board, which has the same value
+        canonical()                     - Returns (key, mirrored): the lower of the Zobrist keys of the board and its mirror image,
+                                          and whether it is the mirror image's
     '''
 
-    def __init__(self, turn=None, positions=INITIAL_POSITIONS, cards=random.sample(range(len(DECK)),5)):
+    def __init__(self, turn=None, positions=INITIAL_POSITIONS, cards=random.sample(range(len(DECK)),5), zobrist=None, mirror_zobrist=None):
         self.positions = positions
         self.cards = cards
         if turn is None:
             self.turn = random.randint(0,1)  # Set game to start on turn 0 or 1 randomly
         else: self.turn = turn
+        self.zobrist = self.compute_zobrist() if zobrist is None else zobrist
+        self.mirror_zobrist = self.compute_zobrist(True) if mirror_zobrist is None else mirror_zobrist
+        self.material, self.centre, self.student_counts = self.compute_evaluation_terms()
 
     def turn_colour(self):
         return "RED" if self.turn % 2 == 0 else "BLUE"
@@ -97,7 +173,37 @@ class Board:
         return self.turn % 2
 
     def copy(self):
-        return Board(self.turn, list(self.positions), list(self.cards))
+        return Board(self.turn, list(self.positions), list(self.cards), self.zobrist, self.mirror_zobrist)
+
+    def mirror(self):
+        return Board(self.turn, [mirror_coords(piece) for piece in self.positions], [MIRROR_CARD[card] for card in self.cards],
+                     self.mirror_zobrist, self.zobrist)
+
+    def canonical(self):
+        if self.mirror_zobrist < self.zobrist: return self.mirror_zobrist, True
+        return self.zobrist, False
+
+    # Returns the running evaluation terms kept by make_move: student material and centre priority (both positive for RED)
+    # and the number of students on each side
+    def compute_evaluation_terms(self):
+        material = centre = 0
+        student_counts = [0, 0]
+        for num, piece in enumerate(self.positions):
+            if piece is None or num in (0, 5): continue
+            sign = 1 if num < 5 else -1
+            material += sign*STUDENT_VALUE
+            centre += sign*CENTER_PRIORITY[piece[0]][piece[1]]
+            student_counts[num > 5] += 1
+        return material, centre, student_counts
+
+    def compute_zobrist(self, mirror=False):
+        pieces, cards = (ZOBRIST_MIRROR_PIECES, ZOBRIST_MIRROR_CARDS) if mirror else (ZOBRIST_PIECES, ZOBRIST_CARDS)
+        zobrist = ZOBRIST_BLUE_TO_MOVE if self.turn % 2 else 0
+        for num, piece in enumerate(self.positions):
+            if piece is not None: zobrist ^= pieces[PIECE_TYPE[num]][coords_to_square(piece)]
+        for slot, card in enumerate(self.cards):
+            zobrist ^= cards[CARD_GROUP[slot]][card]
+        return zobrist
 
     def create_matrix(self):
 
@@ -130,6 +236,27 @@ class Board:
 
     def validate_move(self, move_coords):
 
+        move, error = self.check_move(move_coords)
+
+        # Handle extra response when card_move is possible with either card
+        if error == AMBIGUOUS_CARD:
+            cards = [DECK[idx].name for idx in self.cards[2*self.turn_colour_num():2*self.turn_colour_num()+2]]
+
+            while True: # Loop to specify desired card
+                response = input("Move is possible with either card. Name the desired card: ")
+
+                # Check that response names a card in the player's hand
+                if response in cards: break
+
+                print("That is not the name of one of your cards.")
+
+            move, error = self.check_move(move_coords, response)
+
+        if error: print(error)
+        return move
+
+    def check_move(self, move_coords, card_name=None):
+
         if self.turn % 2 == 0: 
             pieces = self.positions[0:5] # Red's Master and Students
             cards = [DECK[idx] for idx in self.cards[0:2]] # Red's cards
@@ -140,60 +267,119 @@ class Board:
             mul = -1 # Multiplier does not reverse axes
 
         # Check input moves a friendly piece
-        if move_coords[0] not in pieces: 
-            print("Coordinates do not specify a friendly piece.")
-            return None
+        if move_coords[0] not in pieces: return None, "Coordinates do not specify a friendly piece."
 
         card_move = (-mul*move_coords[1][0]+mul*move_coords[0][0],mul*move_coords[1][1]-mul*move_coords[0][1]) # Convert move_coords to notation used in cards
 
         # Check card_move is described by a card in hand
-        if  card_move not in cards[0].card_moves and card_move not in cards[1].card_moves: 
-            print("Move not in hand.")
-            return None
+        if  card_move not in cards[0].card_moves and card_move not in cards[1].card_moves: return None, "Move not in hand."
 
         # Check move_coords do not capture a friendly piece
-        if move_coords[1] in pieces:
-            print("Move cannot capture a friendly piece.")
-            return None
+        if move_coords[1] in pieces: return None, "Move cannot capture a friendly piece."
 
-        # Handle extra response when card_move is possible with either card
-        if card_move in cards[0].card_moves and card_move in cards[1].card_moves: 
-            
-            while True: # Loop to specify desired card
-                response = input("Move is possible with either card. Name the desired card: ")
+        # A named card must be in hand and describe the move
+        if card_name is not None:
+            for card in cards:
+                if card.name == card_name:
+                    if card_move not in card.card_moves: return None, f"Move not possible with {card_name}."
+                    return (move_coords[0], move_coords[1], card.idx), None
+            return None, "That is not the name of one of your cards."
 
-                # Check that response names a card in the player's hand
-                if response == cards[0].name or response == cards[1].name: break
-
-                print("That is not the name of one of your cards.")
-
-            # Record card used
-            if response == cards[0].name: card_used = 0
-            else: card_used = 1
-            move = (move_coords[0], move_coords[1], cards[card_used].idx)
-            return move
+        # The card used must be named when card_move is possible with either card
+        if card_move in cards[0].card_moves and card_move in cards[1].card_moves: return None, AMBIGUOUS_CARD
 
         # Record card used
         if card_move in cards[0].card_moves: card_used = 0
         else: card_used = 1
         move = (move_coords[0], move_coords[1], cards[card_used].idx)
-        return move
+        return move, None
 
     # Updates the board state by executing a move
     def execute_move(self, move):
+        self.make_move(move)
+
+    # Executes a move in place, returns the record unmake_move needs to restore the position:
+    # (index of the captured piece or None, card slot swapped, previous Zobrist key, previous mirror image Zobrist key)
+    def make_move(self, move):
 
         self.turn += 1 # Increments turn count
+        zobrist = self.zobrist ^ ZOBRIST_BLUE_TO_MOVE
+        mirror_zobrist = self.mirror_zobrist ^ ZOBRIST_BLUE_TO_MOVE
 
         # Swaps used card with waiting card
-        self.cards[self.cards.index(move[2])] = self.cards[4]
+        slot = self.cards.index(move[2])
+        group = ZOBRIST_CARDS[CARD_GROUP[slot]]
+        zobrist ^= group[move[2]] ^ group[self.cards[4]] ^ ZOBRIST_CARDS[2][move[2]] ^ ZOBRIST_CARDS[2][self.cards[4]]
+        group = ZOBRIST_MIRROR_CARDS[CARD_GROUP[slot]]
+        mirror_zobrist ^= group[move[2]] ^ group[self.cards[4]] ^ ZOBRIST_MIRROR_CARDS[2][move[2]] ^ ZOBRIST_MIRROR_CARDS[2][self.cards[4]]
+        self.cards[slot] = self.cards[4]
         self.cards[4] = move[2]
 
+        # A pass only exchanges the card
+        if move[0] is None:
+            undo = (None, slot, self.zobrist, self.mirror_zobrist)
+            self.zobrist = zobrist
+            self.mirror_zobrist = mirror_zobrist
+            return undo
+
+        start, end = coords_to_square(move[0]), coords_to_square(move[1])
+
         # Captures enemy piece, if it exists
-        try: self.positions[self.positions.index(move[1])] = None
-        except ValueError: pass
+        try:
+            captured = self.positions.index(move[1])
+            self.positions[captured] = None
+            zobrist ^= ZOBRIST_PIECES[PIECE_TYPE[captured]][end]
+            mirror_zobrist ^= ZOBRIST_MIRROR_PIECES[PIECE_TYPE[captured]][end]
+            if captured > 5:
+                self.material += STUDENT_VALUE
+                self.centre += CENTER_PRIORITY[move[1][0]][move[1][1]]
+                self.student_counts[1] -= 1
+            elif 0 < captured < 5:
+                self.material -= STUDENT_VALUE
+                self.centre -= CENTER_PRIORITY[move[1][0]][move[1][1]]
+                self.student_counts[0] -= 1
+        except ValueError: captured = None
 
         # Updates piece's position
-        self.positions[self.positions.index(move[0])] = move[1]
+        moved = self.positions.index(move[0])
+        self.positions[moved] = move[1]
+        if moved > 5: self.centre -= CENTER_PRIORITY[move[1][0]][move[1][1]] - CENTER_PRIORITY[move[0][0]][move[0][1]]
+        elif 0 < moved < 5: self.centre += CENTER_PRIORITY[move[1][0]][move[1][1]] - CENTER_PRIORITY[move[0][0]][move[0][1]]
+
+        undo = (captured, slot, self.zobrist, self.mirror_zobrist)
+        piece_keys = ZOBRIST_PIECES[PIECE_TYPE[moved]]
+        self.zobrist = zobrist ^ piece_keys[start] ^ piece_keys[end]
+        piece_keys = ZOBRIST_MIRROR_PIECES[PIECE_TYPE[moved]]
+        self.mirror_zobrist = mirror_zobrist ^ piece_keys[start] ^ piece_keys[end]
+        return undo
+
+    # Reverses make_move, given the move and the record it returned
+    def unmake_move(self, move, undo):
+        captured, slot, self.zobrist, self.mirror_zobrist = undo
+        self.turn -= 1
+        self.cards[4] = self.cards[slot]
+        self.cards[slot] = move[2]
+        if move[0] is None: return
+
+        moved = self.positions.index(move[1])
+        self.positions[moved] = move[0]
+        if moved > 5: self.centre += CENTER_PRIORITY[move[1][0]][move[1][1]] - CENTER_PRIORITY[move[0][0]][move[0][1]]
+        elif 0 < moved < 5: self.centre -= CENTER_PRIORITY[move[1][0]][move[1][1]] - CENTER_PRIORITY[move[0][0]][move[0][1]]
+
+        if captured is not None:
+            self.positions[captured] = move[1]
+            if captured > 5:
+                self.material -= STUDENT_VALUE
+                self.centre -= CENTER_PRIORITY[move[1][0]][move[1][1]]
+                self.student_counts[1] += 1
+            elif 0 < captured < 5:
+                self.material += STUDENT_VALUE
+                self.centre += CENTER_PRIORITY[move[1][0]][move[1][1]]
+                self.student_counts[0] += 1
+
+    # Returns True if a move captures a piece. Pieces never move onto their own side's pieces
+    def is_capture(self, move):
+        return move[1] is not None and move[1] in self.positions
 
     # Returns type of victory attained in a given board state, None if the game is not won.
     def is_won(self):
@@ -205,9 +391,7 @@ class Board:
 
     # Returns subjective game stage evaluation
     def game_stage(self):
-        num_red_students = len([1 for student in self.positions[1:5] if student])
-        num_blue_students = len([1 for student in self.positions[6:10] if student])
-        min_students = min(num_red_students,num_blue_students)
+        min_students = min(self.student_counts)
         if min_students >= 4: return "OPENING"
         elif min_students >= 2: return "MIDGAME"
         else: return "ENDGAME"
@@ -290,9 +474,8 @@ class Board:
                     if destination in current_pieces: continue
                     possible_moves.append((position,destination,card))
 
-        if possible_moves == []:
-            print("AAAAAAAAAAAAAA")
-            exit()
+        # No piece can move: the player passes, exchanging one of their cards without moving
+        if possible_moves == []: return [(None, None, card) for card in current_cards]
 
         return possible_moves
 
@@ -338,14 +521,45 @@ class Board:
 
         possible_moves = captures + other_moves
         
-        if possible_moves == []:
-            print("AAAAAAAAAAAAAA")
-            exit()
+        # No piece can move: the player passes, exchanging one of their cards without moving
+        if possible_moves == []: return [(None, None, card) for card in self.cards[2*self.turn_colour_num():2*self.turn_colour_num()+2]]
 
         return possible_moves
 
     # A simple evaluation function. A positive score favours RED, a negative score favours BLUE
     def evaluate_position(self):
+        if EVAL_DEBUG:
+            full_score = self.evaluate_position_full()
+            terms = self.compute_evaluation_terms()
+            assert (self.material, self.centre, self.student_counts) == terms, \
+                f"incremental evaluation terms {(self.material, self.centre, self.student_counts)} diverged from {terms}"
+
+        red_master = self.positions[0]
+        blue_master = self.positions[5]
+
+        # Return large evaluation for won positions, in the order is_won checks them
+        if red_master == (2,4): return 1000
+        if blue_master == (2,0) or red_master is None: return -1000
+        if blue_master is None: return 1000
+
+        # Student values and centre priority are kept up to date by make_move, master positioning depends on game stage
+        min_students = min(self.student_counts)
+        if min_students >= 4: table = OPENING_MASTER_POSITIONAL_VALUE
+        elif min_students >= 2: table = MIDGAME_MASTER_POSITIONAL_VALUE
+        else: table = ENDGAME_MASTER_POSITIONAL_VALUE
+        score = self.material + self.centre + table[red_master[0]][red_master[1]] - table[4-blue_master[0]][4-blue_master[1]]
+
+        if EVAL_DEBUG: assert score == full_score, f"incremental evaluation {score} != full evaluation {full_score}"
+        return score
+
+    # Returns the row describing this position to evaluate_positions
+    def batch_row(self):
+        min_students = min(self.student_counts)
+        stage = 0 if min_students >= 4 else 1 if min_students >= 2 else 2
+        return [25 if piece is None else piece[0] + 5*piece[1] for piece in self.positions] + [stage]
+
+    # The evaluation recomputed from scratch, which evaluate_position checks itself against when EVAL_DEBUG is set
+    def evaluate_position_full(self):
         # Return large evaluation for won positions
         try: return 1000 if self.is_won()[0] == "RED" else -1000
         except: pass
@@ -359,7 +573,10 @@ class Board:
             if piece: score -= (CENTER_PRIORITY[piece[0]][piece[1]] + STUDENT_VALUE)
 
         # Evaluate master positioning
-        game_stage = self.game_stage()
+        num_red_students = len([1 for student in self.positions[1:5] if student])
+        num_blue_students = len([1 for student in self.positions[6:10] if student])
+        min_students = min(num_red_students,num_blue_students)
+        game_stage = "OPENING" if min_students >= 4 else "MIDGAME" if min_students >= 2 else "ENDGAME"
         if game_stage == "OPENING":
             score += OPENING_MASTER_POSITIONAL_VALUE[self.positions[0][0]][self.positions[0][1]]
             score -= OPENING_MASTER_POSITIONAL_VALUE[4-self.positions[5][0]][4-self.positions[5][1]]
@@ -406,7 +623,82 @@ ENDGAME_MASTER_POSITIONAL_VALUE = [
 
 STUDENT_VALUE = 50
 
+# Evaluation tables written by tune.py, loaded in place of the ones above when the file exists
+EVAL_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_weights.json")
+EVAL_TABLE_NAMES = ("CENTER_PRIORITY", "STUDENT_VALUE", "OPENING_MASTER_POSITIONAL_VALUE", "MIDGAME_MASTER_POSITIONAL_VALUE",
+                    "ENDGAME_MASTER_POSITIONAL_VALUE")
+
+# Returns the largest magnitude of evaluation a position that is not won can get from a dictionary of tables.
+# It must stay below 1000, the score of a won position
+def eval_weights_bound(tables):
+    student = max(abs(tables["STUDENT_VALUE"] + value) for row in tables["CENTER_PRIORITY"] for value in row)
+    master = max(abs(value) for name in EVAL_TABLE_NAMES[2:] for row in tables[name] for value in row)
+    return 8*student + 2*master
+
+# Returns True if the evaluation tables, or a dictionary of tables keyed by their names, score every position and its
+# mirror image alike. The opening book and mirrored transposition table keys rely on it
+def eval_tables_mirror_symmetric(tables=None):
+    if tables is None: tables = globals()
+    tables = [tables[name] for name in EVAL_TABLE_NAMES if name != "STUDENT_VALUE"]
+    return all(table[x][y] == table[4-x][y] for table in tables for x in range(5) for y in range(5))
+
+# Replaces the evaluation tables with those in a file written by tune.py. Must run before the tables are used
+def load_eval_weights(path):
+    with open(path) as weights_file: tables = json.load(weights_file)
+    if set(tables) != set(EVAL_TABLE_NAMES): raise ValueError(f"{path} does not hold the tables {', '.join(EVAL_TABLE_NAMES)}")
+    if eval_weights_bound(tables) >= 1000: raise ValueError(f"{path} has tables that can score a position as won")
+    if not eval_tables_mirror_symmetric(tables): raise ValueError(f"{path} has tables that score mirror image positions differently")
+    globals().update(tables)
+
+if os.path.exists(EVAL_WEIGHTS_PATH): load_eval_weights(EVAL_WEIGHTS_PATH)
+
+# Checks the incremental evaluation against the full recomputation on every call to evaluate_position
+EVAL_DEBUG = False
+
+# Scores all children of frontier nodes with one call to evaluate_positions. Requires NumPy
+BATCH_LEAF_EVAL = False
+
+# Lookup tables for evaluate_positions, indexed by square with 25 standing for a captured piece
+def build_batch_tables():
+    coords = [square_to_coords(square) for square in range(25)]
+    student_values = np.array([CENTER_PRIORITY[x][y] + STUDENT_VALUE for x, y in coords] + [0], dtype=np.int64)
+    stage_tables = (OPENING_MASTER_POSITIONAL_VALUE, MIDGAME_MASTER_POSITIONAL_VALUE, ENDGAME_MASTER_POSITIONAL_VALUE)
+    red_master_values = np.array([[table[x][y] for x, y in coords] + [0] for table in stage_tables], dtype=np.int64)
+    blue_master_values = np.array([[table[4-x][4-y] for x, y in coords] + [0] for table in stage_tables], dtype=np.int64)
+    return student_values, red_master_values, blue_master_values
+
+BATCH_TABLES = build_batch_tables() if np is not None else None
+
+RED_TEMPLE_SQUARE = coords_to_square((2,4))
+BLUE_TEMPLE_SQUARE = coords_to_square((2,0))
+
+# Scores a batch of positions at once, as Board.evaluate_position would. Takes an integer array with one row per
+# position, as built by Board.batch_row: the squares of the ten pieces in Board.positions order (25 if captured)
+# followed by the game stage (0 OPENING, 1 MIDGAME, 2 ENDGAME)
+def evaluate_positions(batch):
+    student_values, red_master_values, blue_master_values = BATCH_TABLES
+    batch = np.asarray(batch, dtype=np.int64)
+    red_master = batch[:, 0]
+    blue_master = batch[:, 5]
+    stage = batch[:, 10]
+
+    score = student_values[batch[:, 1:5]].sum(axis=1) - student_values[batch[:, 6:10]].sum(axis=1)
+    score += red_master_values[stage, red_master] - blue_master_values[stage, blue_master]
+
+    # Won positions, in the order is_won checks them
+    return np.select(
+        [red_master == RED_TEMPLE_SQUARE, blue_master == BLUE_TEMPLE_SQUARE, red_master == 25, blue_master == 25],
+        [1000, -1000, -1000, 1000], score)
+
                 
+# Returns a move in the notation request_move accepts, 'a1b2', or the card exchanged for a pass.
+# Takes Board moves, or BitBoard moves given by square number
+def move_notation(move):
+    if move[0] is None: return f"pass ({DECK[move[2]].name})"
+    start, end = move[0], move[1]
+    if isinstance(start, int): start, end = square_to_coords(start), square_to_coords(end)
+    return f"{chr(101-start[0])}{start[1]}{chr(101-end[0])}{end[1]}"
+
 def print_victory(victory_type):
     string = f"{victory_type[0]} wins by way of the {victory_type[1]}"
     print("\n"+len(string)*"="+f"\n{string}\n"+len(string)*"="+"\n")
@@ -414,35 +706,48 @@ def print_victory(victory_type):
 
 def request_move(board):
 
+    # With no piece able to move, the player passes by naming the card to exchange
+    possible_moves = board.possible_moves()
+    if possible_moves[0][0] is None:
+        pass_moves = {DECK[move[2]].name: move for move in possible_moves}
+        while True:
+            response = input("No piece can move. Name the card to exchange: ")
+            if response in pass_moves: return pass_moves[response]
+            print("That is not the name of one of your cards.")
+
     while True: # Loop to request and verify player's move
 
         move_input = input("Move a piece: ") # Take input on desired move
 
-        # Check regex match
-        if not re.match("[a-z]\d[a-z]\d", move_input): 
-            print("Could not parse input.")
-            continue
-
-        # Parse input to list of integers
-        raw_move_coords = []
-        for num, char in enumerate(move_input):
-            if num%2 == 0: # Parse letters
-                raw_move_coords.append(101-ord(char))
-            else:          # Parse digits
-                raw_move_coords.append(int(char))
-
-        # Check coordinates are on the board
-        if len(raw_move_coords) != 4 or any(x not in range(5) for x in raw_move_coords): 
-            print("Invalid Coordinates.")
+        move_coords, error = parse_move_coords(move_input)
+        if error:
+            print(error)
             continue
-        
-        # Parses raw_move_coords to coordinate notation used everywhere else
-        move_coords = [ (raw_move_coords[0], raw_move_coords[1]), (raw_move_coords[2], raw_move_coords[3]) ] 
 
         move = board.validate_move(move_coords)
 
         if move: return move
 
+# Parses move input in the 'a1b2' notation, returns (move_coords, None) or (None, cause of invalidity)
+def parse_move_coords(move_input):
+
+    # Check regex match
+    if not re.match("[a-z]\d[a-z]\d", move_input): return None, "Could not parse input."
+
+    # Parse input to list of integers
+    raw_move_coords = []
+    for num, char in enumerate(move_input):
+        if num%2 == 0: # Parse letters
+            raw_move_coords.append(101-ord(char))
+        else:          # Parse digits
+            raw_move_coords.append(int(char))
+
+    # Check coordinates are on the board
+    if len(raw_move_coords) != 4 or any(x not in range(5) for x in raw_move_coords): return None, "Invalid Coordinates."
+
+    # Parses raw_move_coords to coordinate notation used everywhere else
+    return [ (raw_move_coords[0], raw_move_coords[1]), (raw_move_coords[2], raw_move_coords[3]) ], None
+
 def request_random_bot_move(board):
 
     possible_moves = board.possible_moves()
@@ -454,15 +759,15 @@ def request_shortsighted_bot_move(board):
     possible_moves = board.possible_moves()
 
     for pos, move in enumerate(possible_moves):
-        simulation_board = copy.deepcopy(board)
-        simulation_board.execute_move(move)
-        possible_countermoves = simulation_board.possible_moves()
+        undo = board.make_move(move)
+        possible_countermoves = board.possible_moves()
         worst_outcome = 300
-        for move in possible_countermoves:
-            simsimulation_board = copy.deepcopy(simulation_board)
-            simsimulation_board.execute_move(move)
-            evaluation = simsimulation_board.evaluate_position()
+        for countermove in possible_countermoves:
+            counter_undo = board.make_move(countermove)
+            evaluation = board.evaluate_position()
+            board.unmake_move(countermove, counter_undo)
             if evaluation < worst_outcome: worst_outcome = evaluation
+        board.unmake_move(move, undo)
         possible_moves[pos]=(possible_moves[pos],worst_outcome)
     
     return random.sample([possible_move[0] for possible_move in possible_moves if possible_move[1] == max([possible_move[1] for possible_move in possible_moves])],1)[0]
@@ -471,60 +776,1206 @@ def request_shortsighted_bot_move(board):
 DEPTH = 8
 #########
 
-def request_simple_search_bot_move(board):
+# Memory budget of the transposition table used by the bot modes
+TT_MEMORY_MB = 16
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# Store positions and their mirror images under one transposition table entry. Off by default: within one search
+# mirror images rarely transpose into each other, so it saves almost no nodes. Only valid while eval_tables_mirror_symmetric()
+MIRROR_TT = False
+
+# Returns (key, mirrored): the key board is stored under in the transposition table, and whether it is its mirror image's.
+# Moves stored for a mirrored key are moves of the mirror image
+def tt_key(board):
+    if MIRROR_TT: return board.canonical()
+    return board.zobrist, False
+
+def encode_move(move):
+    '''
+    Packs a (coords, coords, card) move, or a (square, square, card) BitBoard move, into a 14 bit integer.
+    0 never encodes a legal move, passes encode from PASS_CODE.
+    '''
+    if move[0] is None: return PASS_CODE + move[2]
+    if isinstance(move[0], int): return (move[0]*25 + move[1])*16 + move[2]
+    return (coords_to_square(move[0])*25 + coords_to_square(move[1]))*16 + move[2]
+
+def decode_move(code):
+    if code >= PASS_CODE: return (None, None, code - PASS_CODE)
+    return (square_to_coords(code // 400), square_to_coords(code // 16 % 25), code % 16)
+
+PASS_CODE = 25*25*16
+
+# Returns a move read from the transposition table in board's move format: mirrored back when it was stored under the
+# mirror image's key, and given by square number for a BitBoard. None stays None
+def table_move(board, move, mirrored):
+    if not move: return None
+    if mirrored: move = mirror_move(move)
+    if move[0] is not None and not isinstance(board, Board): move = (coords_to_square(move[0]), coords_to_square(move[1]), move[2])
+    return move
+
+class TranspositionTable:
+    '''
+    TranspositionTable class is a fixed-size hash table of search results keyed by Board.zobrist, or by tt_key.
+
+    Entries are packed into one 64-bit integer each:
+        bits 33-63  top 31 bits of the Zobrist key, to verify the entry
+        bits 28-32  search depth
+        bits 26-27  bound type (EXACT, LOWER or UPPER), 0 for an empty entry
+        bits 14-25  score + 2048
+        bits 0-13   best move, as packed by encode_move
+    Entries are held in buckets of two: a depth-preferred slot, which is only replaced by searches at least
+    as deep, and an always-replace slot, which takes everything else.
+
+    Methods:
+        probe(zobrist)                  - Returns (depth, bound, score, move) stored for a key, or None
+        store(zobrist, depth, bound, score, move) - Stores a search result
+        clear()                         - Empties the table
+        hit_rate()                      - Returns the fraction of probes that found an entry since the last reset_stats()
+        reset_stats()                   - Resets probe and hit counters
+    '''
+
+    def __init__(self, memory_mb=TT_MEMORY_MB):
+        self.num_buckets = max(1, int(memory_mb * 2**20) // 16)
+        self.entries = array('Q', bytes(16*self.num_buckets))
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, zobrist):
+        self.probes += 1
+        check = zobrist >> 33
+        slot = 2*(zobrist % self.num_buckets)
+        for entry in (self.entries[slot], self.entries[slot+1]):
+            if entry >> 33 == check and entry >> 26 & 3:
+                self.hits += 1
+                move = entry & 0x3FFF
+                return (entry >> 28 & 31, entry >> 26 & 3, (entry >> 14 & 0xFFF) - 2048, decode_move(move) if move else None)
+        return None
+
+    def store(self, zobrist, depth, bound, score, move):
+        check = zobrist >> 33
+        depth = min(depth, 31)
+        slot = 2*(zobrist % self.num_buckets)
+        preferred = self.entries[slot]
+        if not (preferred >> 33 == check or depth >= preferred >> 28 & 31): slot += 1
+        self.entries[slot] = check << 33 | depth << 28 | bound << 26 | (score + 2048) << 14 | (encode_move(move) if move else 0)
+
+    def clear(self):
+        self.entries = array('Q', bytes(16*self.num_buckets))
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+
+class SharedTranspositionTable(TranspositionTable):
+    '''
+    SharedTranspositionTable class is a TranspositionTable whose entries live in multiprocessing.shared_memory,
+    so every process holding it probes and stores into the same table.
+
+    No locks are taken. Each entry is one aligned 64-bit word that carries its own key check, so a lost race
+    between two writers costs one entry and a reader never sees half of one.
+    Pickling sends the segment name; unpickling attaches to the existing segment.
+
+    Methods:
+        close()                         - Detaches from the segment, and frees it in the process that created it
+    '''
+
+    def __init__(self, memory_mb=TT_MEMORY_MB):
+        self.num_buckets = max(1, int(memory_mb * 2**20) // 16)
+        self.shm = shared_memory.SharedMemory(create=True, size=16*self.num_buckets)
+        self.shm.buf[:16*self.num_buckets] = bytes(16*self.num_buckets)
+        self.owner = True
+        self.entries = self.shm.buf.cast('Q')
+        self.probes = 0
+        self.hits = 0
+
+    def __getstate__(self):
+        return (self.shm.name, self.num_buckets)
+
+    def __setstate__(self, state):
+        name, self.num_buckets = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self.entries = self.shm.buf.cast('Q')
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.shm.buf[:16*self.num_buckets] = bytes(16*self.num_buckets)
+
+    def close(self):
+        self.entries.release()
+        self.shm.close()
+        if self.owner: self.shm.unlink()
+
+# Card arrangements of a deal: (positions of RED's cards, positions of BLUE's cards, position of the waiting card) in the sorted deal
+TABLEBASE_ARRANGEMENTS = tuple(
+    (red, tuple(position for position in range(5) if position != waiting and position not in red), waiting)
+    for waiting in range(5) for red in itertools.combinations([position for position in range(5) if position != waiting], 2))
+TABLEBASE_ARRANGEMENT_INDEX = {(1 << red[0] | 1 << red[1], waiting): num for num, (red, blue, waiting) in enumerate(TABLEBASE_ARRANGEMENTS)}
+
+TABLEBASE_MAGIC = b'ONITB1'
+TABLEBASE_HEADER = struct.Struct('<6sBxI')
+TABLEBASE_INDEX_ENTRY = struct.Struct('<HxxQ')
+
+def tablebase_student_configs(max_students):
+    '''Returns every (red students mask, blue students mask) with at most max_students students in all, fewest students first.'''
+    configs = []
+    for total in range(max_students + 1):
+        for red_count in range(total + 1):
+            for red in itertools.combinations(range(25), red_count):
+                for blue in itertools.combinations([square for square in range(25) if square not in red], total - red_count):
+                    configs.append((sum(1 << square for square in red), sum(1 << square for square in blue)))
+    return configs
+
+def tablebase_index(side, arrangement, config, red_master, blue_master, num_configs):
+    '''Returns the position of an entry in a deal's table.'''
+    return (((side*len(TABLEBASE_ARRANGEMENTS) + arrangement)*num_configs + config)*25 + red_master)*25 + blue_master
+
+class Tablebase:
+    '''
+    Tablebase class reads an endgame tablebase written by tablebase.py. The file is opened with mmap, so every
+    process probing it shares the same pages.
+
+    File layout, little-endian:
+        header          magic b'ONITB1', uint8 maximum students, pad byte, uint32 number of deals
+        deal index      per deal, by increasing key: uint16 key (bit per card of the deal), 2 pad bytes, uint64 offset of its table
+        tables          per deal, one byte per tablebase_index. Only one deal of a pair of mirror deals need be stored: 0 for a draw or a position that cannot occur, otherwise
+                        the number of plies to the end of the game with best play, odd when the side to move wins
+
+    Methods:
+        probe(board)                    - Returns the stored byte for a Board or BitBoard, None if it is won or its deal or student count is not covered.
+                                          A deal missing from the file is probed through the mirror image when its mirror deal is there
+        close()                         - Unmaps the file
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_students, num_deals = TABLEBASE_HEADER.unpack_from(self.data, 0)
+        if magic != TABLEBASE_MAGIC: raise ValueError(f"{path} is not an Onitama tablebase")
+        self.configs = {config: num for num, config in enumerate(tablebase_student_configs(self.max_students))}
+        self.tables = dict(TABLEBASE_INDEX_ENTRY.unpack_from(self.data, TABLEBASE_HEADER.size + num*TABLEBASE_INDEX_ENTRY.size)
+                           for num in range(num_deals))
+
+    def probe(self, board):
+        if board.is_won(): return None # Only positions with both masters on the board and off the temples are stored
+        if isinstance(board, Board):
+            if board.student_counts[0] + board.student_counts[1] > self.max_students: return None
+            positions = board.positions
+            red_master, blue_master = coords_to_square(positions[0]), coords_to_square(positions[5])
+            red_students = sum(1 << coords_to_square(position) for position in positions[1:5] if position is not None)
+            blue_students = sum(1 << coords_to_square(position) for position in positions[6:10] if position is not None)
+        else:
+            red_students, red_master, blue_students, blue_master = board.pieces
+            if red_students.bit_count() + blue_students.bit_count() > self.max_students: return None
+            red_master, blue_master = red_master.bit_length() - 1, blue_master.bit_length() - 1
+
+        offset = self.tables.get(sum(1 << card for card in board.cards))
+        if offset is None:
+            # Only one deal of each mirror pair is stored
+            if sum(1 << MIRROR_CARD[card] for card in board.cards) not in self.tables: return None
+            return self.probe(board.mirror())
+        deal = sorted(board.cards)
+        arrangement = TABLEBASE_ARRANGEMENT_INDEX[(1 << deal.index(board.cards[0]) | 1 << deal.index(board.cards[1]), deal.index(board.cards[4]))]
+        config = self.configs[(red_students, blue_students)]
+        return self.data[offset + tablebase_index(board.turn % 2, arrangement, config, red_master, blue_master, len(self.configs))]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+# Endgame tablebase written by tablebase.py, probed by the search when the file exists
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebase.bin")
+TABLEBASE = Tablebase(TABLEBASE_PATH) if os.path.exists(TABLEBASE_PATH) else None
+
+# Returns the search score of a tablebase entry for board: won and lost positions score as 1000 and -1000 do in search
+def tablebase_score(board, plies):
+    if plies == 0: return 0
+    return 1000 if (plies % 2 == 1) == (board.turn % 2 == 0) else -1000
+
+# Returns (move, evaluation, plies to the end of the game) for a position in the tablebase, None if it is not covered.
+# Won positions are played towards the quickest win, lost ones towards the slowest loss, drawn ones to stay drawn
+def request_tablebase_move(board):
+    if TABLEBASE is None: return None
+    plies = TABLEBASE.probe(board)
+    if plies is None: return None
+
+    board = board.copy()
+    outcomes = []
+    for move in board.possible_moves():
+        undo = board.make_move(move)
+        if board.is_won(): outcome = (1, 1) # Won by this move
+        else:
+            reply = TABLEBASE.probe(board) # Fewer or as many students, so covered too
+            if reply == 0: outcome = (0, 0)
+            elif reply % 2 == 0: outcome = (1, reply + 1)
+            else: outcome = (-1, reply + 1)
+        board.unmake_move(move, undo)
+        outcomes.append((move, outcome))
+
+    def preference(outcome):
+        result, distance = outcome
+        return (result, -distance if result == 1 else distance)
+
+    best = max(preference(outcome) for move, outcome in outcomes)
+    return random.choice([move for move, outcome in outcomes if preference(outcome) == best]), tablebase_score(board, plies), plies
+
+BOOK_MAGIC = b'ONIBK2'
+BOOK_HEADER = struct.Struct('<6sxxQ')
+BOOK_ENTRY = struct.Struct('<QHhBxxx')
+
+class OpeningBook:
+    '''
+    OpeningBook class reads an opening book written by book.py. The file is opened with mmap and searched by bisection.
+
+    File layout, little-endian:
+        header          magic b'ONIBK2', 2 pad bytes, uint64 number of entries
+        entries         16 bytes each, sorted by key: uint64 key from Board.canonical, uint16 move as packed by encode_move,
+                        int16 score, uint8 search depth, 3 pad bytes. A position has one entry per move tied for best.
+                        A position and its mirror image share entries, whose moves are those of the position with the lower key
+
+    Methods:
+        probe(key)                      - Returns a list of (move, score, depth) stored for a key, empty if there are none
+        close()                         - Unmaps the file
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_entries = BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC: raise ValueError(f"{path} is not an Onitama opening book")
+
+    def key(self, num):
+        return struct.unpack_from('<Q', self.data, BOOK_HEADER.size + num*BOOK_ENTRY.size)[0]
+
+    def probe(self, key):
+        low, high = 0, self.num_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key: low = middle + 1
+            else: high = middle
+
+        entries = []
+        while low < self.num_entries and self.key(low) == key:
+            key, move, score, depth = BOOK_ENTRY.unpack_from(self.data, BOOK_HEADER.size + low*BOOK_ENTRY.size)
+            entries.append((decode_move(move), score, depth))
+            low += 1
+        return entries
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+# Opening book written by book.py, consulted before searching when the file exists
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+BOOK = OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+
+# Returns (move, evaluation, depth) from the opening book, a random choice among the moves stored as tied for best,
+# or None if the position is not in the book
+def request_book_move(board):
+    if BOOK is None or not isinstance(board, Board): return None
+    possible_moves = board.possible_moves()
+    key, mirrored = board.canonical()
+    entries = [(mirror_move(move) if mirrored else move, score, depth) for move, score, depth in BOOK.probe(key)]
+    entries = [entry for entry in entries if entry[0] in possible_moves] # Guards against key collisions
+    if not entries: return None
+    return random.choice(entries)
+
+# Moves the stored best move to the front of a move list
+def order_tt_move(possible_moves, tt_move):
+    if tt_move is None or len(possible_moves) < 2 or tt_move not in possible_moves: return possible_moves
+    possible_moves.remove(tt_move)
+    possible_moves.insert(0, tt_move)
+    return possible_moves
+
+# Killer moves and history heuristic ordering of quiet moves, used by the bot modes
+KILLER_MOVES = True
+HISTORY_HEURISTIC = True
+
+class MoveOrdering:
+    '''
+    MoveOrdering class holds the killer moves and history table of one search, used to order quiet moves.
+
+    Killer moves are the last two quiet moves per ply that caused a beta cutoff. The history table scores quiet
+    moves, keyed by (piece square, destination, card), by the sum of depth squared over the cutoffs they caused.
+    Both are only updated on beta cutoffs. Captures stay first, in generation order.
+
+    Methods:
+        order(board, possible_moves, ply) - Returns possible_moves with quiet moves ordered by killers, then history
+        cutoff(board, move, depth, ply) - Records a quiet move that caused a beta cutoff
+    '''
+
+    def __init__(self, killers=None, history=None):
+        self.killers = [[] for ply in range(64)] if (KILLER_MOVES if killers is None else killers) else None
+        self.history = {} if (HISTORY_HEURISTIC if history is None else history) else None
+
+    def order(self, board, possible_moves, ply):
+        if len(possible_moves) < 2: return possible_moves
+
+        # The generators put captures first
+        num_captures = 0
+        while num_captures < len(possible_moves) and board.is_capture(possible_moves[num_captures]): num_captures += 1
+        quiet_moves = possible_moves[num_captures:]
+
+        if self.history:
+            history = self.history
+            quiet_moves.sort(key=lambda move: history.get(move, 0), reverse=True)
+        if self.killers is not None:
+            for killer in reversed(self.killers[ply]):
+                if killer in quiet_moves:
+                    quiet_moves.remove(killer)
+                    quiet_moves.insert(0, killer)
+
+        return possible_moves[:num_captures] + quiet_moves
+
+    def cutoff(self, board, move, depth, ply):
+        if board.is_capture(move): return
+        if self.killers is not None:
+            killers = self.killers[ply]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+        if self.history is not None: self.history[move] = self.history.get(move, 0) + depth*depth
+
+# Returns the MoveOrdering for a new search, None when KILLER_MOVES and HISTORY_HEURISTIC are both off
+def new_move_ordering():
+    return MoveOrdering() if KILLER_MOVES or HISTORY_HEURISTIC else None
+
+# Deepest iteration of the time-limited search
+MAX_DEPTH = 30
+
+# Per-move time budget of the bot modes, in milliseconds
+MOVE_TIME = 2000
+
+# Raised inside recursive_search when the search deadline passes
+class SearchTimeout(Exception):
+    pass
+
+class SearchStats:
+    '''
+    SearchStats class collects the telemetry of one bot move. It is passed down recursive_search; worker processes
+    fill their own and return them to be merged into the parent's.
+
+    Attributes:
+        nodes                           - Positions generated by the search, indexed by ply from the root
+        cutoffs                         - Beta cutoffs, indexed by the position in the move order of the move that caused them
+        leaf_evaluations                - Positions scored by evaluate_position or evaluate_positions
+        tablebase_hits                  - Positions scored by the endgame tablebase
+        book_hits                       - Moves played from the opening book
+        tt_probes, tt_hits              - Transposition table probes, and the probes that found an entry
+        iterations                      - A dictionary per search iteration: depth, nodes, seconds, evaluation, move, completed
+
+    Methods:
+        total_nodes()                   - Returns the number of positions generated
+        branching_factor()              - Returns the effective branching factor of the last completed iteration
+        tt_hit_rate()                   - Returns the fraction of probes that found an entry
+        merge(other)                    - Adds the counters of another SearchStats into this one
+        record_iteration(...)           - Appends an iteration, counting the nodes generated since the previous one
+        to_dict()                       - Returns the statistics as a JSON-serialisable dictionary
+    '''
+
+    def __init__(self):
+        self.nodes = [0]*64
+        self.cutoffs = [0]*64
+        self.leaf_evaluations = 0
+        self.tablebase_hits = 0
+        self.book_hits = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.iterations = []
+
+    def total_nodes(self):
+        return sum(self.nodes)
+
+    def branching_factor(self):
+        completed = [iteration for iteration in self.iterations if iteration["completed"] and iteration["nodes"]]
+        if len(completed) >= 2: return completed[-1]["nodes"] / completed[-2]["nodes"]
+        if completed: return completed[-1]["nodes"] ** (1/completed[-1]["depth"])
+        return 0.0
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def merge(self, other):
+        self.nodes = [nodes + other_nodes for nodes, other_nodes in zip(self.nodes, other.nodes)]
+        self.cutoffs = [cutoffs + other_cutoffs for cutoffs, other_cutoffs in zip(self.cutoffs, other.cutoffs)]
+        self.leaf_evaluations += other.leaf_evaluations
+        self.tablebase_hits += other.tablebase_hits
+        self.book_hits += other.book_hits
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+
+    def record_iteration(self, depth, seconds, evaluation=None, move=None, completed=True):
+        nodes = self.total_nodes() - sum(iteration["nodes"] for iteration in self.iterations)
+        self.iterations.append({"depth": depth, "nodes": nodes, "seconds": round(seconds, 4), "evaluation": evaluation,
+                                "move": None if move is None else move_notation(move), "completed": completed})
+
+    def to_dict(self):
+        cutoffs = sum(self.cutoffs)
+        last_ply = max((ply for ply, nodes in enumerate(self.nodes) if nodes), default=0)
+        last_cutoff = max((index for index, count in enumerate(self.cutoffs) if count), default=-1)
+        return {
+            "nodes": self.total_nodes(),
+            "nodes_per_ply": self.nodes[:last_ply + 1],
+            "cutoffs": cutoffs,
+            "cutoffs_by_move_index": self.cutoffs[:last_cutoff + 1],
+            "first_move_cutoff_rate": round(self.cutoffs[0] / cutoffs, 4) if cutoffs else None,
+            "branching_factor": round(self.branching_factor(), 3),
+            "leaf_evaluations": self.leaf_evaluations,
+            "tablebase_hits": self.tablebase_hits,
+            "book_hits": self.book_hits,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "iterations": self.iterations,
+        }
+
+# File every bot move's SearchStats are appended to as a line of JSON, None to not record them.
+# Off unless the ONITAMA_SEARCH_STATS_LOG environment variable names a file
+SEARCH_STATS_LOG = os.environ.get("ONITAMA_SEARCH_STATS_LOG") or None
+
+# Appends stats, with fields describing the move, to SEARCH_STATS_LOG
+def emit_search_stats(stats, **fields):
+    if SEARCH_STATS_LOG is None: return
+    with open(SEARCH_STATS_LOG, "a") as log_file:
+        log_file.write(json.dumps(dict(fields, **stats.to_dict())) + "\n")
+
+# Worker processes used by the bot modes to search root moves in parallel, None to search serially
+SEARCH_WORKERS = None
+
+# Principal variation search: moves after the first are searched with a null window, and again only if they beat it
+PRINCIPAL_VARIATION_SEARCH = True
+
+# Half-width of the root window around the previous iteration's score, None to search every iteration with the full window
+ASPIRATION_WINDOW = 50
+
+# Returns (move, evaluation, depth). Searches to a fixed depth (DEPTH by default), or when given a time_limit in
+# milliseconds deepens one ply at a time until it runs out and returns the deepest completed result.
+# Given a number of workers, root moves are split across a pool of that many processes.
+# Given a SearchStats, the search records its telemetry there.
+# Positions covered by the endgame tablebase return its move, with the plies to the end of the game as depth,
+# and positions in the opening book return a book move with the depth it was searched to
+def request_simple_search_bot_move(board, tt=None, depth=None, time_limit=None, workers=None, stats=None):
+
+    if stats is None: stats = SearchStats()
+
+    # Positions in the endgame tablebase are played from it without searching
+    result = request_tablebase_move(board)
+    if result is not None:
+        stats.tablebase_hits += 1
+        stats.record_iteration(result[2], 0, result[1], result[0])
+        return result
+    result = request_book_move(board)
+    if result is not None:
+        stats.book_hits += 1
+        stats.record_iteration(result[2], 0, result[1], result[0])
+        return result
+
+    if tt is not None: probes, hits = tt.probes, tt.hits
+    ordering = new_move_ordering() # Kept across iterations
+
+    def search_root(board, depth, tt=None, deadline=None, first_move=None, aspiration=None):
+        start_time = time.time()
+        try:
+            if workers is None: move, evaluation = serial_search_root(board, depth, tt, deadline, first_move, stats, ordering, aspiration)
+            else: move, evaluation = parallel_search_root(board, depth, tt, deadline, first_move, workers, stats)
+        except SearchTimeout:
+            stats.record_iteration(depth, time.time() - start_time, completed=False)
+            raise
+        stats.record_iteration(depth, time.time() - start_time, evaluation, move)
+        return move, evaluation
+
+    if time_limit is None:
+        move, evaluation = search_root(board, depth or DEPTH, tt)
+        completed_depth = depth or DEPTH
 
+    else:
+        deadline = time.time() + time_limit/1000
+        move = None
+
+        # Depths 1 and 2 search the same two plies, so start at 2. The first iteration always completes
+        for iteration_depth in range(2, max(2, depth or MAX_DEPTH) + 1):
+            try:
+                result = search_root(board, iteration_depth, tt, None if move is None else deadline, move, None if move is None else evaluation)
+            except SearchTimeout:
+                break
+            move, evaluation = result
+            completed_depth = iteration_depth
+            if abs(evaluation) == 1000 or time.time() > deadline: break # Won or lost by force, deeper search changes nothing
+
+    if tt is not None:
+        stats.tt_probes += tt.probes - probes
+        stats.tt_hits += tt.hits - hits
+    return move, evaluation, completed_depth
+
+# Searches every root move to depth, returns a random choice among the best (move, evaluation) pairs.
+# first_move, if given, is searched first, ahead of the transposition table move.
+# The window narrows as the root is searched: each move is searched with its lower bound (upper bound for BLUE) one
+# below the best score so far, as in _search_root_move, so worse moves are cut off while moves that tie with the best
+# still get exact scores and the random choice among them is kept.
+# Given the previous iteration's score as aspiration, root moves are searched with a window of ASPIRATION_WINDOW
+# either side of it. Moves that fail high are re-searched with the window opened on that side, so every move that can
+# tie for best has an exact score, and the whole root is re-searched when every move fails low. stop is passed to recursive_search
+def serial_search_root(board, depth, tt=None, deadline=None, first_move=None, stats=None, ordering=None, aspiration=None, stop=None):
+
+    if stats is None: stats = SearchStats()
+    board = board.copy() # The search runs on one mutable board, which a timeout leaves mid-search
     possible_moves = board.possible_moves_search_optimised()
-    evaluations = []
+
+    if aspiration is None or ASPIRATION_WINDOW is None: alpha, beta = -1000, 1000
+    else: alpha, beta = max(-1000, aspiration - ASPIRATION_WINDOW), min(1000, aspiration + ASPIRATION_WINDOW)
+
+    if tt is not None:
+        key, mirrored = tt_key(board)
+        entry = tt.probe(key)
+        if entry: possible_moves = order_tt_move(possible_moves, table_move(board, entry[3], mirrored))
+    possible_moves = order_tt_move(possible_moves, first_move)
 
     if board.turn_colour_num() == 0:
+        best, best_moves = -1001, []
         for move in possible_moves:
-            simulation_board = board.copy()
-            simulation_board.execute_move(move)
-            try: 
-                if simulation_board.is_won()[0] == 'RED': return move, 1000
-            except: pass
-            evaluations.append(recursive_search(simulation_board, DEPTH-1, -1000, 1000))
-        
-        return random.sample([(possible_moves[idx], evaluation) for idx, evaluation in enumerate(evaluations) if evaluation == max(evaluations)],1)[0]
-    
+            undo = board.make_move(move)
+            stats.nodes[1] += 1
+            if board.is_won(): return move, 1000
+            floor = max(alpha, best-1)
+            evaluation = recursive_search(board, depth-1, floor, beta, tt, deadline, stats, 1, ordering, stop)
+            if evaluation >= beta and beta < 1000:
+                beta = 1000 # The best score is above the aspiration window, so later moves are searched up to a win
+                evaluation = recursive_search(board, depth-1, floor, beta, tt, deadline, stats, 1, ordering, stop)
+            board.unmake_move(move, undo)
+            if evaluation > best: best, best_moves = evaluation, [move]
+            elif evaluation == best: best_moves.append(move)
+
+        if best <= alpha and alpha > -1000: return serial_search_root(board, depth, tt, deadline, first_move, stats, ordering, stop=stop)
+
     else:
+        best, best_moves = 1001, []
         for move in possible_moves:
-            simulation_board = board.copy()
-            simulation_board.execute_move(move)
-            try: 
-                if simulation_board.is_won()[0] == 'BLUE': return move, -1000
-            except: pass
-            evaluations.append(recursive_search(simulation_board, DEPTH-1, -1000, 1000))
-        
-        return random.sample([(possible_moves[idx], evaluation) for idx, evaluation in enumerate(evaluations) if evaluation == min(evaluations)],1)[0]
+            undo = board.make_move(move)
+            stats.nodes[1] += 1
+            if board.is_won(): return move, -1000
+            ceiling = min(beta, best+1)
+            evaluation = recursive_search(board, depth-1, alpha, ceiling, tt, deadline, stats, 1, ordering, stop)
+            if evaluation <= alpha and alpha > -1000:
+                alpha = -1000 # The best score is below the aspiration window, so later moves are searched down to a loss
+                evaluation = recursive_search(board, depth-1, alpha, ceiling, tt, deadline, stats, 1, ordering, stop)
+            board.unmake_move(move, undo)
+            if evaluation < best: best, best_moves = evaluation, [move]
+            elif evaluation == best: best_moves.append(move)
+
+        if best >= beta and beta < 1000: return serial_search_root(board, depth, tt, deadline, first_move, stats, ordering, stop=stop)
+
+    result = (random.choice(best_moves), best)
+    if tt is not None: tt.store(key, depth, EXACT, result[1], mirror_move(result[0]) if mirrored else result[0])
+    return result
+
+# Returns the line of moves stored in the transposition table from board, at most length moves long.
+# Entries can be overwritten by later searches, so the line may stop short of the searched depth
+def principal_variation(board, tt, length):
+    if tt is None: return []
+    board = board.copy()
+    line = []
+    while len(line) < length and not board.is_won():
+        key, mirrored = tt_key(board)
+        entry = tt.probe(key)
+        move = entry and table_move(board, entry[3], mirrored)
+        if not move or move not in board.possible_moves(): break # Guards against key collisions
+        board.make_move(move)
+        line.append(move)
+    return line
+
+# Searches every root move to depth, returns the best num_lines (move, evaluation, principal variation) triples,
+# best first, each with an exact score. Each move is searched with a window that only cuts off moves which cannot
+# enter the lines kept so far. Moves that tie keep the order they were searched in
+def multi_pv_search_root(board, depth, num_lines, tt=None, deadline=None, first_moves=(), stats=None, ordering=None):
+
+    if num_lines < 1: raise ValueError("num_lines must be at least 1")
+    if stats is None: stats = SearchStats()
+    board = board.copy()
+    possible_moves = board.possible_moves_search_optimised()
 
-def recursive_search(board, depth, alpha, beta):
-    global EXPANSION_COUNT
+    if tt is not None:
+        key, mirrored = tt_key(board)
+        entry = tt.probe(key)
+        if entry: possible_moves = order_tt_move(possible_moves, table_move(board, entry[3], mirrored))
+    for move in reversed(first_moves): possible_moves = order_tt_move(possible_moves, move)
+
+    sign = 1 if board.turn_colour_num() == 0 else -1
+    lines = []
+    for move in possible_moves:
+        worst = sign*lines[-1][1] if len(lines) == num_lines else -1001 # Score to beat, for the side to move
+        undo = board.make_move(move)
+        stats.nodes[1] += 1
+        if board.is_won(): evaluation, line = 1000*sign, [move]
+        else:
+            if sign == 1: evaluation = recursive_search(board, depth-1, max(-1000, worst), 1000, tt, deadline, stats, 1, ordering)
+            else: evaluation = recursive_search(board, depth-1, -1000, min(1000, -worst), tt, deadline, stats, 1, ordering)
+            line = [move] + principal_variation(board, tt, depth-1)
+        board.unmake_move(move, undo)
+        if sign*evaluation > worst:
+            lines.append((move, evaluation, line))
+            lines.sort(key=lambda line: -sign*line[1])
+            del lines[num_lines:]
+
+    if tt is not None: tt.store(key, depth, EXACT, lines[0][1], mirror_move(lines[0][0]) if mirrored else lines[0][0])
+    return lines
+
+# Returns (lines, depth): the best num_lines (move, evaluation, principal variation) triples for board, best first,
+# from a search to depth or, given time_limit in milliseconds, from the deepest iteration completed in time
+def request_multi_pv_analysis(board, num_lines, tt=None, depth=None, time_limit=None, stats=None):
+
+    if stats is None: stats = SearchStats()
+    if tt is not None: probes, hits = tt.probes, tt.hits
+    ordering = new_move_ordering()
+    deadline = None if time_limit is None else time.time() + time_limit/1000
+    lines = None
+
+    # Depths 1 and 2 search the same two plies, so deepening starts at 2. The first iteration always completes
+    depths = [depth or DEPTH] if time_limit is None else range(2, max(2, depth or MAX_DEPTH) + 1)
+    for iteration_depth in depths:
+        start_time = time.time()
+        try:
+            result = multi_pv_search_root(board, iteration_depth, num_lines, tt, lines and deadline, [line[0] for line in lines or ()], stats, ordering)
+        except SearchTimeout:
+            stats.record_iteration(iteration_depth, time.time() - start_time, completed=False)
+            break
+        lines, completed_depth = result, iteration_depth
+        stats.record_iteration(iteration_depth, time.time() - start_time, lines[0][1], lines[0][0])
+        if deadline is not None and time.time() > deadline: break
+
+    if tt is not None:
+        stats.tt_probes += tt.probes - probes
+        stats.tt_hits += tt.hits - hits
+    return lines, completed_depth
+
+# Persistent pool for parallel_search_root, and the best root score found so far, shared with its workers.
+# The score is from the point of view of the side to move at the root, so higher is always better
+_search_pool = None
+_search_pool_workers = None
+_search_bound = None
+_worker_tt = None
+
+def get_search_pool(workers):
+    global _search_pool, _search_pool_workers, _search_bound
+    if _search_pool is None or _search_pool_workers != workers:
+        shutdown_search_pool()
+        _search_bound = multiprocessing.Value('i', -1001)
+        _search_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker, initargs=(_search_bound,))
+        _search_pool_workers = workers
+    return _search_pool
+
+def shutdown_search_pool():
+    global _search_pool, _search_pool_workers
+    if _search_pool is not None: _search_pool.shutdown(cancel_futures=True)
+    _search_pool = None
+    _search_pool_workers = None
+
+def _init_search_worker(bound):
+    global _search_bound, _worker_tt
+    _search_bound = bound
+    _worker_tt = TranspositionTable()
+
+# Runs in a worker process. Searches one root move, narrowing the window to the best score found so far by any worker.
+# The window stops one below that score, so moves that tie with the best still get exact scores.
+# Returns the score and the SearchStats of the search
+def _search_root_move(board, move, depth, deadline):
+    stats = SearchStats()
+    probes, hits = _worker_tt.probes, _worker_tt.hits
+    sign = 1 if board.turn_colour_num() == 0 else -1
+
+    board.make_move(move)
+    best = _search_bound.value
+    ordering = new_move_ordering()
+    if sign == 1: result = recursive_search(board, depth-1, max(-1000, best-1), 1000, _worker_tt, deadline, stats, 1, ordering)
+    else: result = recursive_search(board, depth-1, -1000, min(1000, 1-best), _worker_tt, deadline, stats, 1, ordering)
+
+    with _search_bound.get_lock():
+        if sign*result > _search_bound.value: _search_bound.value = sign*result
+    stats.tt_probes = _worker_tt.probes - probes
+    stats.tt_hits = _worker_tt.hits - hits
+    return result, stats
+
+# As serial_search_root, with root moves searched by a persistent pool of worker processes
+def parallel_search_root(board, depth, tt=None, deadline=None, first_move=None, workers=None, stats=None):
+
+    if stats is None: stats = SearchStats()
+    pool = get_search_pool(workers)
+    board = board.copy()
+    possible_moves = board.possible_moves_search_optimised()
+
+    if tt is not None:
+        key, mirrored = tt_key(board)
+        entry = tt.probe(key)
+        if entry: possible_moves = order_tt_move(possible_moves, table_move(board, entry[3], mirrored))
+    possible_moves = order_tt_move(possible_moves, first_move)
+
+    sign = 1 if board.turn_colour_num() == 0 else -1
+    for move in possible_moves:
+        undo = board.make_move(move)
+        won = board.is_won()
+        board.unmake_move(move, undo)
+        if won:
+            stats.nodes[1] += 1
+            return move, 1000*sign
+
+    _search_bound.value = -1001
+    futures = [pool.submit(_search_root_move, board, move, depth, deadline) for move in possible_moves]
+    try:
+        results = [future.result() for future in futures]
+    except SearchTimeout:
+        for future in futures: future.cancel()
+        raise
+
+    evaluations = [evaluation for evaluation, worker_stats in results]
+    stats.nodes[1] += len(possible_moves)
+    for evaluation, worker_stats in results: stats.merge(worker_stats)
+    best = max(evaluations) if sign == 1 else min(evaluations)
+    result = random.sample([(possible_moves[idx], evaluation) for idx, evaluation in enumerate(evaluations) if evaluation == best],1)[0]
+
+    if tt is not None: tt.store(key, depth, EXACT, result[1], mirror_move(result[0]) if mirrored else result[0])
+    return result
+
+# Persistent pool for the Lazy SMP engine, and the transposition table its workers share
+_smp_pool = None
+_smp_pool_workers = None
+_smp_tt = None
+
+def get_smp_pool(workers):
+    global _smp_pool, _smp_pool_workers, _smp_tt
+    if _smp_pool is None or _smp_pool_workers != workers:
+        shutdown_smp_pool()
+        _smp_tt = SharedTranspositionTable(TT_MEMORY_MB)
+        _smp_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_smp_worker, initargs=(_smp_tt,))
+        _smp_pool_workers = workers
+    return _smp_pool
+
+def shutdown_smp_pool():
+    global _smp_pool, _smp_pool_workers, _smp_tt
+    if _smp_pool is not None: _smp_pool.shutdown(cancel_futures=True)
+    if _smp_tt is not None: _smp_tt.close()
+    _smp_pool = None
+    _smp_pool_workers = None
+    _smp_tt = None
+
+def _init_smp_worker(tt):
+    global _worker_tt
+    _worker_tt = tt
+
+# Runs in a worker process. Deepens iteratively on the shared table like request_simple_search_bot_move.
+# Worker 0 searches as the serial engine does. Helpers start a ply deeper on odd workers and search a
+# random root move first, so that workers fill the shared table with different parts of the tree
+def _lazy_smp_worker(board, worker, depth, deadline, seed):
+    stats = SearchStats()
+    _worker_tt.reset_stats()
+    random.seed(seed)
+
+    first_move = random.choice(board.possible_moves_search_optimised()) if worker else None
+    ordering = new_move_ordering()
+    result = None
+    for iteration_depth in range(2 + worker % 2, max(2, depth) + 1):
+        start_time = time.time()
+        try:
+            # Only worker 0 is guaranteed to complete its first iteration
+            move, evaluation = serial_search_root(board, iteration_depth, _worker_tt, deadline if worker or result else None, first_move, stats, ordering,
+                                                  None if result is None else result[1])
+        except SearchTimeout:
+            stats.record_iteration(iteration_depth, time.time() - start_time, completed=False)
+            break
+        stats.record_iteration(iteration_depth, time.time() - start_time, evaluation, move)
+        result = (move, evaluation, iteration_depth)
+        first_move = move
+        if abs(evaluation) == 1000 or (deadline is not None and time.time() > deadline): break
+
+    stats.tt_probes = _worker_tt.probes
+    stats.tt_hits = _worker_tt.hits
+    return result, stats
+
+# Returns (move, evaluation, depth) from a Lazy SMP search: workers processes search the same root on one shared
+# transposition table, to a fixed depth (DEPTH by default) or until time_limit milliseconds pass.
+# The deepest completed result is returned, worker 0's when several reach the same depth.
+# Given a SearchStats, the counters of all workers are merged into it, with worker 0's iterations
+def request_lazy_smp_bot_move(board, depth=None, time_limit=None, workers=None, stats=None):
+
+    if stats is None: stats = SearchStats()
+    result = request_tablebase_move(board)
+    if result is not None:
+        stats.tablebase_hits += 1
+        return result
+    result = request_book_move(board)
+    if result is not None:
+        stats.book_hits += 1
+        return result
+
+    workers = workers or os.cpu_count()
+    pool = get_smp_pool(workers)
+    deadline = None if time_limit is None else time.time() + time_limit/1000
+    depth = depth or (DEPTH if time_limit is None else MAX_DEPTH)
+
+    futures = [pool.submit(_lazy_smp_worker, board, worker, depth, deadline, random.getrandbits(32)) for worker in range(workers)]
+    results = [future.result() for future in futures]
+
+    for result, worker_stats in results: stats.merge(worker_stats)
+    stats.iterations = results[0][1].iterations
+
+    completed = [result for result, worker_stats in results if result is not None]
+    return max(completed, key=lambda result: result[2]) # max keeps the first, i.e. lowest worker, among equals
+
+# Memory budget of an MCTS tree, exploration constant of UCT, and positions handed to the playout workers at once
+MCTS_MEMORY_MB = 64
+MCTS_EXPLORATION = 1.4
+MCTS_BATCH = 32
+
+# Random moves a playout plays before it is scored by evaluate_position, through a logistic of this scale
+PLAYOUT_PLIES = 4
+PLAYOUT_EVAL_SCALE = 200
+
+# Plays request_random_bot_move for both sides from board until the game ends or PLAYOUT_PLIES pass.
+# Returns the result for RED: 1 for a win, 0 for a loss, and between them by evaluate_position for an unfinished game
+def playout(board):
+    for ply in range(PLAYOUT_PLIES):
+        victory_type = board.is_won()
+        if victory_type: return 1.0 if victory_type[0] == "RED" else 0.0
+        board.make_move(request_random_bot_move(board))
+    evaluation = board.evaluate_position()
+    if abs(evaluation) == 1000: return 1.0 if evaluation > 0 else 0.0
+    return 1 / (1 + math.exp(-evaluation / PLAYOUT_EVAL_SCALE))
+
+# Runs in a worker process. Returns the result of one playout from each (turn, positions, cards) leaf
+def _mcts_playouts(leaves, seed):
+    random.seed(seed)
+    return [playout(Board(turn, list(positions), list(cards))) for turn, positions, cards in leaves]
+
+# Persistent pool for MCTS playouts
+_mcts_pool = None
+_mcts_pool_workers = None
+
+def get_mcts_pool(workers):
+    global _mcts_pool, _mcts_pool_workers
+    if _mcts_pool is None or _mcts_pool_workers != workers:
+        shutdown_mcts_pool()
+        _mcts_pool = ProcessPoolExecutor(max_workers=workers)
+        _mcts_pool_workers = workers
+    return _mcts_pool
+
+def shutdown_mcts_pool():
+    global _mcts_pool, _mcts_pool_workers
+    if _mcts_pool is not None: _mcts_pool.shutdown(cancel_futures=True)
+    _mcts_pool = None
+    _mcts_pool_workers = None
+
+class MCTSTree:
+    '''
+    MCTSTree class is a Monte Carlo search tree held in flat arrays, one entry per node, rather than a Python object per node.
+    A node's children are stored next to each other, so a node holds the index of its first child and their number.
+    Visits and wins are counted for the side that played the move into the node; a playout adds its result for that side
+    to wins, between 0 and 1. The tree holds at most as many nodes as fit in memory_mb, and stops expanding when full.
+
+    Node arrays:
+        parent                          - Index of the parent node, -1 for the root
+        first_child, num_children       - Children of an expanded node, first_child is -1 until the node is expanded
+        move                            - Move into the node, as packed by encode_move
+        visits, wins                    - Playouts through the node, and their results for the side that moved into it
+        terminal                        - 1 if the move into the node wins the game
+
+    Methods:
+        sync(board)                     - Moves the root to board, keeping the subtree when board is a child or grandchild of the root
+        search(deadline, iterations, workers, batch, stats) - Runs playouts until the deadline or the number of iterations
+        result()                        - Returns (move, evaluation, depth) for the most visited root move
+    '''
+
+    NODE_BYTES = 4 + 4 + 1 + 2 + 4 + 8 + 1
+
+    def __init__(self, board, memory_mb=MCTS_MEMORY_MB):
+        self.capacity = max(64, int(memory_mb * 2**20) // self.NODE_BYTES)
+        self.reset(board)
+
+    def allocate(self):
+        '''Returns empty node arrays (parent, first_child, num_children, move, visits, wins, terminal) of the tree's capacity.'''
+        capacity = self.capacity
+        return (array('i', [-1])*capacity, array('i', [-1])*capacity, array('B', bytes(capacity)), array('H', bytes(2*capacity)),
+                array('I', bytes(4*capacity)), array('d', bytes(8*capacity)), array('b', bytes(capacity)))
+
+    def reset(self, board):
+        self.board = board.copy()
+        self.parent, self.first_child, self.num_children, self.move, self.visits, self.wins, self.terminal = self.allocate()
+        self.size = 1
+        self.root = 0
+
+    def sync(self, board):
+        if board.zobrist == self.board.zobrist: return
+        # The position after one or two moves from the root: the bot's move, then the reply
+        for child in self.children(self.root):
+            child_move = decode_move(self.move[child])
+            child_undo = self.board.make_move(child_move)
+            if board.zobrist == self.board.zobrist: return self.advance(child)
+            for grandchild in self.children(child):
+                move = decode_move(self.move[grandchild])
+                undo = self.board.make_move(move)
+                if board.zobrist == self.board.zobrist: return self.advance(grandchild)
+                self.board.unmake_move(move, undo)
+            self.board.unmake_move(child_move, child_undo)
+        self.reset(board)
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.num_children[node]) if first >= 0 else range(0)
+
+    def advance(self, node):
+        '''Makes node, whose position self.board now holds, the root. The tree is compacted once it is half full.'''
+        self.root = node
+        self.parent[node] = -1
+        if self.size > self.capacity // 2: self.compact()
+
+    def compact(self):
+        '''Copies the subtree of the root to the front of fresh arrays, freeing the nodes outside it.'''
+        old = (self.parent, self.first_child, self.num_children, self.move, self.visits, self.wins, self.terminal)
+        new = self.allocate()
+        parent, first_child, num_children, move, visits, wins, terminal = new
+        for column in range(2, 7): new[column][0] = old[column][self.root]
+        size = 1
+        queue = [(self.root, 0)]
+        for old_node, node in queue:
+            count = old[2][old_node]
+            if old[1][old_node] < 0 or not count: continue
+            first_child[node] = size
+            for offset in range(count):
+                old_child = old[1][old_node] + offset
+                for column in range(2, 7): new[column][size + offset] = old[column][old_child]
+                parent[size + offset] = node
+                queue.append((old_child, size + offset))
+            size += count
+        self.parent, self.first_child, self.num_children, self.move, self.visits, self.wins, self.terminal = new
+        self.size = size
+        self.root = 0
+
+    def expand(self, node, board):
+        '''Adds the children of node, whose position is board. Returns False when the tree is full.'''
+        possible_moves = board.possible_moves()
+        if self.size + len(possible_moves) > self.capacity: return False
+        first = self.size
+        for offset, move in enumerate(possible_moves):
+            child = first + offset
+            undo = board.make_move(move)
+            self.terminal[child] = 1 if board.is_won() else 0
+            board.unmake_move(move, undo)
+            self.parent[child] = node
+            self.first_child[child] = -1
+            self.num_children[child] = 0
+            self.move[child] = encode_move(move)
+            self.visits[child] = 0
+            self.wins[child] = 0.0
+        self.num_children[node] = len(possible_moves)
+        self.first_child[node] = first
+        self.size += len(possible_moves)
+        return True
+
+    def select_child(self, node):
+        '''Returns the child of node with the highest UCT score: a winning move or an unvisited child first.'''
+        visits, wins = self.visits, self.wins
+        log_visits = math.log(max(1, visits[node]))
+        best, best_score = -1, -1.0
+        for child in self.children(node):
+            if self.terminal[child]: return child
+            if visits[child] == 0: return child
+            score = wins[child] / visits[child] + MCTS_EXPLORATION * math.sqrt(log_visits / visits[child])
+            if score > best_score: best, best_score = child, score
+        return best
+
+    def select(self, stats):
+        '''
+        Walks from the root to a leaf, expanding it once it has been visited, and adds a visit to every node on the way,
+        which counts as a loss until the playout result is added. Returns the path of nodes and the leaf position.
+        '''
+        board = self.board.copy()
+        node = self.root
+        path = [node]
+        self.visits[node] += 1
+        while not self.terminal[node]:
+            if self.first_child[node] < 0:
+                if node != self.root and self.visits[node] == 1: break # Play out from a new leaf before expanding it
+                if not self.expand(node, board): break
+                stats.nodes[min(len(path), len(stats.nodes) - 1)] += self.num_children[node] # Deeper plies count in the last entry
+            node = self.select_child(node)
+            board.make_move(decode_move(self.move[node]))
+            path.append(node)
+            self.visits[node] += 1
+        return path, board
+
+    def backpropagate(self, path, result):
+        '''Adds a playout result for RED to the nodes of path, each for the side that moved into it.'''
+        red_moves = self.board.turn % 2 == 0 # RED makes the move into the root's children
+        for node in path[1:]:
+            self.wins[node] += result if red_moves else 1 - result
+            red_moves = not red_moves
+
+    def search(self, deadline=None, iterations=None, workers=None, batch=MCTS_BATCH, stats=None):
+        if stats is None: stats = SearchStats()
+        pool = get_mcts_pool(workers) if workers else None
+        batch = batch if pool else 1
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.time() < deadline):
+            leaves = []
+            for num in range(batch if iterations is None else min(batch, iterations - done)):
+                path, board = self.select(stats)
+                if self.terminal[path[-1]]: self.backpropagate(path, 1.0 if board.is_won()[0] == "RED" else 0.0)
+                else: leaves.append((path, board))
+            done += batch if iterations is None else min(batch, iterations - done)
+
+            if pool is None: results = [playout(board) for path, board in leaves]
+            else:
+                chunk = max(1, -(-len(leaves) // workers))
+                futures = [pool.submit(_mcts_playouts, [(board.turn, board.positions, board.cards) for path, board in leaves[start:start+chunk]], random.getrandbits(32))
+                           for start in range(0, len(leaves), chunk)]
+                results = [result for future in futures for result in future.result()]
+            for (path, board), result in zip(leaves, results): self.backpropagate(path, result)
+            stats.leaf_evaluations += len(leaves)
+        return done
+
+    def result(self):
+        children = self.children(self.root)
+        if not children:
+            possible_moves = self.board.possible_moves()
+            return random.choice(possible_moves), 0, 0
+        best = max(children, key=lambda child: (self.terminal[child], self.visits[child]))
+        win_rate = 1.0 if self.terminal[best] else self.wins[best] / max(1, self.visits[best])
+        evaluation = round(1000*(2*win_rate - 1)) * (1 if self.board.turn % 2 == 0 else -1)
+
+        # Depth of the principal variation, following the most visited child
+        depth, node = 1, best
+        while self.first_child[node] >= 0 and self.visits[node] > 1:
+            node = max(self.children(node), key=lambda child: self.visits[child])
+            depth += 1
+        return decode_move(self.move[best]), evaluation, depth
+
+# Returns (move, evaluation, depth) from a Monte Carlo tree search of time_limit milliseconds, or of a number of iterations.
+# The evaluation is the win rate of the move on the minimax scale, +-1000 for a certain win, and the depth is that of the
+# most visited line. Given a tree from an earlier move, its subtree for board is kept. Given a number of workers, playouts
+# are run in batches of MCTS_BATCH leaves across a pool of that many processes
+def request_mcts_bot_move(board, tree=None, time_limit=None, iterations=None, workers=None, stats=None):
+
+    if stats is None: stats = SearchStats()
+    start_time = time.time()
+    if tree is None: tree = MCTSTree(board)
+    else: tree.sync(board)
+
+    # A winning move needs no search
+    for move in board.possible_moves_search_optimised():
+        undo = board.make_move(move)
+        won = board.is_won()
+        board.unmake_move(move, undo)
+        if won: return move, 1000 if board.turn % 2 == 0 else -1000, 1
+
+    deadline = None if time_limit is None else start_time + time_limit/1000
+    if deadline is None and iterations is None: iterations = 10000
+    tree.search(deadline, iterations, workers, stats=stats)
+    move, evaluation, depth = tree.result()
+    stats.record_iteration(depth, time.time() - start_time, evaluation, move)
+    return move, evaluation, depth
+
+# Returns the fail-soft alpha-beta score of board searched to depth. ply is the distance of board from the root.
+# Given a MoveOrdering, quiet moves are ordered by its killer moves and history table.
+# With PRINCIPAL_VARIATION_SEARCH, the first move is searched with the full window and the rest with a null window.
+# SearchTimeout is raised once the deadline passes, or once stop, a threading.Event, is set
+def recursive_search(board, depth, alpha, beta, tt=None, deadline=None, stats=None, ply=1, ordering=None, stop=None):
+
+    if stats is None: stats = SearchStats()
+    if deadline is not None and time.time() > deadline: raise SearchTimeout
+    if stop is not None and stop.is_set(): raise SearchTimeout
+
+    if TABLEBASE is not None:
+        plies = TABLEBASE.probe(board)
+        if plies is not None:
+            stats.tablebase_hits += 1
+            return tablebase_score(board, plies)
+
+    alpha_original, beta_original = alpha, beta
+    tt_move = None
+    if tt is not None:
+        key, mirrored = board.zobrist, False
+        if MIRROR_TT and board.mirror_zobrist < key: key, mirrored = board.mirror_zobrist, True
+        entry = tt.probe(key)
+        if entry:
+            entry_depth, bound, score, tt_move = entry
+            if entry_depth >= depth:
+                if bound == EXACT: return score
+                if bound == LOWER and score >= beta: return score
+                if bound == UPPER and score <= alpha: return score
+            tt_move = table_move(board, tt_move, mirrored)
 
     possible_moves = board.possible_moves_search_optimised()
+    if ordering is not None: possible_moves = ordering.order(board, possible_moves, ply)
+    if tt_move: possible_moves = order_tt_move(possible_moves, tt_move)
+    best_move = possible_moves[0]
 
-    if board.turn_colour_num() == 0:
-        eval_to_beat = -1000
+    if depth <= 1 and BATCH_LEAF_EVAL:
+        # Every child is a leaf: score them all in one call. There is no cutoff, so every child counts as expanded
+        rows = []
         for move in possible_moves:
-            simulation_board = board.copy()
-            simulation_board.execute_move(move)
-            EXPANSION_COUNT += 1
-            result = simulation_board.evaluate_position() if (depth <= 1 or simulation_board.is_won()) else recursive_search(simulation_board, depth-1, alpha, beta)
-            eval_to_beat = max(eval_to_beat, result)
-            if eval_to_beat >= beta: break
+            undo = board.make_move(move)
+            rows.append(board.batch_row())
+            board.unmake_move(move, undo)
+        stats.nodes[ply+1] += len(possible_moves)
+        stats.leaf_evaluations += len(possible_moves)
+        evaluations = evaluate_positions(rows).tolist()
+        eval_to_beat = max(evaluations) if board.turn_colour_num() == 0 else min(evaluations)
+        best_move = possible_moves[evaluations.index(eval_to_beat)]
+
+    elif board.turn_colour_num() == 0:
+        eval_to_beat = -1000
+        leaves = 0
+        for index, move in enumerate(possible_moves):
+            undo = board.make_move(move)
+            if depth <= 1 or board.is_won():
+                result = board.evaluate_position()
+                leaves += 1
+            elif index == 0 or not PRINCIPAL_VARIATION_SEARCH: result = recursive_search(board, depth-1, alpha, beta, tt, deadline, stats, ply+1, ordering, stop)
+            else:
+                # Null window: only a move that beats alpha is searched again with the full window
+                result = recursive_search(board, depth-1, alpha, alpha+1, tt, deadline, stats, ply+1, ordering, stop)
+                if alpha < result < beta: result = recursive_search(board, depth-1, alpha, beta, tt, deadline, stats, ply+1, ordering, stop)
+            board.unmake_move(move, undo)
+            if result > eval_to_beat: eval_to_beat, best_move = result, move
+            if eval_to_beat >= beta:
+                stats.cutoffs[index] += 1
+                if ordering is not None: ordering.cutoff(board, move, depth, ply)
+                break
             alpha = max(alpha, eval_to_beat)
+        stats.nodes[ply+1] += index + 1
+        stats.leaf_evaluations += leaves
 
     else:
         eval_to_beat = 1000
-        for move in possible_moves:
-            simulation_board = board.copy()
-            simulation_board.execute_move(move)
-            EXPANSION_COUNT += 1
-            result = simulation_board.evaluate_position() if (depth <= 1 or simulation_board.is_won()) else recursive_search(simulation_board, depth-1, alpha, beta)
-            eval_to_beat = min(eval_to_beat, result)
-            if eval_to_beat <= alpha: break
+        leaves = 0
+        for index, move in enumerate(possible_moves):
+            undo = board.make_move(move)
+            if depth <= 1 or board.is_won():
+                result = board.evaluate_position()
+                leaves += 1
+            elif index == 0 or not PRINCIPAL_VARIATION_SEARCH: result = recursive_search(board, depth-1, alpha, beta, tt, deadline, stats, ply+1, ordering, stop)
+            else:
+                # Null window: only a move that beats beta is searched again with the full window
+                result = recursive_search(board, depth-1, beta-1, beta, tt, deadline, stats, ply+1, ordering, stop)
+                if alpha < result < beta: result = recursive_search(board, depth-1, alpha, beta, tt, deadline, stats, ply+1, ordering, stop)
+            board.unmake_move(move, undo)
+            if result < eval_to_beat: eval_to_beat, best_move = result, move
+            if eval_to_beat <= alpha:
+                stats.cutoffs[index] += 1
+                if ordering is not None: ordering.cutoff(board, move, depth, ply)
+                break
             beta = min(beta, eval_to_beat)
-            
+        stats.nodes[ply+1] += index + 1
+        stats.leaf_evaluations += leaves
+
+    if tt is not None:
+        if eval_to_beat <= alpha_original: bound = UPPER
+        elif eval_to_beat >= beta_original: bound = LOWER
+        else: bound = EXACT
+        tt.store(key, depth, bound, eval_to_beat, mirror_move(best_move) if mirrored else best_move)
+
     return eval_to_beat
         
 
@@ -596,7 +2047,7 @@ GAME BEGINS
             move = request_move(board)
         else:
             move = request_random_bot_move(board)
-            print('Bot plays: ',chr(101-move[0][0]),move[0][1],chr(101-move[1][0]),move[1][1], sep = '')
+            print(f'Bot plays: {move_notation(move)}')
 
         # Update boardstate by executing move
         board.execute_move(move)
@@ -635,15 +2086,80 @@ GAME BEGINS
             move = request_move(board)
         else:
             move = request_shortsighted_bot_move(board)
-            print('Bot plays: ',chr(101-move[0][0]),move[0][1],chr(101-move[1][0]),move[1][1], sep = '')
+            print(f'Bot plays: {move_notation(move)}')
 
         # Update boardstate by executing move
         board.execute_move(move)
 
-EXPANSION_COUNT = 0
+# What the bot searches during the human's turn: None not to ponder, "predicted" for the position after the human's
+# most likely reply, "all" for every reply in turn, one depth at a time
+PONDER = None
+PONDER_MODES = ("predicted", "all")
+
+class Ponderer:
+    '''
+    Ponderer class searches in a background thread while the human thinks. It searches into the bot's transposition
+    table, and keeps the deepest completed (move, evaluation, depth) for each position it searched. Its searches are
+    stopped through a threading.Event, which every node of them tests.
+
+    Methods:
+        start(board)                    - Starts pondering the human's replies on board, with the human to move
+        stop()                          - Stops pondering and waits for the thread to finish
+        result(board)                   - Returns the result kept for board, the position after the human's move, or None
+    '''
 
-def simple_search_bot_mode():
-    global EXPANSION_COUNT
+    def __init__(self, tt, mode="predicted"):
+        self.tt = tt
+        self.mode = mode
+        self.thread = None
+        self.results = {}
+
+    def start(self, board):
+        self.results = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.ponder, args=(board.copy(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None: return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def result(self, board):
+        return self.results.get(board.zobrist)
+
+    def replies(self, board):
+        '''Returns the human's replies to ponder, the most likely first: the transposition table move, or the best at a shallow depth.'''
+        possible_moves = board.possible_moves_search_optimised()
+        key, mirrored = tt_key(board)
+        entry = self.tt.probe(key)
+        tt_move = entry and table_move(board, entry[3], mirrored)
+        predicted = tt_move if tt_move in possible_moves else serial_search_root(board, 4, self.tt, stop=self.stop_event)[0]
+        if self.mode == "predicted": return [predicted]
+        return order_tt_move(possible_moves, predicted)
+
+    def ponder(self, board):
+        stats = SearchStats()
+        ordering = new_move_ordering()
+        try:
+            positions = []
+            for reply in self.replies(board):
+                position = board.copy()
+                position.execute_move(reply)
+                if position.is_won() or request_tablebase_move(position) or request_book_move(position): continue
+                positions.append(position)
+
+            for depth in range(2, MAX_DEPTH + 1):
+                for position in positions:
+                    previous = self.results.get(position.zobrist)
+                    move, evaluation = serial_search_root(position, depth, self.tt, None, previous and previous[0], stats, ordering,
+                                                          previous and previous[1], self.stop_event)
+                    self.results[position.zobrist] = (move, evaluation, depth)
+        except SearchTimeout:
+            pass
+
+def simple_search_bot_mode(move_time=MOVE_TIME, ponder=PONDER):
     player_colour = "RED" if random.randint(0,1) == 0 else "BLUE"
 
     print(
@@ -658,6 +2174,9 @@ GAME BEGINS
 '''      )
 
     board = Board() # Set initial boardstate
+    tt = TranspositionTable()
+    ponderer = Ponderer(tt, ponder) if ponder else None
+    bot_depth = None # Depth the last full search reached in move_time, None before the first
 
     evaluation = None
 
@@ -676,23 +2195,79 @@ GAME BEGINS
 
         # Request a move
         if board.turn_colour() == player_colour:
+            if ponderer: ponderer.start(board)
             move = request_move(board)
+            if ponderer: ponderer.stop()
         else:
             start_time = time.time()
 
-            
-            EXPANSION_COUNT = 0
-            move = request_simple_search_bot_move(board)
-            print(f'Number of states expanded = {EXPANSION_COUNT}')
-            evaluation = move[1]
-            move = move[0]
-            print(f'Bot plays {chr(101-move[0][0])}{move[0][1]}{chr(101-move[1][0])}{move[1][1]} after searching for {time.time() - start_time} seconds to a depth of {DEPTH}.\nEvaluation stands at {evaluation}.\n')
+            # A pondered result at least as deep as the last full search reached is played at once. Any other is left
+            # to the search, which starts from the pondered entries in the transposition table
+            stats = SearchStats()
+            pondered = ponderer.result(board) if ponderer else None
+            if pondered and bot_depth is not None and pondered[2] >= bot_depth:
+                result = pondered
+                print(f'Pondered position, searched to a depth of {pondered[2]}')
+            else:
+                result = request_simple_search_bot_move(board, tt, time_limit=move_time, workers=SEARCH_WORKERS, stats=stats)
+                bot_depth = result[2]
+                print(f'Number of states expanded = {stats.total_nodes()}, transposition table hit rate = {stats.tt_hit_rate():.1%}')
+            move, evaluation, depth = result
+            emit_search_stats(stats, engine="simple search", turn=board.turn, move=move_notation(move), evaluation=evaluation, depth=depth,
+                              pondered=result is pondered)
+            print(f'Bot plays {move_notation(move)} after searching for {time.time() - start_time} seconds to a depth of {depth}.\nEvaluation stands at {evaluation}.\n')
 
         # Update boardstate by executing move
         board.execute_move(move)
 
-def exhibition_match_mode():
-    global EXPANSION_COUNT
+def mcts_bot_mode(move_time=MOVE_TIME):
+    player_colour = "RED" if random.randint(0,1) == 0 else "BLUE"
+
+    print(
+f'''MCTS bot mode.
+
+Usage: input move by typing start and end coordinates: \'a1b2\'
+You may be asked to specify a card. In this case, name the desired card: \'pigeon\'
+
+You are {player_colour}.
+
+GAME BEGINS
+'''      )
+
+    board = Board() # Set initial boardstate
+    tree = MCTSTree(board) # Kept across moves, so the subtree of the position reached is reused
+
+    while True: # Main game loop
+
+        print(board.board_str()) # Print boardstate at beginning of any turn
+
+        # Check if the board is won, end game if so
+        victory_type = board.is_won()
+        if victory_type:
+            print_victory(victory_type) # Print victory information
+            return
+
+        # Print who's turn it is
+        print(f"{board.turn_colour()}\'s turn.\n")
+
+        # Request a move
+        if board.turn_colour() == player_colour:
+            move = request_move(board)
+        else:
+            start_time = time.time()
+            stats = SearchStats()
+            move, evaluation, depth = request_mcts_bot_move(board, tree, time_limit=move_time, workers=SEARCH_WORKERS, stats=stats)
+            print(f'Number of playouts = {stats.leaf_evaluations}, tree nodes = {tree.size} of {tree.capacity}')
+            emit_search_stats(stats, engine="mcts", turn=board.turn, move=move_notation(move), evaluation=evaluation, depth=depth)
+            print(f'Bot plays {move_notation(move)} after searching for {time.time() - start_time} seconds to a depth of {depth}.\nEvaluation stands at {evaluation}.\n')
+
+        # Update boardstate by executing move
+        board.execute_move(move)
+
+# Engines that can play exhibition matches
+EXHIBITION_ENGINES = ("simple search", "lazy smp", "mcts")
+
+def exhibition_match_mode(move_time=MOVE_TIME, engine="simple search"):
 
     print(
 f'''Exhibition match mode.
@@ -703,6 +2278,9 @@ GAME BEGINS
 '''      )
 
     board = Board() # Set initial boardstate
+    if engine == "lazy smp": workers = SEARCH_WORKERS or os.cpu_count()
+    elif engine == "mcts": tree = MCTSTree(board)
+    else: tt = TranspositionTable()
 
     evaluation = None
 
@@ -721,23 +2299,35 @@ GAME BEGINS
 
         # Request a move
         start_time = time.time()
-        EXPANSION_COUNT = 0
-        move = request_simple_search_bot_move(board)
-        print(f'Number of states expanded = {EXPANSION_COUNT}')
+        stats = SearchStats()
+        if engine == "lazy smp": move = request_lazy_smp_bot_move(board, time_limit=move_time, workers=workers, stats=stats)
+        elif engine == "mcts": move = request_mcts_bot_move(board, tree, time_limit=move_time, workers=SEARCH_WORKERS, stats=stats)
+        else: move = request_simple_search_bot_move(board, tt, time_limit=move_time, workers=SEARCH_WORKERS, stats=stats)
+        print(f'Number of states expanded = {stats.total_nodes()}, transposition table hit rate = {stats.tt_hit_rate():.1%}')
         evaluation = move[1]
+        depth = move[2]
         move = move[0]
+        emit_search_stats(stats, engine=engine, turn=board.turn, move=move_notation(move), evaluation=evaluation, depth=depth)
         search_time = time.time() - start_time
         if search_time < 2: time.sleep(2-search_time)
-        print(f'{board.turn_colour()} bot plays {chr(101-move[0][0])}{move[0][1]}{chr(101-move[1][0])}{move[1][1]} after searching for {search_time} seconds to a depth of {DEPTH}.\nEvaluation stands at {evaluation}.\n')
+        print(f'{board.turn_colour()} bot plays {move_notation(move)} after searching for {search_time} seconds to a depth of {depth}.\nEvaluation stands at {evaluation}.\n')
 
         # Update boardstate by executing move
         board.execute_move(move)
 
 if __name__ == "__main__":
     print("\nWelcome to ONITAMA\n")
-    response = input("Enter 1 to play locally, 2 to play a random bot, 3 to play a shortsighted bot, 4 to play a simple search bot, 5 to watch an exhibition match: ")
+    response = input("Enter 1 to play locally, 2 to play a random bot, 3 to play a shortsighted bot, 4 to play a simple search bot, 5 to watch an exhibition match, 6 to play an MCTS bot: ")
     if response == '1': two_player_mode() 
     elif response == '2': random_bot_mode()
     elif response == '3': shortsighted_bot_mode()
-    elif response == '4': simple_search_bot_mode()
-    elif response == '5': exhibition_match_mode()
+    elif response in ('4', '5', '6'):
+        move_time = input(f"Enter the bot's thinking time per move in milliseconds (default {MOVE_TIME}): ")
+        move_time = int(move_time) if move_time.isdigit() else MOVE_TIME
+        if response == '4':
+            ponder = input(f"Enter {' or '.join(PONDER_MODES)} to let the bot search during your turn, anything else not to: ")
+            simple_search_bot_mode(move_time, ponder if ponder in PONDER_MODES else PONDER)
+        elif response == '6': mcts_bot_mode(move_time)
+        else:
+            engine = input(f"Enter the engine to watch, one of {', '.join(EXHIBITION_ENGINES)} (default {EXHIBITION_ENGINES[0]}): ")
+            exhibition_match_mode(move_time, engine if engine in EXHIBITION_ENGINES else EXHIBITION_ENGINES[0])
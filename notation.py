@@ -0,0 +1,222 @@
+'''
+Position notation and packed binary encoding for Onitama.
+
+Text notation, in the spirit of FEN: the rows of the board from BLUE's home row down to RED's, separated
+by '/', each read from file a to file e as RED sees the board. R and B are the masters, r and b students,
+and a digit counts empty squares. Then the side to move (r or b), RED's two cards, BLUE's two cards, the
+waiting card and the turn number:
+
+    bbBbb/5/5/5/rrRrr r tiger,monkey dragon,crab mantis 0
+
+Packed encoding, one 64-bit integer per position:
+    bits 0-24   mask of the squares holding a student
+    bits 25-32  colour of each student, in increasing square order, 1 for BLUE
+    bits 33-37  RED master square, 25 when captured
+    bits 38-42  BLUE master square, 25 when captured
+    bits 43-62  the five cards in Board.cards order, 4 bits each
+    bit 63      side to move, 1 for BLUE
+
+Both keep everything Board.zobrist depends on. Decoding puts each side's students in increasing square
+order, as BitBoard.to_board does, and the packed encoding keeps the side to move but not the turn number:
+unpacked boards have turn 0 or 1. Bulk encodings are little-endian arrays of these integers.
+
+The check mode round-trips random positions from seeded games through both encodings.
+
+Usage: python notation.py check [--games N] [--seed N]
+'''
+import argparse
+import random
+import sys
+from array import array
+
+from main import DECK, INITIAL_POSITIONS, Board, coords_to_square, square_to_coords
+
+CARD_NAMES = [card.name for card in DECK]
+CARD_INDEX = {name: num for num, name in enumerate(CARD_NAMES)}
+
+# Square numbers in notation order: rows from BLUE's home row, files a to e (x from 4 down to 0)
+NOTATION_SQUARES = [coords_to_square((x, y)) for y in range(4, -1, -1) for x in range(4, -1, -1)]
+
+CAPTURED = 25
+
+def board_squares(board):
+    '''Returns (RED master square, BLUE master square, RED student squares, BLUE student squares) of a Board or BitBoard, 25 for a captured master.'''
+    if isinstance(board, Board):
+        positions = board.positions
+        red_master = CAPTURED if positions[0] is None else coords_to_square(positions[0])
+        blue_master = CAPTURED if positions[5] is None else coords_to_square(positions[5])
+        red_students = [coords_to_square(piece) for piece in positions[1:5] if piece is not None]
+        blue_students = [coords_to_square(piece) for piece in positions[6:10] if piece is not None]
+    else:
+        red_students, red_master, blue_students, blue_master = board.pieces
+        red_master = red_master.bit_length() - 1 if red_master else CAPTURED
+        blue_master = blue_master.bit_length() - 1 if blue_master else CAPTURED
+        red_students = [square for square in range(25) if red_students >> square & 1]
+        blue_students = [square for square in range(25) if blue_students >> square & 1]
+    return red_master, blue_master, red_students, blue_students
+
+def build_board(turn, red_master, blue_master, red_students, blue_students, cards):
+    '''Returns the Board with the given squares, each side's students in increasing square order.'''
+    if len(red_students) > 4 or len(blue_students) > 4: raise ValueError("A side has more than four students.")
+    occupied = [square for square in (red_master, blue_master) if square != CAPTURED] + red_students + blue_students
+    if len(set(occupied)) != len(occupied): raise ValueError("Two pieces share a square.")
+    if len(set(cards)) != 5 or not all(0 <= card < len(DECK) for card in cards): raise ValueError("Cards must be five different cards.")
+    positions = [None if red_master == CAPTURED else square_to_coords(red_master)]
+    positions += [square_to_coords(square) for square in sorted(red_students)] + [None]*(4 - len(red_students))
+    positions += [None if blue_master == CAPTURED else square_to_coords(blue_master)]
+    positions += [square_to_coords(square) for square in sorted(blue_students)] + [None]*(4 - len(blue_students))
+    return Board(turn, positions, list(cards))
+
+def to_notation(board):
+    '''Returns the text notation of a Board or BitBoard.'''
+    red_master, blue_master, red_students, blue_students = board_squares(board)
+    pieces = {red_master: "R", blue_master: "B"}
+    pieces.update((square, "r") for square in red_students)
+    pieces.update((square, "b") for square in blue_students)
+
+    rows = []
+    for row in range(5):
+        text = ""
+        empty = 0
+        for square in NOTATION_SQUARES[5*row:5*row+5]:
+            if square in pieces:
+                if empty: text += str(empty)
+                text += pieces[square]
+                empty = 0
+            else: empty += 1
+        rows.append(text + (str(empty) if empty else ""))
+
+    cards = [CARD_NAMES[card] for card in board.cards]
+    return f"{'/'.join(rows)} {'rb'[board.turn % 2]} {cards[0]},{cards[1]} {cards[2]},{cards[3]} {cards[4]} {board.turn}"
+
+def from_notation(text):
+    '''Returns the Board described by a position in text notation, or raises ValueError.'''
+    fields = text.split()
+    if len(fields) != 6: raise ValueError("Notation needs six fields: board, side to move, RED's cards, BLUE's cards, waiting card, turn.")
+    rows, side, red_cards, blue_cards, waiting, turn = fields
+
+    rows = rows.split("/")
+    if len(rows) != 5: raise ValueError("The board needs five rows.")
+    red_master = blue_master = CAPTURED
+    red_students, blue_students = [], []
+    for row, row_text in enumerate(rows):
+        file = 0
+        for char in row_text:
+            if char in "12345":
+                file += int(char)
+                continue
+            if char not in "RrBb": raise ValueError(f"Unknown piece {char!r}.")
+            if file >= 5: raise ValueError(f"Row {row + 1} covers more than five squares.")
+            square = NOTATION_SQUARES[5*row + file]
+            if char == "R":
+                if red_master != CAPTURED: raise ValueError("RED has two masters.")
+                red_master = square
+            elif char == "B":
+                if blue_master != CAPTURED: raise ValueError("BLUE has two masters.")
+                blue_master = square
+            elif char == "r": red_students.append(square)
+            else: blue_students.append(square)
+            file += 1
+        if file != 5: raise ValueError(f"Row {row + 1} does not cover five squares.")
+
+    if side not in ("r", "b"): raise ValueError("Side to move must be r or b.")
+    if not turn.isdigit() or int(turn) % 2 != (side == "b"): raise ValueError("Turn must be a number, even when RED is to move.")
+    try:
+        cards = [CARD_INDEX[name] for name in red_cards.split(",") + blue_cards.split(",") + [waiting]]
+    except KeyError as error:
+        raise ValueError(f"Unknown card {error.args[0]!r}.")
+    if len(cards) != 5: raise ValueError("Each side needs two cards.")
+    return build_board(int(turn), red_master, blue_master, red_students, blue_students, cards)
+
+def pack_board(board):
+    '''Returns the 64-bit packed encoding of a Board or BitBoard.'''
+    red_master, blue_master, red_students, blue_students = board_squares(board)
+    occupancy = 0
+    for square in red_students + blue_students: occupancy |= 1 << square
+    blue_students = set(blue_students)
+    colours = 0
+    for bit, square in enumerate(square for square in range(25) if occupancy >> square & 1):
+        if square in blue_students: colours |= 1 << bit
+    code = occupancy | colours << 25 | red_master << 33 | blue_master << 38
+    for slot, card in enumerate(board.cards): code |= card << (43 + 4*slot)
+    return code | (board.turn % 2) << 63
+
+def unpack_board(code):
+    '''Returns the Board of a 64-bit packed encoding, with turn 0 or 1, or raises ValueError.'''
+    occupancy = code & 0x1FFFFFF
+    colours = code >> 25 & 0xFF
+    red_students, blue_students = [], []
+    bit = 0
+    for square in range(25):
+        if occupancy >> square & 1:
+            if bit == 8: raise ValueError("More than eight students.")
+            (blue_students if colours >> bit & 1 else red_students).append(square)
+            bit += 1
+    red_master, blue_master = code >> 33 & 31, code >> 38 & 31
+    if red_master > CAPTURED or blue_master > CAPTURED: raise ValueError("Master square out of range.")
+    cards = [code >> (43 + 4*slot) & 15 for slot in range(5)]
+    return build_board(code >> 63, red_master, blue_master, red_students, blue_students, cards)
+
+def pack_boards(boards):
+    '''Returns array('Q') of the packed encodings of boards.'''
+    return array('Q', map(pack_board, boards))
+
+def unpack_boards(data):
+    '''Returns the list of Boards packed in an array('Q'), or in bytes of little-endian 64-bit integers.'''
+    if not isinstance(data, array):
+        data = array('Q', bytes(data))
+        if sys.byteorder == "big": data.byteswap()
+    return [unpack_board(code) for code in data]
+
+def boards_to_bytes(boards):
+    '''Returns the packed encodings of boards as little-endian bytes, 8 per position.'''
+    data = pack_boards(boards)
+    if sys.byteorder == "big": data.byteswap()
+    return data.tobytes()
+
+def same_position(board, other):
+    '''Returns True if two Boards hold the same position, ignoring the order of students and the turn number.'''
+    return board_squares(board)[:2] == board_squares(other)[:2] and \
+        [sorted(squares) for squares in board_squares(board)[2:]] == [sorted(squares) for squares in board_squares(other)[2:]] and \
+        board.cards == other.cards and board.turn % 2 == other.turn % 2 and board.zobrist == other.zobrist
+
+def check(games, seed):
+    '''Round-trips every position of seeded random games through both encodings, returns the number checked and a list of failures.'''
+    rng = random.Random(seed)
+    boards = []
+    for game in range(games):
+        board = Board(rng.randint(0, 1), list(INITIAL_POSITIONS), rng.sample(range(len(DECK)), 5))
+        while True:
+            boards.append(board.copy())
+            if board.is_won() or board.turn > 200: break
+            board.execute_move(rng.choice(board.possible_moves()))
+
+    failures = []
+    for board in boards:
+        text = to_notation(board)
+        from_text = from_notation(text)
+        if not same_position(board, from_text) or from_text.turn != board.turn or to_notation(from_text) != text:
+            failures.append(f"notation {text} does not round-trip {board.positions} {board.cards}")
+        code = pack_board(board)
+        unpacked = unpack_board(code)
+        if not same_position(board, unpacked) or pack_board(unpacked) != code:
+            failures.append(f"packing {code:#018x} does not round-trip {board.positions} {board.cards}")
+
+    unpacked = unpack_boards(boards_to_bytes(boards))
+    if len(unpacked) != len(boards) or not all(same_position(board, other) for board, other in zip(boards, unpacked)):
+        failures.append("bulk packing through bytes does not round-trip")
+    if [pack_board(board) for board in unpack_boards(pack_boards(boards))] != list(pack_boards(boards)):
+        failures.append("bulk packing through array('Q') does not round-trip")
+    return len(boards), failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama position notation")
+    parser.add_argument("mode", choices=("check",))
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checked, failures = check(args.games, args.seed)
+    for failure in failures[:20]: print(f"FAIL: {failure}")
+    print(f"Round-tripped {checked} positions, {len(failures)} failures")
+    if failures: sys.exit(1)
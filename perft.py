@@ -0,0 +1,128 @@
+'''
+Perft move-generation counter for Onitama.
+
+Counts the positions reached after exactly N plies from a position and card deal. Games that end
+earlier are not continued. Reports leaf nodes and moves generated per second for each move generator,
+with an optional divide breakdown per root move, and can cross-check every generator against
+Board.possible_moves at each node of the tree.
+
+Generators:
+    board           - Board.possible_moves
+    bitboard        - BitBoard.possible_moves
+
+Usage: python perft.py [--depth N] [--cards NAME,NAME,NAME,NAME,NAME] [--turn 0|1] [--divide] [--generator board|bitboard|all] [--check]
+'''
+import argparse
+import time
+
+import main
+from bitboard import BitBoard, move_to_coords, move_from_coords
+
+GENERATORS = {
+    "board": lambda board: board,
+    "bitboard": BitBoard.from_board,
+}
+
+def perft(board, depth, counter):
+    '''Returns the number of positions depth plies below board. counter[0] counts moves generated.'''
+    possible_moves = board.possible_moves()
+    counter[0] += len(possible_moves)
+    if depth == 1: return len(possible_moves)
+
+    nodes = 0
+    for move in possible_moves:
+        undo = board.make_move(move)
+        if not board.is_won(): nodes += perft(board, depth-1, counter)
+        board.unmake_move(move, undo)
+    return nodes
+
+def divide(board, depth, counter):
+    '''Returns a list of (move, nodes) per root move of a perft to depth.'''
+    results = []
+    possible_moves = board.possible_moves()
+    counter[0] += len(possible_moves)
+    for move in possible_moves:
+        undo = board.make_move(move)
+        nodes = 1 if depth == 1 else 0 if board.is_won() else perft(board, depth-1, counter)
+        board.unmake_move(move, undo)
+        results.append((move, nodes))
+    return results
+
+def run_perft(board, depth, generator, show_divide):
+    '''Runs perft on board with a generator, prints the node count and throughput, returns the node count.'''
+    backend = GENERATORS[generator](board.copy())
+    counter = [0]
+    start_time = time.perf_counter()
+    if show_divide:
+        results = divide(backend, depth, counter)
+        nodes = sum(count for move, count in results)
+    else:
+        nodes = perft(backend, depth, counter)
+    seconds = time.perf_counter() - start_time
+
+    if show_divide:
+        if generator == "bitboard": results = [(move_to_coords(move), count) for move, count in results]
+        for move, count in sorted(results, key=lambda result: main.move_notation(result[0])):
+            print(f"  {main.move_notation(move):>12} {main.DECK[move[2]].name:>8}: {count}")
+    print(f"{generator:>8}: perft({depth}) = {nodes} in {seconds:.2f} seconds, "
+          f"{nodes/seconds:.0f} leaves and {counter[0]/seconds:.0f} moves generated per second")
+    return nodes
+
+def cross_check(board, depth):
+    '''
+    Walks the tree to depth comparing, at every node, Board.possible_moves against Board.possible_moves_search_optimised
+    and both BitBoard generators. The ordered generators must give the same moves, or only a capture of the enemy master,
+    which ends the game. Returns the number of nodes checked and a list of disagreements.
+    '''
+    failures = []
+    checked = 0
+
+    def check(board, bitboard, depth):
+        nonlocal checked
+        checked += 1
+        expected = board.possible_moves()
+        generated = {
+            "Board.possible_moves_search_optimised": board.possible_moves_search_optimised(),
+            "BitBoard.possible_moves": [move_to_coords(move) for move in bitboard.possible_moves()],
+            "BitBoard.possible_moves_search_optimised": [move_to_coords(move) for move in bitboard.possible_moves_search_optimised()],
+        }
+        for name, moves in generated.items():
+            enemy_master = board.positions[5 if board.turn_colour_num() == 0 else 0]
+            master_capture = len(moves) == 1 and moves[0][1] == enemy_master and moves[0] in expected
+            if len(set(moves)) != len(moves): failures.append(f"{name} generated duplicate moves in {board.positions} {board.cards}")
+            elif set(moves) != set(expected) and not ("optimised" in name and master_capture):
+                failures.append(f"{name} disagrees with Board.possible_moves in {board.positions} {board.cards} turn {board.turn}")
+        if depth == 0: return
+        for move in expected:
+            undo = board.make_move(move)
+            bitboard_undo = bitboard.make_move(move_from_coords(move))
+            if not board.is_won(): check(board, bitboard, depth-1)
+            bitboard.unmake_move(move_from_coords(move), bitboard_undo)
+            board.unmake_move(move, undo)
+
+    check(board.copy(), BitBoard.from_board(board), depth - 1)
+    return checked, failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama perft")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--cards", default="tiger,monkey,dragon,crab,mantis", help="RED's two cards, BLUE's two cards, then the waiting card")
+    parser.add_argument("--turn", type=int, default=0, choices=(0, 1), help="0 for RED to move, 1 for BLUE")
+    parser.add_argument("--divide", action="store_true", help="break the count down per root move")
+    parser.add_argument("--generator", default="all", choices=tuple(GENERATORS) + ("all",))
+    parser.add_argument("--check", action="store_true", help="cross-check all generators at every node")
+    args = parser.parse_args()
+
+    names = [card.name for card in main.DECK]
+    cards = [names.index(name) for name in args.cards.split(",")]
+    if len(cards) != 5 or len(set(cards)) != 5: parser.error("five different cards are needed")
+    board = main.Board(args.turn, list(main.INITIAL_POSITIONS), cards)
+
+    counts = {generator: run_perft(board, args.depth, generator, args.divide)
+              for generator in (GENERATORS if args.generator == "all" else (args.generator,))}
+    if len(set(counts.values())) > 1: print(f"MISMATCH between generators: {counts}")
+
+    if args.check:
+        checked, failures = cross_check(board, args.depth)
+        for failure in failures[:20]: print(f"FAIL: {failure}")
+        print(f"Cross-checked {checked} nodes, {len(failures)} disagreements")
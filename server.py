@@ -0,0 +1,316 @@
+'''
+Multi-game Onitama server.
+
+Hosts many games against the simple search bot over TCP. Clients send one JSON object per line and get
+one JSON object per line back, in order, for each request:
+
+    {"type": "new", "colour": "RED"|"BLUE", "cards": [five card names], "move_time": ms, "budget": ms}
+    {"type": "move", "game": id, "move": "a1b2", "card": name}      card only when the move is possible with either card
+    {"type": "move", "game": id, "move": "pass", "card": name}      when no piece can move, naming the card to exchange
+    {"type": "state", "game": id}
+    {"type": "close", "game": id}
+
+Every field of "new" is optional. Replies are {"type": "game", ...} with the position, the bot's move if it played
+one and the result once the game is won, or {"type": "error", "message": ...}. Moves are checked with
+Board.check_move, which gives the same errors as the interactive modes without prompting.
+
+Bot moves are searched by request_simple_search_bot_move in a shared pool of worker processes, each keeping a
+transposition table across the games it serves. Each game has a thinking budget; a move gets at most move_time,
+and at most 1/BUDGET_MOVES of the remaining budget. Each search's SearchStats are sent back from the worker and
+written by the server process with main.emit_search_stats, as the interactive modes do, so they are recorded when
+ONITAMA_SEARCH_STATS_LOG is set.
+
+Backpressure: a connection's next line is not read until its last reply is written and drained, at most
+--max-pending searches are handed to the pool at once with the rest waiting their turn, and new games are
+refused beyond --max-games. A client that sends faster than the engine plays is slowed down by TCP.
+
+The loadtest mode plays many concurrent games with random moves, one connection each, and reports the
+round trip latency of moves and the time searches spent queued for the pool.
+
+Usage: python server.py serve [--host HOST] [--port N] [--workers N] [--move-time MS] [--budget MS] [--max-games N] [--max-pending N]
+       python server.py loadtest [--host HOST] [--port N] [--games N] [--move-time MS] [--budget MS] [--seed N] [--local] [--workers N]
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+
+PORT = 7341
+
+# Requests longer than this are refused and the connection closed
+MAX_LINE = 4096
+
+# Default thinking budget of a game, and the share of the remaining budget a move may use
+BUDGET = 60000
+BUDGET_MOVES = 20
+
+# Games longer than this many plies are closed by the load test client as draws
+MAX_PLIES = 200
+
+CARD_NAMES = [card.name for card in main.DECK]
+
+def _init_worker():
+    global _worker_tt
+    _worker_tt = main.TranspositionTable()
+
+def search_move(turn, positions, cards, time_limit):
+    '''Runs in a worker process. Returns the bot's (move, evaluation, depth), the seconds searched and the search's SearchStats.'''
+    board = main.Board(turn, positions, cards)
+    stats = main.SearchStats()
+    start_time = time.perf_counter()
+    move, evaluation, depth = main.request_simple_search_bot_move(board, _worker_tt, time_limit=time_limit, stats=stats)
+    return (move, evaluation, depth), time.perf_counter() - start_time, stats
+
+class Game:
+    '''A game between a client and the bot, with the bot's remaining thinking budget in milliseconds.'''
+
+    def __init__(self, num, board, colour, move_time, budget):
+        self.num = num
+        self.board = board
+        self.colour = colour
+        self.move_time = move_time
+        self.budget = budget
+
+    def state(self, bot_move=None):
+        victory_type = self.board.is_won()
+        return {
+            "type": "game", "game": self.num, "colour": self.colour, "turn": self.board.turn, "to_move": self.board.turn_colour(),
+            "positions": self.board.positions, "cards": [CARD_NAMES[card] for card in self.board.cards],
+            "budget": round(self.budget), "bot_move": bot_move,
+            "result": {"winner": victory_type[0], "win_type": victory_type[1]} if victory_type else None,
+        }
+
+class GameServer:
+    '''
+    Holds the games of every connection and hands bot moves to a shared process pool.
+
+    Methods:
+        handle(reader, writer)          - Serves one connection until it closes, asyncio.start_server's callback
+        request(games, message)         - Returns the reply to one request from a connection owning games
+        bot_move(game)                  - Searches and plays the bot's move in a game, returns its description
+        wait_closed()                   - Waits for the open connections to be closed by their clients
+        close()                         - Shuts the process pool down
+    '''
+
+    def __init__(self, workers=None, move_time=main.MOVE_TIME, budget=BUDGET, max_games=1000, max_pending=None):
+        workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        # Start the workers before any socket is open, so forked workers hold no copies of connections that keep them from closing
+        self.pool.submit(int).result()
+        self.engine_slots = asyncio.Semaphore(max_pending or 2*workers)
+        self.move_time = move_time
+        self.budget = budget
+        self.max_games = max_games
+        self.games = {}
+        self.game_nums = itertools.count(1)
+        self.connections = set()
+
+    async def handle(self, reader, writer):
+        games = set() # Games owned by this connection, closed with it
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # Line longer than MAX_LINE
+                    writer.write(json.dumps({"type": "error", "message": "Request too long."}).encode() + b"\n")
+                    break
+                if not line: break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict): raise ValueError
+                except ValueError:
+                    reply = {"type": "error", "message": "Could not parse request."}
+                else:
+                    reply = await self.request(games, message)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for num in games: self.games.pop(num, None)
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def request(self, games, message):
+        kind = message.get("type")
+        if kind == "new": return await self.new_game(games, message)
+        if kind not in ("move", "state", "close"): return {"type": "error", "message": f"Unknown request type {kind}."}
+
+        num = message.get("game")
+        if num not in games: return {"type": "error", "message": f"No game {num} on this connection."}
+        game = self.games[num]
+        if kind == "state": return game.state()
+        if kind == "close":
+            games.discard(num)
+            del self.games[num]
+            return {"type": "closed", "game": num}
+
+        board = game.board
+        if board.is_won(): return {"type": "error", "message": "Game is over."}
+        if board.turn_colour() != game.colour: return {"type": "error", "message": "Not your turn."}
+        move, error = self.parse_move(board, message.get("move"), message.get("card"))
+        if error: return {"type": "error", "message": error}
+        board.execute_move(move)
+        return game.state(None if board.is_won() else await self.bot_move(game))
+
+    async def new_game(self, games, message):
+        if len(self.games) >= self.max_games: return {"type": "error", "message": "Server full."}
+        colour = message.get("colour") or random.choice(("RED", "BLUE"))
+        if colour not in ("RED", "BLUE"): return {"type": "error", "message": "Colour must be RED or BLUE."}
+        names = message.get("cards")
+        if names is None: cards = random.sample(range(len(main.DECK)), 5)
+        elif isinstance(names, list) and len(set(names)) == 5 and all(name in CARD_NAMES for name in names): cards = [CARD_NAMES.index(name) for name in names]
+        else: return {"type": "error", "message": "Cards must be five different card names."}
+        try:
+            move_time = min(int(message.get("move_time", self.move_time)), self.move_time)
+            budget = min(int(message.get("budget", self.budget)), self.budget)
+        except (TypeError, ValueError):
+            return {"type": "error", "message": "move_time and budget must be milliseconds."}
+
+        game = Game(next(self.game_nums), main.Board(None, list(main.INITIAL_POSITIONS), cards), colour, move_time, budget)
+        self.games[game.num] = game
+        games.add(game.num)
+        return game.state(await self.bot_move(game) if game.board.turn_colour() != colour else None)
+
+    def parse_move(self, board, text, card):
+        '''Returns (move, None) for a move in the 'a1b2' notation or a pass, or (None, cause of invalidity).'''
+        if not isinstance(text, str) or not (card is None or isinstance(card, str)): return None, "Could not parse input."
+        possible_moves = board.possible_moves()
+        if possible_moves[0][0] is None:
+            for move in possible_moves:
+                if CARD_NAMES[move[2]] == card: return move, None
+            return None, "No piece can move. Name the card to exchange with a pass."
+        if text == "pass": return None, "Cannot pass while a piece can move."
+        move_coords, error = main.parse_move_coords(text)
+        if error: return None, error
+        return board.check_move(move_coords, card)
+
+    async def bot_move(self, game):
+        board = game.board
+        time_limit = max(1, min(game.move_time, game.budget / BUDGET_MOVES))
+        queued = time.perf_counter()
+        async with self.engine_slots:
+            started = time.perf_counter()
+            (move, evaluation, depth), seconds, stats = await asyncio.get_running_loop().run_in_executor(
+                self.pool, search_move, board.turn, board.positions, board.cards, time_limit)
+        game.budget = max(0, game.budget - 1000*seconds)
+        description = {"move": "pass" if move[0] is None else main.move_notation(move), "card": CARD_NAMES[move[2]], "evaluation": evaluation,
+                       "depth": depth, "think_ms": round(1000*seconds, 1), "queue_ms": round(1000*(started - queued), 1)}
+        main.emit_search_stats(stats, engine="simple search", game=game.num, turn=board.turn, move=main.move_notation(move),
+                               evaluation=evaluation, depth=depth, queue_ms=description["queue_ms"])
+        board.execute_move(move)
+        return description
+
+    async def wait_closed(self):
+        '''Waits for the connections still open to be closed by their clients.'''
+        await asyncio.gather(*self.connections)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+async def serve(host, port, **options):
+    game_server = GameServer(**options)
+    server = await asyncio.start_server(game_server.handle, host, port, limit=MAX_LINE)
+    print(f"Serving Onitama on {', '.join(str(sock.getsockname()) for sock in server.sockets)}", flush=True)
+    try:
+        async with server: await server.serve_forever()
+    finally:
+        game_server.close()
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of a list of values.'''
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction*len(values)))]
+
+async def play_random_game(host, port, rng, move_time, budget, latencies, queue_times, results):
+    '''Plays one game of random moves against the server, recording move round trips and search queue times in seconds.'''
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send(message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    try:
+        state = await send({"type": "new", "colour": rng.choice(("RED", "BLUE")), "cards": rng.sample(CARD_NAMES, 5), "move_time": move_time, "budget": budget})
+        while state["type"] == "game":
+            if state["bot_move"]: queue_times.append(state["bot_move"]["queue_ms"]/1000)
+            if state["result"]:
+                results.append(state["result"]["winner"] == state["colour"])
+                return
+            if state["turn"] >= MAX_PLIES:
+                results.append(None)
+                return
+
+            # Name the card only when the move is possible with either card, as a player would
+            board = main.Board(state["turn"], [tuple(piece) if piece else None for piece in state["positions"]],
+                               [CARD_NAMES.index(name) for name in state["cards"]])
+            move = rng.choice(board.possible_moves())
+            message = {"type": "move", "game": state["game"], "move": "pass" if move[0] is None else main.move_notation(move)}
+            if move[0] is None or board.check_move([move[0], move[1]])[1] == main.AMBIGUOUS_CARD: message["card"] = CARD_NAMES[move[2]]
+
+            start_time = time.perf_counter()
+            state = await send(message)
+            latencies.append(time.perf_counter() - start_time)
+        results.append(state)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def load_test(host, port, games, move_time, budget, seed, local=False, workers=None):
+    if local:
+        game_server = GameServer(workers, max_games=games, move_time=move_time, budget=budget)
+        server = await asyncio.start_server(game_server.handle, host, 0, limit=MAX_LINE)
+        port = server.sockets[0].getsockname()[1]
+
+    latencies, queue_times, results = [], [], []
+    rng = random.Random(seed)
+    start_time = time.time()
+    try:
+        await asyncio.gather(*(play_random_game(host, port, random.Random(rng.getrandbits(32)), move_time, budget, latencies, queue_times, results)
+                               for game in range(games)))
+    finally:
+        if local:
+            server.close()
+            await game_server.wait_closed()
+            game_server.close()
+    seconds = time.time() - start_time
+
+    errors = [result for result in results if isinstance(result, dict)]
+    print(f"{games} concurrent games, {len(latencies)} moves in {seconds:.1f} seconds, {len(latencies)/seconds:.1f} moves per second")
+    print(f"client wins {results.count(True)}, bot wins {results.count(False)}, move limit {results.count(None)}, errors {len(errors)}")
+    for error in errors[:5]: print(f"  {error}")
+    if latencies:
+        print(f"move latency:       p50 {1000*percentile(latencies, 0.5):.0f} ms, p99 {1000*percentile(latencies, 0.99):.0f} ms, max {1000*max(latencies):.0f} ms")
+        print(f"search queue time:  p50 {1000*percentile(queue_times, 0.5):.0f} ms, p99 {1000*percentile(queue_times, 0.99):.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama multi-game server")
+    parser.add_argument("mode", choices=("serve", "loadtest"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--move-time", type=int, default=main.MOVE_TIME, help="milliseconds per bot move at most")
+    parser.add_argument("--budget", type=int, default=BUDGET, help="milliseconds of bot thinking per game")
+    parser.add_argument("--max-games", type=int, default=1000)
+    parser.add_argument("--max-pending", type=int, default=None, help="searches handed to the pool at once, default twice the workers")
+    parser.add_argument("--games", type=int, default=200, help="concurrent games played by the load test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true", help="load test a server started in this process")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, workers=args.workers, move_time=args.move_time, budget=args.budget,
+                              max_games=args.max_games, max_pending=args.max_pending))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(load_test(args.host, args.port, args.games, args.move_time, args.budget, args.seed, args.local, args.workers))
@@ -0,0 +1,259 @@
+'''
+Endgame tablebase generator for Onitama.
+
+Solves every position with both masters and at most N students, for each requested 5-card deal, by
+retrograde analysis. It starts from the positions won in one ply, then walks predecessor edges: a
+position with a move into a lost position is won, and a position whose moves all lead to won positions
+is lost. Positions never resolved are draws. Each deal is solved in a worker process with NumPy and
+written to a file that main.Tablebase opens with mmap (see its docstring for the layout). Of a deal and its
+mirror deal, only the one with the lower key is solved; the other is probed through mirror images.
+
+One student takes about 1.9 MB and a few seconds per deal, so every deal (--deals all) takes about 4.5 GB.
+Two students take about 47 MB per deal on disk, and more than 10 GB of memory per worker to solve.
+
+The verify mode checks random entries against recursive_search: won and lost positions must be
+scored +-1000 at their distance, and drawn ones must not be.
+
+Usage: python tablebase.py generate [--students N] [--deals all|N|CARD,CARD,CARD,CARD,CARD ...] [--workers N] [--out FILE]
+       python tablebase.py verify [--positions N] [--out FILE]
+'''
+import argparse
+import itertools
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import main
+from main import TABLEBASE_ARRANGEMENTS, coords_to_square, square_to_coords
+
+RED_TEMPLE = coords_to_square((2,4))
+BLUE_TEMPLE = coords_to_square((2,0))
+
+def offset_tables():
+    '''Returns OFFSETS[card][side], a list per card move of 25-entry arrays of destination squares, -1 off the board.'''
+    tables = []
+    for card in main.DECK:
+        sides = []
+        for mul in (1, -1):
+            moves = []
+            for card_move in card.card_moves:
+                destinations = []
+                for square in range(25):
+                    x, y = square_to_coords(square)
+                    x, y = x - mul*card_move[0], y + mul*card_move[1]
+                    destinations.append(coords_to_square((x, y)) if 0 <= x <= 4 and 0 <= y <= 4 else -1)
+                moves.append(np.array(destinations))
+            sides.append(moves)
+        tables.append(sides)
+    return tables
+
+OFFSETS = offset_tables()
+
+def next_arrangement(arrangement, side, hand):
+    '''Returns the arrangement after side plays the card at hand (0 or 1) of its two, and the deal position of that card.'''
+    red, blue, waiting = TABLEBASE_ARRANGEMENTS[arrangement]
+    cards = [list(red), list(blue)]
+    used = cards[side][hand]
+    cards[side][hand] = waiting
+    return main.TABLEBASE_ARRANGEMENT_INDEX[(1 << cards[0][0] | 1 << cards[0][1], used)], used
+
+def solve_deal(task):
+    '''Returns the table of one deal as bytes, given (sorted deal, maximum students).'''
+    deal, max_students = task
+    configs = main.tablebase_student_configs(max_students)
+    config_index = {config: num for num, config in enumerate(configs)}
+    num_configs = len(configs)
+    size = 2 * len(TABLEBASE_ARRANGEMENTS) * num_configs * 625
+
+    red_master = np.repeat(np.arange(25), 25)
+    blue_master = np.tile(np.arange(25), 25)
+    placement = red_master*25 + blue_master
+
+    sources = []
+    destinations = []
+    won = np.zeros(size, dtype=bool) # Side to move can win in one ply
+    valid = np.zeros(size, dtype=bool)
+
+    for config, (red_students, blue_students) in enumerate(configs):
+        students = (red_students, blue_students)
+        occupied = np.array([bool((red_students | blue_students) >> square & 1) for square in range(25)])
+        # Positions that cannot occur: pieces sharing a square, or a master already on its winning temple
+        placement_valid = (red_master != blue_master) & ~occupied[red_master] & ~occupied[blue_master] & (red_master != RED_TEMPLE) & (blue_master != BLUE_TEMPLE)
+
+        # Configuration after the student of a colour on each square is captured
+        captured = [np.array([config_index[tuple(mask & ~(1 << square) if colour == num else mask for num, mask in enumerate(students))]
+                              for square in range(25)]) for colour in (0, 1)]
+
+        for side, arrangement in itertools.product((0, 1), range(len(TABLEBASE_ARRANGEMENTS))):
+            base = main.tablebase_index(side, arrangement, config, 0, 0, num_configs)
+            valid[base:base+625] = placement_valid
+            own, enemy = (red_master, blue_master) if side == 0 else (blue_master, red_master)
+            own_students, enemy_students = students[side], students[1-side]
+            temple = RED_TEMPLE if side == 0 else BLUE_TEMPLE
+            # Squares a master cannot move to, with a last entry for -1, off the board
+            blocked = np.array([bool(own_students >> square & 1) for square in range(25)] + [True])
+
+            for hand in (0, 1):
+                next_arr, used = next_arrangement(arrangement, side, hand)
+                for destination_table in OFFSETS[deal[used]][side]:
+                    # Master moves
+                    destination = destination_table[own]
+                    legal = placement_valid & ~blocked[destination]
+                    wins = legal & ((destination == enemy) | (destination == temple))
+                    won[base + placement[wins]] = True
+                    moves = legal & ~wins
+                    new_config = captured[1-side][destination[moves]]
+                    new_own = destination[moves]
+                    new_red, new_blue = (new_own, enemy[moves]) if side == 0 else (enemy[moves], new_own)
+                    sources.append(base + placement[moves])
+                    destinations.append(main.tablebase_index(1-side, next_arr, new_config, new_red, new_blue, num_configs))
+
+                    # Student moves
+                    for square in range(25):
+                        if not own_students >> square & 1: continue
+                        target = int(destination_table[square])
+                        if target < 0 or own_students >> target & 1: continue
+                        legal = placement_valid & (own != target)
+                        wins = legal & (enemy == target)
+                        won[base + placement[wins]] = True
+                        moves = legal & ~wins
+                        moved = own_students & ~(1 << square) | 1 << target
+                        new_students = (moved, enemy_students & ~(1 << target)) if side == 0 else (enemy_students & ~(1 << target), moved)
+                        sources.append(base + placement[moves])
+                        destinations.append(main.tablebase_index(1-side, next_arr, config_index[new_students], 0, 0, num_configs) + placement[moves])
+
+    sources = np.concatenate(sources).astype(np.int64)
+    destinations = np.concatenate(destinations).astype(np.int64)
+
+    # Positions with no legal move pass, exchanging either card
+    stuck = np.flatnonzero(valid & ~won & (np.bincount(sources, minlength=size) == 0))
+    if len(stuck):
+        side, rest = np.divmod(stuck, size // 2)
+        arrangement, rest = np.divmod(rest, num_configs * 625)
+        for hand in (0, 1):
+            next_arr = np.array([next_arrangement(arr, s, hand)[0] for arr, s in zip(arrangement, side)])
+            sources = np.concatenate([sources, stuck])
+            destinations = np.concatenate([destinations, main.tablebase_index(1-side, next_arr, 0, 0, 0, num_configs) + rest])
+
+    return retrograde(sources, destinations, won, size)
+
+def retrograde(sources, destinations, won, size):
+    '''Returns the plies to the end of the game from every position as bytes, 0 for draws, given the move edges and the positions won in one ply.'''
+    remaining = np.bincount(sources, minlength=size) # Moves not yet known to lose
+    order = np.argsort(destinations, kind='stable')
+    predecessors = sources[order]
+    starts = np.concatenate(([0], np.cumsum(np.bincount(destinations, minlength=size))))
+
+    plies = np.zeros(size, dtype=np.int32)
+    frontier = np.flatnonzero(won)
+    plies[frontier] = 1
+    distance = 1
+    while len(frontier):
+        # Predecessors of the frontier, with one entry per move into it
+        counts = starts[frontier + 1] - starts[frontier]
+        first = np.repeat(starts[frontier] - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        parents = predecessors[first + np.arange(counts.sum())]
+
+        if distance % 2 == 1:
+            # The frontier is won for the side to move there, so those moves lose: parents out of moves are lost
+            np.subtract.at(remaining, parents, 1)
+            parents = np.unique(parents)
+            frontier = parents[(remaining[parents] == 0) & (plies[parents] == 0)]
+        else:
+            # The frontier is lost for the side to move there, so its parents are won
+            parents = np.unique(parents)
+            frontier = parents[plies[parents] == 0]
+        distance += 1
+        plies[frontier] = distance
+
+    if plies.max() > 255: raise ValueError(f"distance {plies.max()} does not fit in a byte")
+    return plies.astype(np.uint8).tobytes()
+
+def canonical_deal(deal):
+    '''Returns the one of a deal and its mirror deal that is stored, the one with the lower key. Tablebase.probe mirrors the other.'''
+    mirrored = tuple(sorted(main.MIRROR_CARD[card] for card in deal))
+    return min(deal, mirrored, key=lambda deal: sum(1 << card for card in deal))
+
+def generate(deals, max_students, workers, out):
+    deals = sorted({canonical_deal(tuple(sorted(deal))) for deal in deals}, key=lambda deal: sum(1 << card for card in deal))
+    size = 2 * len(TABLEBASE_ARRANGEMENTS) * len(main.tablebase_student_configs(max_students)) * 625
+    data_start = main.TABLEBASE_HEADER.size + len(deals) * main.TABLEBASE_INDEX_ENTRY.size
+    start_time = time.time()
+    with open(out + ".tmp", "wb") as out_file, Pool(workers) as pool:
+        out_file.write(main.TABLEBASE_HEADER.pack(main.TABLEBASE_MAGIC, max_students, len(deals)))
+        for num, deal in enumerate(deals):
+            out_file.write(main.TABLEBASE_INDEX_ENTRY.pack(sum(1 << card for card in deal), data_start + num*size))
+        for num, table in enumerate(pool.imap(solve_deal, [(deal, max_students) for deal in deals])):
+            out_file.write(table)
+            table = np.frombuffer(table, dtype=np.uint8)
+            print(f"deal {num+1}/{len(deals)} {','.join(main.DECK[card].name for card in deals[num])}: "
+                  f"{np.count_nonzero(table % 2 == 1)} won, {np.count_nonzero((table > 0) & (table % 2 == 0))} lost, "
+                  f"longest {table.max()} plies, {time.time() - start_time:.1f} seconds", flush=True)
+    os.replace(out + ".tmp", out)
+
+def random_position(tablebase, rng):
+    '''Returns a random Board, not already won, covered by tablebase.'''
+    keys = list(tablebase.tables)
+    while True:
+        key = rng.choice(keys)
+        cards = [card for card in range(len(main.DECK)) if key >> card & 1]
+        rng.shuffle(cards)
+        num_students = rng.randint(0, min(tablebase.max_students, 8))
+        squares = [square_to_coords(square) for square in rng.sample(range(25), 2 + num_students)]
+        red_count = rng.randint(max(0, num_students - 4), min(4, num_students))
+        red, blue = squares[2:2+red_count], squares[2+red_count:]
+        positions = [squares[0]] + red + [None]*(4 - len(red)) + [squares[1]] + blue + [None]*(4 - len(blue))
+        board = main.Board(rng.randint(0, 1), positions, cards)
+        if not board.is_won(): return board
+
+def verify(path, count, seed=0, max_depth=9):
+    '''Checks count random tablebase entries against recursive_search, which is run without the tablebase.'''
+    tablebase = main.Tablebase(path)
+    main.TABLEBASE = None
+    rng = random.Random(seed)
+    checked = failures = 0
+    for num in range(count):
+        board = random_position(tablebase, rng)
+        plies = tablebase.probe(board)
+        if plies == 0:
+            # Drawn: neither side can force a win within max_depth
+            expected, depth = None, max_depth
+        elif plies > max_depth: continue
+        else: expected, depth = main.tablebase_score(board, plies), plies
+        score = main.recursive_search(board.copy(), depth, -1000, 1000)
+        checked += 1
+        if (expected is None and abs(score) == 1000) or (expected is not None and score != expected):
+            failures += 1
+            print(f"FAIL: {board.positions} {board.cards} turn {board.turn}: tablebase {plies}, search {score} at depth {depth}")
+        # Nor may the game be decided sooner: a win ends on the winner's ply, so the next shallower search is two plies less
+        elif expected is not None and plies > 1:
+            shallower = plies - 2 if plies % 2 == 1 else plies - 1
+            if main.recursive_search(board.copy(), shallower, -1000, 1000) == expected:
+                failures += 1
+                print(f"FAIL: {board.positions} {board.cards} turn {board.turn}: decided in fewer than {plies} plies")
+    print(f"Checked {checked} positions against search, {failures} failures")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama endgame tablebase")
+    parser.add_argument("mode", choices=("generate", "verify"))
+    parser.add_argument("--students", type=int, default=1, help="students on the board, both sides together")
+    parser.add_argument("--deals", nargs="+", default=["all"], help="all, a number of random deals, or deals as five card names")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--positions", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=main.TABLEBASE_PATH)
+    args = parser.parse_args()
+
+    if args.mode == "verify":
+        verify(args.out, args.positions, args.seed)
+    else:
+        all_deals = list(itertools.combinations(range(len(main.DECK)), 5))
+        if args.deals == ["all"]: deals = all_deals
+        elif len(args.deals) == 1 and args.deals[0].isdigit(): deals = random.Random(args.seed).sample(all_deals, int(args.deals[0]))
+        else:
+            names = [card.name for card in main.DECK]
+            deals = [tuple(sorted(names.index(name) for name in deal.split(","))) for deal in args.deals]
+        generate(deals, args.students, args.workers, args.out)
@@ -0,0 +1,121 @@
+'''
+Headless self-play tournament for Onitama bots.
+
+Plays every pair of the given bots against each other in worker processes. Each card deal is
+seeded and played twice with colours swapped. Results stream to a JSONL file, one line per game,
+and a summary of win/draw rates with Elo estimates and 95% confidence intervals is printed at the end.
+
+Bots:
+    random          - request_random_bot_move
+    shortsighted    - request_shortsighted_bot_move
+    search:dN       - request_simple_search_bot_move to depth N
+    search:tN       - request_simple_search_bot_move with N milliseconds per move
+    mcts:nN         - request_mcts_bot_move with N playouts per move, keeping its tree across moves
+    mcts:tN         - request_mcts_bot_move with N milliseconds per move, keeping its tree across moves
+
+Usage: python tournament.py BOT BOT [BOT ...] [--games N] [--workers N] [--seed N] [--out FILE]
+'''
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import main
+
+# Games longer than this many plies are scored as draws
+MAX_PLIES = 200
+
+def bot_move(bot, board, tt):
+    '''Returns the move bot plays on board. tt is the bot's transposition table, or its MCTSTree for an mcts bot.'''
+    if bot == "random": return main.request_random_bot_move(board)
+    if bot == "shortsighted": return main.request_shortsighted_bot_move(board)
+    engine, limit = bot.split(":")
+    if engine == "search":
+        if limit[0] == "d": return main.request_simple_search_bot_move(board, tt, depth=int(limit[1:]))[0]
+        return main.request_simple_search_bot_move(board, tt, time_limit=int(limit[1:]))[0]
+    if engine == "mcts":
+        if limit[0] == "n": return main.request_mcts_bot_move(board, tt, iterations=int(limit[1:]))[0]
+        return main.request_mcts_bot_move(board, tt, time_limit=int(limit[1:]))[0]
+    raise ValueError(f"Unknown bot {bot}")
+
+def play_game(task):
+    '''Plays one game described by a task dictionary, returns its result dictionary.'''
+    random.seed(task["seed"])
+    board = main.Board(task["first"], list(main.INITIAL_POSITIONS), list(task["deal"]))
+    bots = (task["red"], task["blue"])
+    tts = [main.MCTSTree(board) if bot.startswith("mcts") else main.TranspositionTable() for bot in bots]
+    start_time = time.time()
+
+    victory_type = None
+    while board.turn - task["first"] < MAX_PLIES:
+        victory_type = board.is_won()
+        if victory_type: break
+        side = board.turn_colour_num()
+        board.execute_move(bot_move(bots[side], board, tts[side]))
+    else:
+        victory_type = board.is_won()
+
+    return dict(task, winner=victory_type[0] if victory_type else None, win_type=victory_type[1] if victory_type else "MOVE LIMIT",
+                plies=board.turn - task["first"], seconds=round(time.time() - start_time, 3))
+
+def tournament_tasks(bots, games, seed):
+    '''Yields a task per game: every pair of bots plays games/2 seeded deals, each with both colour assignments.'''
+    rng = random.Random(seed)
+    game = 0
+    for bot_a, bot_b in itertools.combinations(bots, 2):
+        for pair in range((games + 1) // 2):
+            deal = rng.sample(range(len(main.DECK)), 5)
+            first = rng.randint(0, 1)
+            for red, blue in ((bot_a, bot_b), (bot_b, bot_a)):
+                yield {"game": game, "deal": deal, "first": first, "red": red, "blue": blue, "seed": rng.getrandbits(32)}
+                game += 1
+
+def elo(score):
+    '''Elo difference corresponding to an expected score, infinite at 0 and 1.'''
+    if score <= 0: return -math.inf
+    if score >= 1: return math.inf
+    return -400*math.log10(1/score - 1)
+
+def match_summary(bot_a, bot_b, results):
+    '''Returns a summary line for bot_a against bot_b, with a Wilson 95% confidence interval on the score.'''
+    outcomes = []
+    for result in results:
+        if result["winner"] is None: outcomes.append(0.5)
+        else: outcomes.append(1.0 if result["red" if result["winner"] == "RED" else "blue"] == bot_a else 0.0)
+    n = len(outcomes)
+    wins, draws = outcomes.count(1.0), outcomes.count(0.5)
+    score = sum(outcomes) / n
+    z = 1.96
+    centre = (score + z*z/(2*n)) / (1 + z*z/n)
+    error = z*math.sqrt(score*(1 - score)/n + z*z/(4*n*n)) / (1 + z*z/n)
+    return (f"{bot_a} vs {bot_b}: {wins} W {draws} D {n - wins - draws} L of {n}, score {score:.1%}, "
+            f"Elo {elo(score):+.0f} [{elo(centre - error):+.0f}, {elo(centre + error):+.0f}]")
+
+def run_tournament(bots, games, workers, seed, out):
+    results = []
+    start_time = time.time()
+    with Pool(workers) as pool, open(out, "w") as out_file:
+        for result in pool.imap_unordered(play_game, tournament_tasks(bots, games, seed)):
+            out_file.write(json.dumps(result) + "\n")
+            out_file.flush()
+            results.append(result)
+            if len(results) % 10 == 0: print(f"games played: {len(results)}", flush=True)
+    print(f"\n{len(results)} games in {time.time() - start_time:.1f} seconds, results in {out}\n")
+
+    for bot_a, bot_b in itertools.combinations(bots, 2):
+        print(match_summary(bot_a, bot_b, [result for result in results if {result["red"], result["blue"]} == {bot_a, bot_b}]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama self-play tournament")
+    parser.add_argument("bots", nargs="+", help="random, shortsighted, search:dN, search:tN, mcts:nN or mcts:tN")
+    parser.add_argument("--games", type=int, default=100, help="games per pair of bots")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="tournament.jsonl")
+    args = parser.parse_args()
+    if len(set(args.bots)) < 2: parser.error("at least two different bots are needed")
+    run_tournament(args.bots, args.games, args.workers, args.seed, args.out)
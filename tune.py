@@ -0,0 +1,203 @@
+'''
+Texel-style tuning of the Onitama evaluation tables.
+
+Board.evaluate_position is linear in its tables, so for positions that are not won it equals X.w, where w
+holds every entry of CENTER_PRIORITY, STUDENT_VALUE and the three *_MASTER_POSITIONAL_VALUE tables and X is a
+sparse feature matrix: per position, each student's square counts +1 for RED and -1 for BLUE, the student
+count difference multiplies STUDENT_VALUE, and each master selects one entry of its game stage's table.
+
+Features are built with NumPy directly from the packed positions of a dataset written by dataset.py. The
+weights are then fitted by full-batch gradient descent with Adam, minimising the mean squared error between
+sigmoid(K*X.w) and the game results (1 RED won, 0.5 draw, 0 BLUE won). K is first fitted to the current
+tables and then held fixed, so the tuned weights stay on the engine's centipawn-like scale. A small L2 pull
+towards the current tables keeps STUDENT_VALUE and CENTER_PRIORITY, which can trade off against each other,
+from drifting. Search takes a score of 1000 for a won position, so if the tuned tables can score a position
+that high, the change from the current tables is scaled back until they cannot. Each gradient is averaged with
+its mirror image, so that tables that start left-right symmetric stay so and positions keep the value of their
+mirror images (see main.eval_tables_mirror_symmetric).
+
+The tuned tables are written as JSON, which main.py loads in place of its own at startup when the file is
+at main.EVAL_WEIGHTS_PATH.
+
+Usage: python tune.py [--dir DIR] [--positions N] [--iterations N] [--learning-rate R] [--l2 R] [--seed N] [--out FILE]
+'''
+import argparse
+import json
+import time
+
+import numpy as np
+
+import main
+from dataset import GameDataset
+from notation import unpack_board
+
+SQUARES = [main.square_to_coords(square) for square in range(25)]
+STAGE_TABLES = ("OPENING_MASTER_POSITIONAL_VALUE", "MIDGAME_MASTER_POSITIONAL_VALUE", "ENDGAME_MASTER_POSITIONAL_VALUE")
+
+# Layout of the weight vector: CENTER_PRIORITY by square, STUDENT_VALUE, then each stage's master table by square
+CENTRE, STUDENT, MASTERS = 0, 25, 26
+NUM_WEIGHTS = MASTERS + 3*25
+
+# Index of the weight each weight is swapped with by reflecting the board left to right
+MIRROR_WEIGHT = np.array([main.MIRROR_SQUARE[square] for square in range(25)] + [STUDENT]
+                         + [MASTERS + 25*stage + main.MIRROR_SQUARE[square] for stage in range(3) for square in range(25)])
+
+def tables_to_weights(tables):
+    '''Returns the weight vector of a dictionary of tables keyed by main.py's names.'''
+    weights = [tables["CENTER_PRIORITY"][x][y] for x, y in SQUARES] + [tables["STUDENT_VALUE"]]
+    for name in STAGE_TABLES: weights += [tables[name][x][y] for x, y in SQUARES]
+    return np.array(weights, dtype=np.float64)
+
+def current_weights():
+    '''Returns the weight vector of the tables main.py evaluates with.'''
+    return tables_to_weights({name: getattr(main, name) for name in main.EVAL_TABLE_NAMES})
+
+def weights_to_tables(weights):
+    '''Returns the tables of a weight vector, rounded to integers, as a dictionary of main.py's names.'''
+    weights = np.rint(weights).astype(int).tolist()
+    def table(start): return [[weights[start + main.coords_to_square((x, y))] for y in range(5)] for x in range(5)]
+    tables = {"CENTER_PRIORITY": table(CENTRE), "STUDENT_VALUE": weights[STUDENT]}
+    for stage, name in enumerate(STAGE_TABLES): tables[name] = table(MASTERS + 25*stage)
+    return tables
+
+def features(positions):
+    '''
+    Returns the features of an array of positions packed by notation.pack_board: an int8 array of student signs per
+    square (+1 RED, -1 BLUE), and the indices into the weight vector of the RED and BLUE master table entries.
+    The BLUE master's entry is subtracted, and is the one for its square seen from BLUE's side.
+    '''
+    positions = np.asarray(positions, dtype=np.uint64)
+    occupancy = (positions[:, None] >> np.arange(25, dtype=np.uint64)) & np.uint64(1)
+    rank = np.cumsum(occupancy, axis=1) - occupancy # Position of each student among the occupied squares
+    blue = ((positions[:, None] >> (np.uint64(25) + rank)) & np.uint64(1)) * occupancy
+    students = (occupancy.astype(np.int8) - 2*blue.astype(np.int8))
+
+    red_count = (students == 1).sum(axis=1)
+    blue_count = (students == -1).sum(axis=1)
+    min_students = np.minimum(red_count, blue_count)
+    stage = np.where(min_students >= 4, 0, np.where(min_students >= 2, 1, 2))
+
+    red_master = (positions >> np.uint64(33) & np.uint64(31)).astype(np.int64)
+    blue_master = (positions >> np.uint64(38) & np.uint64(31)).astype(np.int64)
+    return students, MASTERS + 25*stage + red_master, MASTERS + 25*stage + (24 - blue_master)
+
+def evaluate(weights, students, red_index, blue_index):
+    '''Returns X.w for the features of a batch of positions.'''
+    return (students @ weights[CENTRE:STUDENT] + students.sum(axis=1, dtype=np.int64)*weights[STUDENT]
+            + weights[red_index] - weights[blue_index])
+
+def gradient(weights, students, red_index, blue_index, coefficients):
+    '''Returns X^T.coefficients, the gradient of sum(coefficients * X.w) over the weights.'''
+    grad = np.zeros(NUM_WEIGHTS)
+    grad[CENTRE:STUDENT] = coefficients @ students
+    grad[STUDENT] = coefficients @ students.sum(axis=1, dtype=np.int64)
+    grad += np.bincount(red_index, coefficients, NUM_WEIGHTS) - np.bincount(blue_index, coefficients, NUM_WEIGHTS)
+    return grad
+
+def sigmoid(values):
+    return 1 / (1 + np.exp(-values))
+
+def error(evaluations, targets, scale):
+    return float(np.mean((sigmoid(scale*evaluations) - targets)**2))
+
+def fit_scale(evaluations, targets):
+    '''Returns the K minimising the error of the current evaluations, by golden-section search on a log scale.'''
+    low, high = np.log(1e-4), np.log(1.0)
+    ratio = (np.sqrt(5) - 1) / 2
+    for step in range(60):
+        a, b = high - ratio*(high - low), low + ratio*(high - low)
+        if error(evaluations, targets, np.exp(a)) < error(evaluations, targets, np.exp(b)): high = b
+        else: low = a
+    return float(np.exp((low + high) / 2))
+
+def shrink_to_bound(initial, weights, limit=1000):
+    '''
+    Returns weights and the fraction of their change from initial that is kept, scaled back by bisection until
+    their tables score below limit. The bound is convex in the fraction, and initial's tables are below it.
+    '''
+    def bound(fraction): return main.eval_weights_bound(weights_to_tables(initial + fraction*(weights - initial)))
+    if bound(1.0) < limit: return weights, 1.0
+    low, high = 0.0, 1.0
+    for step in range(30):
+        middle = (low + high) / 2
+        if bound(middle) < limit: low = middle
+        else: high = middle
+    return initial + low*(weights - initial), low
+
+def load_positions(directory, limit, seed):
+    '''Returns the packed positions and targets of a dataset, a seeded sample of limit of them if given, read in batches.'''
+    dataset = GameDataset(directory)
+    count = len(dataset) if limit is None else min(limit, len(dataset))
+    positions = np.empty(count, dtype=np.uint64)
+    targets = np.empty(count)
+    filled = 0
+    for records in dataset.minibatches(1 << 20, seed):
+        records = records[:count - filled]
+        positions[filled:filled + len(records)] = records["position"]
+        targets[filled:filled + len(records)] = (records["result"] + 1) / 2
+        filled += len(records)
+        if filled == count: break
+    return positions, targets
+
+def check_features(positions, students, red_index, blue_index, samples=1000):
+    '''Returns the number of sampled positions where X.w with the current tables differs from Board.evaluate_position_full.'''
+    sample = slice(0, min(samples, len(positions)))
+    evaluations = evaluate(current_weights(), students[sample], red_index[sample], blue_index[sample])
+    boards = [unpack_board(int(position)) for position in positions[sample]]
+    return sum(board.evaluate_position_full() != evaluation for board, evaluation in zip(boards, evaluations))
+
+def tune(positions, targets, iterations, learning_rate, l2):
+    # Won positions score +-1000 whatever the tables
+    red_master, blue_master = positions >> np.uint64(33) & np.uint64(31), positions >> np.uint64(38) & np.uint64(31)
+    playing = (red_master != 25) & (blue_master != 25) & (red_master != main.RED_TEMPLE_SQUARE) & (blue_master != main.BLUE_TEMPLE_SQUARE)
+    positions, targets = positions[playing], targets[playing]
+
+    students, red_index, blue_index = features(positions)
+    mismatches = check_features(positions, students, red_index, blue_index)
+    if mismatches: raise AssertionError(f"features disagree with evaluate_position_full on {mismatches} positions")
+
+    initial = current_weights()
+    weights = initial.copy()
+    scale = fit_scale(evaluate(weights, students, red_index, blue_index), targets)
+    print(f"{len(positions)} positions, K = {scale:.5f}, initial error {error(evaluate(weights, students, red_index, blue_index), targets, scale):.6f}")
+
+    # Adam
+    first, second = np.zeros(NUM_WEIGHTS), np.zeros(NUM_WEIGHTS)
+    beta1, beta2 = 0.9, 0.999
+    start_time = time.time()
+    for step in range(1, iterations + 1):
+        probability = sigmoid(scale*evaluate(weights, students, red_index, blue_index))
+        coefficients = 2*(probability - targets)*probability*(1 - probability)*scale / len(positions)
+        grad = gradient(weights, students, red_index, blue_index, coefficients) + 2*l2*(weights - initial)
+        grad = (grad + grad[MIRROR_WEIGHT]) / 2
+        first = beta1*first + (1 - beta1)*grad
+        second = beta2*second + (1 - beta2)*grad*grad
+        weights -= learning_rate * (first / (1 - beta1**step)) / (np.sqrt(second / (1 - beta2**step)) + 1e-12)
+        if step % 100 == 0 or step == iterations:
+            print(f"iteration {step}: error {error(evaluate(weights, students, red_index, blue_index), targets, scale):.6f}, "
+                  f"{step/(time.time() - start_time):.1f} iterations per second", flush=True)
+
+    weights, kept = shrink_to_bound(initial, weights)
+    if kept < 1: print(f"tuned tables could score a position as won, kept {kept:.1%} of the change from the current tables")
+    tables = weights_to_tables(weights)
+    print(f"tuned error {error(evaluate(tables_to_weights(tables), students, red_index, blue_index), targets, scale):.6f} with integer weights")
+    return tables
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onitama evaluation tuning")
+    parser.add_argument("--dir", default="dataset", help="dataset directory written by dataset.py")
+    parser.add_argument("--positions", type=int, default=None, help="tune on a seeded sample of this many positions")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-5, help="pull of each weight towards its current value")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=main.EVAL_WEIGHTS_PATH)
+    args = parser.parse_args()
+
+    positions, targets = load_positions(args.dir, args.positions, args.seed)
+    if not len(positions): parser.error(f"no positions in {args.dir}")
+    tables = tune(positions, targets, args.iterations, args.learning_rate, args.l2)
+    bound = main.eval_weights_bound(tables)
+    if bound >= 1000: raise SystemExit(f"tuned tables can score {bound}, which search would take for a won position; raise --l2")
+    with open(args.out, "w") as out_file: json.dump(tables, out_file, indent=1)
+    print(f"tables written to {args.out}, loaded by main.py at startup")